@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+    Layout micro-benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures how long laying out a random concept map takes from
+    scratch (as for a new map) and warm-started from its previous
+    layout after a few nodes have been added (as for a changed map).
+
+    Then, for a random wiki of each size (with LAYOUT_MAPS set), how
+    long rebuilding the pages cache and its maps takes, how long
+    finishing (laying out and clustering) the maps it wrote takes
+    afterwards, and the same again after a single link has been added
+    to one page.
+
+    Usage (with mindMapper installed, or from the repository root with
+    PYTHONPATH=.): python benchmarks/layoutBench.py [numNodes ...]
+"""
+
+import os
+import random
+import sys
+from tempfile import TemporaryDirectory
+import time
+
+from mindMapper.layout import layoutGraph
+from mindMapper.wiki import Wiki
+
+def randomGraph(numNodes, linksPerNode=3, seed=1) :
+  rand = random.Random(seed)
+  nodeIds = [ f"/page-{aNumber}" for aNumber in range(numNodes) ]
+  links = [
+    (rand.choice(nodeIds), rand.choice(nodeIds))
+    for _ in range(numNodes * linksPerNode)
+  ]
+  return nodeIds, links
+
+def timeLayout(numNodes) :
+  nodeIds, links = randomGraph(numNodes)
+  start = time.perf_counter()
+  positions = layoutGraph(nodeIds, links)
+  cold = time.perf_counter() - start
+
+  newIds = [ f"/new-{aNumber}" for aNumber in range(10) ]
+  newLinks = [ (aNewId, nodeIds[i]) for i, aNewId in enumerate(newIds) ]
+  start = time.perf_counter()
+  layoutGraph(nodeIds + newIds, links + newLinks, positions)
+  warm = time.perf_counter() - start
+  print(f"{numNodes:>6} nodes: cold {cold:7.2f} s, warm {warm:7.2f} s")
+
+def writePage(root, aNumber, links) :
+  with open(os.path.join(root, f"page-{aNumber}.md"), 'w', encoding='utf-8') as aFile :
+    aFile.write(
+      f"title: Page {aNumber}\ntags: group-{aNumber % 20}\n\n" +
+      ' '.join(f"[[page-{aLink}]]" for aLink in links) + "\n"
+    )
+
+def timeWiki(numPages, linksPerPage=3, seed=1) :
+  rand = random.Random(seed)
+  with TemporaryDirectory() as tmpDir :
+    root = os.path.join(tmpDir, 'content')
+    os.makedirs(root)
+    configPath = os.path.join(tmpDir, 'config.toml')
+    with open(configPath, 'w', encoding='utf-8') as configFile :
+      configFile.write("LAYOUT_MAPS = true\n")
+    links = {
+      aNumber : [ rand.randrange(numPages) for _ in range(linksPerPage) ]
+      for aNumber in range(numPages)
+    }
+    for aNumber, someLinks in links.items() : writePage(root, aNumber, someLinks)
+    wiki = Wiki(root, configPath, os.path.join(tmpDir, 'pages.cache'), jobs=1)
+
+    def timed(update) :
+      start = time.perf_counter()
+      report = update()
+      updated = time.perf_counter() - start
+      start = time.perf_counter()
+      wiki.finishMaps(report)
+      return updated, time.perf_counter() - start
+
+    rebuild, finish = timed(wiki.rebuildPagesCache)
+    links[0].append(1)
+    writePage(root, 0, links[0])
+    edit, editFinish = timed(lambda : wiki.syncPagesCache(['page-0']))
+    print(
+      f"{numPages:>6} pages: rebuild {rebuild:7.2f} s (then finish {finish:7.2f} s), "
+      f"one link {edit:7.2f} s (then finish {editFinish:7.2f} s)"
+    )
+
+def main(sizes) :
+  for numNodes in sizes : timeLayout(numNodes)
+  for numPages in sizes : timeWiki(numPages)
+
+if __name__ == '__main__' :
+  main([ int(anArg) for anArg in sys.argv[1:] ] or [500, 1000, 3000])
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+    Memory micro-benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the memory held per page by the web app's in-memory pages
+    index (the lazily loaded pages of the memory-mapped pages cache),
+    by its tag and backlinks indexes (which are only loaded when they
+    are used), and by the pages loaded (scanned) while building the
+    pages cache.
+
+    Usage (with mindMapper installed, or from the repository root with
+    PYTHONPATH=.): python benchmarks/memoryBench.py [numPages]
+"""
+
+import gc
+import os
+import sys
+from tempfile import TemporaryDirectory
+import tracemalloc
+
+from mindMapper.cacheStore import PagesStore
+from mindMapper.cacheStore import writeStore
+from mindMapper.index import BacklinkIndex
+from mindMapper.index import PagesIndex
+from mindMapper.index import TagIndex
+from mindMapper.page import Page
+
+def pageContent(aNumber, numPages) :
+  links = ' '.join(
+    f"[[page-{(aNumber * 7 + aLink) % numPages}]]" for aLink in range(5)
+  )
+  return (
+    f"title: Page number {aNumber}\n"
+    f"tags: bench, group-{aNumber % 50}\n\n"
+    f"Some text about page {aNumber}, which links to {links}.\n"
+  )
+
+def measure(build) :
+  """
+  :returns: the result of `build` and the number of bytes it holds
+  """
+  gc.collect()
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  result = build()
+  gc.collect()
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return result, after - before
+
+def main(numPages=20000) :
+  with TemporaryDirectory() as tmpDir :
+    paths = {}
+    for aNumber in range(numPages) :
+      url = f"page-{aNumber}"
+      paths[url] = os.path.join(tmpDir, url + '.md')
+      with open(paths[url], 'w', encoding='utf-8') as aFile :
+        aFile.write(pageContent(aNumber, numPages))
+
+    pages, pagesBytes = measure(lambda : [
+      Page(path, url, metaOnly=True) for url, path in paths.items()
+    ])
+    print(f" scanned pages: {pagesBytes / numPages:8.1f} bytes/page")
+
+    tags = TagIndex()
+    backlinks = BacklinkIndex()
+    for aPage in pages :
+      tags.addPage(aPage)
+      backlinks.addPage(aPage)
+    storePath = os.path.join(tmpDir, 'store')
+    with open(storePath, 'wb') as storeFile :
+      writeStore(storeFile, pages, { 'tags' : tags, 'backlinks' : backlinks }, 1)
+    del pages, tags, backlinks
+    store = PagesStore(storePath, 1)
+    index, indexBytes = measure(lambda : PagesIndex(
+      store.pages(), None,
+      lambda : store.section('tags'), lambda : store.section('backlinks')
+    ))
+    print(f"   pages index: {indexBytes / numPages:8.1f} bytes/page"
+      f" ({indexBytes / numPages * 1e5 / 2**20:.1f} MB for 100000 pages)")
+    for aSection in ('tags', 'backlinks') :
+      _, sectionBytes = measure(lambda : index.section(aSection))
+      print(f"{aSection:>14}: {sectionBytes / numPages:8.1f} bytes/page")
+
+if __name__ == '__main__' :
+  main(*[ int(anArg) for anArg in sys.argv[1:] ])
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+    Render micro-benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the per-page cost of rendering a small page with a freshly
+    built markdown converter (the old behaviour of `Processor`) against
+    rendering it with a converter taken from the per-thread pool, and
+    against only scanning its meta data and links (as is done when
+    building the pages cache).
+
+    Usage (with mindMapper installed, or from the repository root with
+    PYTHONPATH=.): python benchmarks/renderBench.py [numPages]
+"""
+
+import sys
+import timeit
+
+import mindMapper.processor
+from mindMapper.processor import Processor
+
+PAGE_CONTENT = u"""\
+title: A small page
+tags: bench, small
+
+Some *text* with a little `code`:
+
+```python
+def hello(name):
+  return f"hello {name}"
+```
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+and some math $x^2$.
+"""
+
+class BenchPage :
+  def addLink(self, aBaseUrl, aTitle, aModifier) :
+    pass
+
+def renderFresh() :
+  processor = Processor(PAGE_CONTENT, BenchPage())
+  # throw away the pooled converter and use a brand new one instead
+  processor.md = mindMapper.processor.newConverter()
+  processor.process()
+
+def renderPooled() :
+  Processor(PAGE_CONTENT, BenchPage()).process()
+
+def scanOnly() :
+  Processor(PAGE_CONTENT, BenchPage()).scan()
+
+def main(numPages=2000) :
+  renderPooled() # warm up (imports, pygments lexers, ...)
+  for aName, aFunc in (
+    ('fresh', renderFresh), ('pooled', renderPooled), ('scanned', scanOnly)
+  ) :
+    seconds = min(timeit.repeat(aFunc, number=numPages, repeat=3))
+    print(f"{aName:>8}: {seconds * 1e6 / numPages:8.1f} us/page")
+
+if __name__ == '__main__' :
+  main(*[ int(anArg) for anArg in sys.argv[1:] ])
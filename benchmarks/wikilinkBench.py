@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+    Wikilink micro-benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the single pass wikilink post-processor with the previous
+    implementation (which re-scanned the whole html once per link) on
+    pages with an increasing number of links, and checks that both
+    produce the same html and the same links.
+
+    Usage (with mindMapper installed, or from the repository root with
+    PYTHONPATH=.): python benchmarks/wikilinkBench.py
+"""
+
+import re
+import time
+
+from mindMapper.processor import wikilink
+from mindMapper.utils import clean_url
+
+class BenchPage :
+  def __init__(self) :
+    self.links = []
+
+  def addLink(self, aBaseUrl, aTitle, aModifier) :
+    self.links.append((aBaseUrl, aTitle, aModifier))
+
+def urlFormatter(endpoint, url) :
+  return u"/{}/".format(url)
+
+def rescanningWikilink(text, page, url_formatter) :
+  # the previous implementation, kept here for comparison
+  link_regex = re.compile(
+    r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
+    re.X | re.U
+  )
+  for i in link_regex.findall(text):
+    baseUrl = i[1]
+    if 0 < baseUrl.find('{') :
+      baseUrl, modifier = baseUrl.split('{')
+    title = [i[-1] if i[-1] else i[1]][0]
+    modifier = 'link'
+    if 0 < title.find('{') :
+      title, modifier = title.split('{')
+      modifier = modifier.removesuffix('}')
+    url = clean_url(baseUrl)
+    html_url = u"<a href='{0}' title='{1}'>{2}</a>".format(
+      url_formatter('mindMapper.display', url=url),
+      modifier,
+      title
+    )
+    text = re.sub(link_regex, html_url, text, count=1)
+    page.addLink(baseUrl, title, modifier)
+  return text
+
+def makeHtml(numLinks) :
+  parts = []
+  for aLink in range(numLinks) :
+    if aLink % 3 == 0   : parts.append(f"<p>see [[page-{aLink}]] and")
+    elif aLink % 3 == 1 : parts.append(f"[[dir/page-{aLink}|Page {aLink}{{uses}}]]")
+    else                : parts.append(f"[[page {aLink}|Page {aLink}]] then.</p>")
+  return "\n".join(parts)
+
+def timeIt(aFunc, html) :
+  page = BenchPage()
+  start = time.perf_counter()
+  result = aFunc(html, page, urlFormatter)
+  return time.perf_counter() - start, result, page.links
+
+def main() :
+  print(f"{'links':>6} {'rescanning':>12} {'single pass':>12}  (us/link)")
+  for numLinks in (250, 500, 1000, 2000, 4000) :
+    html = makeHtml(numLinks)
+    oldTime, oldHtml, oldLinks = timeIt(rescanningWikilink, html)
+    newTime, newHtml, newLinks = timeIt(wikilink, html)
+    assert oldHtml == newHtml and oldLinks == newLinks
+    print(
+      f"{numLinks:>6} {oldTime * 1e6 / numLinks:>12.1f} {newTime * 1e6 / numLinks:>12.1f}"
+    )
+
+if __name__ == '__main__' :
+  main()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+    Pages cache store
+    ~~~~~~~~~~~~~~~~~
+
+    The pages cache is a single file made up of:
+
+    - a header,
+    - a fixed width record per page (url, title, tags, links and the
+      offsets of its blobs),
+    - a fixed width record per link,
+    - a pool of (utf-8, de-duplicated) strings,
+    - the bulk blobs (body and meta data) of every page,
+    - the separately pickled sections of the cache state (manifest,
+      link maps, search index, ...), followed by a table of where
+      each section is.
+
+    The file is memory-mapped, so listing the titles or tags of every
+    page only touches the (small) record table and string pool, while
+    the body of a page is only read when somebody asks for it. (The
+    html of the pages is not cached; it is only rendered when a page
+    is displayed.) Several processes reading the same cache share its pages
+    through the OS page cache.
+"""
+
+from collections import OrderedDict
+import json
+import mmap
+import pickle
+import struct
+
+MAGIC = b'MMCACHE\x00'
+
+# magic, format version, page count, links offset, pool offset,
+# section table offset, section table length
+HEADER = struct.Struct('<8sIIQQQQ')
+
+# url, title, tags (pool offset/length), links (first/count),
+# body, meta (file offset/length)
+RECORD = struct.Struct('<IIIIIIIIQIQI')
+
+# target, title, modifier (pool offset/length)
+LINK = struct.Struct('<IIIIII')
+
+class InvalidCacheException(Exception):
+  """
+  This exception is raised when a pages cache file can not be read
+  (or was written by an incompatible version).
+  """
+  pass
+
+def writeStore(aFile, pages, state, version):
+  """
+  Write the pages cache to an (open, binary, seekable) file.
+
+  :param file aFile: the file to write to
+  :param list pages: the pages (anything with url, title, tags,
+                     linkTuples, body and meta attributes)
+  :param dict state: the remaining cache state, each item of which is
+                     pickled as a separate section
+  :param int version: the cache format version
+  """
+  pages = list(pages)
+  pool = bytearray()
+  poolIndex = {}
+  def intern(aString):
+    if aString not in poolIndex:
+      encoded = aString.encode('utf-8')
+      poolIndex[aString] = (len(pool), len(encoded))
+      pool.extend(encoded)
+    return poolIndex[aString]
+
+  # first pass: the strings and links of every page
+  #
+  strings = []
+  links = bytearray()
+  numLinks = 0
+  for aPage in pages:
+    firstLink = numLinks
+    for aTarget, aTitle, aModifier in aPage.linkTuples:
+      links.extend(LINK.pack(
+        *intern(aTarget), *intern(aTitle), *intern(aModifier)
+      ))
+      numLinks += 1
+    strings.append((
+      intern(aPage.url), intern(aPage.title), intern(aPage.tags),
+      firstLink, numLinks - firstLink
+    ))
+
+  linksOffset = HEADER.size + RECORD.size * len(pages)
+  poolOffset  = linksOffset + len(links)
+  blobsOffset = poolOffset + len(pool)
+
+  # second pass: stream the blobs of every page
+  #
+  aFile.seek(blobsOffset)
+  offset = blobsOffset
+  records = bytearray()
+  for aPage, (url, title, tags, firstLink, numLinks) in zip(pages, strings):
+    blobs = []
+    for aBlob in (
+      aPage.body or '',
+      json.dumps(list(aPage.meta.items()))
+    ):
+      encoded = aBlob.encode('utf-8')
+      aFile.write(encoded)
+      blobs.extend((offset, len(encoded)))
+      offset += len(encoded)
+    records.extend(RECORD.pack(*url, *title, *tags, firstLink, numLinks, *blobs))
+
+  sections = {}
+  for aName, aSection in state.items():
+    sectionBytes = pickle.dumps(aSection, protocol=pickle.HIGHEST_PROTOCOL)
+    aFile.write(sectionBytes)
+    sections[aName] = (offset, len(sectionBytes))
+    offset += len(sectionBytes)
+  tableBytes = pickle.dumps(sections)
+  aFile.write(tableBytes)
+
+  aFile.seek(0)
+  aFile.write(HEADER.pack(
+    MAGIC, version, len(pages), linksOffset, poolOffset, offset, len(tableBytes)
+  ))
+  aFile.write(records)
+  aFile.write(links)
+  aFile.write(pool)
+
+class PagesStore(object):
+  """
+  A read only, memory-mapped view of a pages cache file.
+  """
+
+  def __init__(self, path, version):
+    with open(path, 'rb') as aFile:
+      try:
+        self.mmap = mmap.mmap(aFile.fileno(), 0, access=mmap.ACCESS_READ)
+      except ValueError:
+        raise InvalidCacheException("Empty pages cache")
+    if self.mmap.size() < HEADER.size:
+      raise InvalidCacheException("Truncated pages cache")
+    (
+      magic, fileVersion, self.count, self.linksOffset, self.poolOffset,
+      tableOffset, tableLength
+    ) = HEADER.unpack_from(self.mmap, 0)
+    if magic != MAGIC:
+      raise InvalidCacheException("Not a pages cache")
+    if fileVersion != version:
+      raise InvalidCacheException("Incompatible pages cache version")
+    try:
+      self.sections = pickle.loads(self.mmap[tableOffset:tableOffset + tableLength])
+    except (pickle.UnpicklingError, EOFError):
+      raise InvalidCacheException("Corrupt pages cache")
+
+  def __len__(self):
+    return self.count
+
+  def record(self, index):
+    return RECORD.unpack_from(self.mmap, HEADER.size + RECORD.size * index)
+
+  def string(self, offset, length):
+    start = self.poolOffset + offset
+    return str(self.mmap[start:start + length], 'utf-8')
+
+  def blob(self, offset, length):
+    return str(self.mmap[offset:offset + length], 'utf-8')
+
+  def links(self, first, count):
+    links = []
+    for index in range(first, first + count):
+      (
+        targetOff, targetLen, titleOff, titleLen, modOff, modLen
+      ) = LINK.unpack_from(self.mmap, self.linksOffset + LINK.size * index)
+      links.append((
+        self.string(targetOff, targetLen),
+        self.string(titleOff, titleLen),
+        self.string(modOff, modLen)
+      ))
+    return links
+
+  def pages(self):
+    """
+    :returns: a lazily loaded page for every record, keyed by url
+    :rtype: dict
+    """
+    pages = {}
+    for index in range(self.count):
+      aPage = CachedPage(self, index)
+      pages[aPage.url] = aPage
+    return pages
+
+  def section(self, name):
+    """
+    Unpickle one section of the cache state.
+    """
+    start, length = self.sections[name]
+    return pickle.loads(self.mmap[start:start + length])
+
+  def state(self):
+    """
+    Unpickle every section of the cache state.
+
+    :rtype: dict
+    """
+    return { aName : self.section(aName) for aName in self.sections }
+
+class CachedPage(object):
+  """
+  A page as held in the pages cache.
+
+  Only the url is decoded (and kept) up front; everything else,
+  including the page's record, is read from the memory-mapped cache
+  file whenever it is used.
+  """
+
+  __slots__ = ('store', 'index', 'url')
+
+  def __init__(self, store, index):
+    self.store  = store
+    self.index  = index
+    record      = store.record(index)
+    self.url    = store.string(record[0], record[1])
+
+  def __repr__(self):
+    return u"<CachedPage: {}>".format(self.url)
+
+  @property
+  def record(self):
+    return self.store.record(self.index)
+
+  @property
+  def title(self):
+    record = self.record
+    return self.store.string(record[2], record[3])
+
+  @property
+  def tags(self):
+    record = self.record
+    return self.store.string(record[4], record[5])
+
+  @property
+  def linkTuples(self):
+    record = self.record
+    return self.store.links(record[6], record[7])
+
+  @property
+  def links(self):
+    return [ {
+      'source'   : self.url,
+      'target'   : aTarget,
+      'title'    : aTitle,
+      'modifier' : aModifier
+    } for aTarget, aTitle, aModifier in self.linkTuples ]
+
+  @property
+  def body(self):
+    record = self.record
+    return self.store.blob(record[8], record[9])
+
+  @property
+  def meta(self):
+    record = self.record
+    return OrderedDict(json.loads(self.store.blob(record[10], record[11])))
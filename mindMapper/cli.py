@@ -5,6 +5,7 @@ import operator
 import os
 import signal
 import sys
+import threading
 import time
 import yaml
 
@@ -12,7 +13,8 @@ import click
 
 from waitress import serve
 
-from mindMapper.web import create_app, current_wiki
+from mindMapper.web import create_app, current_wiki, current_rebuilder
+from mindMapper.watcher import applyChanges, newWatcher, watch as watchWiki
 
 @click.group()
 @click.option('--directory', type=click.Path(exists=True), default=None,
@@ -58,17 +60,52 @@ def main(ctx, directory, config, cache, host, port):
   ctx.meta['host']       = host
   ctx.meta['port']       = port
 
+jobsOption = click.option('--jobs', type=int, default=None,
+  help="the number of processes used to render pages, 0 for one per core. [default: JOBS in the config file, or 1]"
+)
+
+debounceOption = click.option('--debounce', type=float, default=0.5,
+  help="the number of quiet seconds to wait for after a burst of changes before updating the pages cache. [default: 0.5]"
+)
+
+def watchInBackground(app, debounce) :
+  """Keep the pages cache up to date with the wiki directory from a
+  (daemon) thread."""
+
+  def watchThread() :
+    with app.app_context() :
+      # changes are applied by the rebuilder, so they never overlap
+      # with rebuilds requested by the web app
+      rebuilder = current_rebuilder._get_current_object()
+      watchWiki(
+        newWatcher(current_wiki.root),
+        lambda touched : rebuilder.submit(touched),
+        debounce
+      )
+
+  watcherThread = threading.Thread(
+    target=watchThread, name='mindMapper-watcher', daemon=True
+  )
+  watcherThread.start()
+  return watcherThread
+
 @main.command()
 @click.option('--debug/--no-debug', envvar='WIKI_DEBUG', default=False,
   help="whether or not to run the web app in debug mode."
 )
+@click.option('--watch/--no-watch', default=False,
+  help="whether or not to watch the wiki directory for changes made outside of the web app."
+)
+@debounceOption
+@jobsOption
 @click.pass_context
-def web(ctx, debug):
+def web(ctx, debug, watch, debounce, jobs):
   """Run the web app."""
 
   app = create_app(ctx.meta)
   with app.app_context() :
     app.config['DEBUG'] = debug
+    if jobs is not None : app.config['JOBS'] = jobs
 
     # report our configuration if in debug mode
     if debug :
@@ -81,9 +118,10 @@ def web(ctx, debug):
         print(f"  {aField}")
       print("----------------------------------------------------------")
 
-    # ensure the pages cache has been removed and rebuilt for the first time
-    current_wiki.removePagesCache()
-    current_wiki.rebuildPagesCache()
+    # ensure the pages cache is up to date with the wiki directory
+    report = current_wiki.syncPagesCache()
+    current_rebuilder.finishMaps(current_wiki.unfinishedMaps(report))
+    if watch : watchInBackground(app, debounce)
 
     # start the web server
     if debug :
@@ -94,8 +132,6 @@ def web(ctx, debug):
       print("")
       serve(app.wsgi_app, host=app.config['HOST'], port=app.config['PORT'])
 
-    current_wiki.removePagesCache()
-
     print("")
 
 # adapted from https://dev.to/rhymes/flask-list-of-routes-4hph
@@ -116,12 +152,90 @@ def routes(ctx):
     print(route)
 
 @main.command()
+@click.option('--full/--incremental', default=False,
+  help="rebuild every page rather than only those which have changed."
+)
+@jobsOption
 @click.pass_context
-def buildCache(ctx) :
+def buildCache(ctx, full, jobs) :
   'Rebuild the pages cache'
   app = create_app(ctx.meta)
   with app.app_context() :
+    if jobs is not None : app.config['JOBS'] = jobs
     wiki = current_wiki
-    wiki.rebuildPagesCache()
+    if full : report = wiki.rebuildPagesCache()
+    else    : report = wiki.syncPagesCache()
+    wiki.finishMaps(report)
     #pages = wiki.loadPagesCache()
-    #print(yaml.dump(pages))
\ No newline at end of file
+    #print(yaml.dump(pages))
+
+@main.command()
+@debounceOption
+@jobsOption
+@click.pass_context
+def watch(ctx, debounce, jobs) :
+  'Keep the pages cache up to date with the wiki directory'
+  app = create_app(ctx.meta)
+  with app.app_context() :
+    if jobs is not None : app.config['JOBS'] = jobs
+    wiki = current_wiki._get_current_object()
+    wiki.finishMaps(wiki.syncPagesCache())
+    print(f" * Watching {wiki.root} (press Ctrl-C to stop)")
+    try :
+      watchWiki(
+        newWatcher(wiki.root),
+        lambda touched : applyChanges(wiki, touched),
+        debounce
+      )
+    except KeyboardInterrupt :
+      print("")
+
+@main.command()
+@click.argument('url')
+@click.pass_context
+def backlinks(ctx, url) :
+  'List the pages which link to URL'
+  app = create_app(ctx.meta)
+  with app.app_context() :
+    links = current_wiki.get_backlinks(url)
+    if not links :
+      print(f"No pages link to {url}")
+    for source, modifier in links :
+      print(f"{source.url} ({modifier}) {source.title}")
+
+@main.command()
+@click.argument('source')
+@click.argument('target')
+@click.option('--count', type=int, default=1,
+  help="the number of (shortest) paths to list."
+)
+@click.option('--modifier', 'modifiers', multiple=True,
+  help="only follow links with this modifier (may be repeated)."
+)
+@click.option('--tag', default=None,
+  help="only pass through pages with this tag."
+)
+@click.option('--directed/--undirected', default=False,
+  help="only follow links forwards, rather than either way."
+)
+@click.pass_context
+def path(ctx, source, target, count, modifiers, tag, directed) :
+  'List the shortest paths of links from SOURCE to TARGET'
+  app = create_app(ctx.meta)
+  with app.app_context() :
+    graph = current_wiki.get_paths(
+      source, target, count, list(modifiers) or None, tag, directed
+    )
+    if not graph['paths'] :
+      print(f"No paths from {source} to {target}")
+    modifiersOf = {}
+    for aLink in graph['links'] :
+      modifiersOf.setdefault((aLink['source'], aLink['target']), []).append(aLink['linkType'])
+    for aPath in graph['paths'] :
+      steps = [ aPath[0][1:] ]
+      for aNode, aNext in zip(aPath, aPath[1:]) :
+        forwards = modifiersOf.get((aNode, aNext))
+        if forwards : steps.append(f"-({','.join(forwards)})->")
+        else        : steps.append(f"<-({','.join(modifiersOf[(aNext, aNode)])})-")
+        steps.append(aNext[1:])
+      print(f"{len(aPath) - 1}: " + ' '.join(steps))
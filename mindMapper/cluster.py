@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+    Concept map clustering
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Large concept maps are clustered hierarchically (using the Louvain
+    community detection algorithm over their links) so that the browser
+    can start with a coarse map of the top level clusters and only
+    fetch the contents of a cluster when somebody expands it.
+
+    The clusters are stored in the map's graph itself: a 'clusters'
+    list (of id, parent, title, size, the id of the node, or hub,
+    with the most links, after which the cluster is titled and, for
+    the top level clusters, their position) and, on every node, the
+    id of the smallest cluster it is in. Nodes (and clusters) which are not
+    in any cluster are shown at the top level.
+"""
+
+ROOT = 'root'
+
+#: maps with fewer nodes than this are not clustered
+MIN_NODES = 500
+
+MAX_PASSES = 20
+
+def moveNodes(adjacency) :
+  """
+  The local moving phase of the Louvain algorithm: move every node to
+  the neighbouring community which most increases the modularity,
+  until no move improves it.
+
+  :param list adjacency: a dict of neighbour => weight for every node
+                         (self loops counting twice)
+
+  :returns: the (renumbered) community of every node
+  :rtype: list
+  """
+  numNodes = len(adjacency)
+  degrees = [ sum(neighbours.values()) for neighbours in adjacency ]
+  total = sum(degrees)
+  community = list(range(numNodes))
+  if not total : return community
+  totals = list(degrees)
+  for _ in range(MAX_PASSES) :
+    moved = False
+    for i, neighbours in enumerate(adjacency) :
+      current = community[i]
+      weights = {}
+      for j, weight in neighbours.items() :
+        if j != i : weights[community[j]] = weights.get(community[j], 0) + weight
+      totals[current] -= degrees[i]
+      best = current
+      bestGain = weights.get(current, 0) - totals[current] * degrees[i] / total
+      for aCommunity, weight in weights.items() :
+        gain = weight - totals[aCommunity] * degrees[i] / total
+        if bestGain < gain :
+          best = aCommunity
+          bestGain = gain
+      totals[best] += degrees[i]
+      if best != current :
+        community[i] = best
+        moved = True
+    if not moved : break
+  numbers = {}
+  return [ numbers.setdefault(aCommunity, len(numbers)) for aCommunity in community ]
+
+def aggregate(adjacency, community) :
+  """
+  :returns: the adjacency of the graph of the communities
+  :rtype: list
+  """
+  aggregated = [ {} for _ in range(max(community) + 1) ]
+  for i, neighbours in enumerate(adjacency) :
+    ci = aggregated[community[i]]
+    for j, weight in neighbours.items() :
+      cj = community[j]
+      ci[cj] = ci.get(cj, 0) + weight
+  return aggregated
+
+def louvain(numNodes, edges) :
+  """
+  Find the hierarchy of communities of an (undirected) graph.
+
+  :param list edges: the (i, j, weight) of every edge
+
+  :returns: the levels of the hierarchy, finest first, each mapping
+            the items of the level below (the nodes, for the first
+            level) to their community
+  :rtype: list
+  """
+  adjacency = [ {} for _ in range(numNodes) ]
+  for i, j, weight in edges :
+    if i == j :
+      adjacency[i][i] = adjacency[i].get(i, 0) + 2 * weight
+    else :
+      adjacency[i][j] = adjacency[i].get(j, 0) + weight
+      adjacency[j][i] = adjacency[j].get(i, 0) + weight
+  levels = []
+  while 1 < len(adjacency) :
+    community = moveNodes(adjacency)
+    if len(community) <= max(community) + 1 : break
+    levels.append(community)
+    adjacency = aggregate(adjacency, community)
+  return levels
+
+def clusterGraph(graph) :
+  """
+  Cluster the nodes of a map's graph (in place).
+  """
+  nodes = graph['nodes']
+  index = { aNode['id'] : i for i, aNode in enumerate(nodes) }
+  graph.pop('clusters', None)
+  degrees = [0] * len(nodes)
+  edges = []
+  for aLink in graph['links'] :
+    i = index.get(aLink['source'])
+    j = index.get(aLink['target'])
+    if i is None or j is None : continue
+    edges.append((i, j, 1))
+    degrees[i] += 1
+    degrees[j] += 1
+  levels = louvain(len(nodes), edges)
+
+  # the path of (level, community) clusters from the top down to
+  # every node
+  paths = []
+  for i in range(len(nodes)) :
+    path = []
+    item = i
+    for level, community in enumerate(levels) :
+      item = community[item]
+      path.append((level, item))
+    paths.append(path[::-1])
+  # unlinked nodes are collected in a cluster of their own
+  unlinked = [ i for i in range(len(nodes)) if not degrees[i] ]
+  if 1 < len(unlinked) :
+    for i in unlinked : paths[i] = [ ('unlinked', 0) ]
+
+  # drop the clusters which would hold just one thing, including any
+  # cluster holding everything
+  while True :
+    children = {}
+    for i, path in enumerate(paths) :
+      parent = ROOT
+      for aCluster in path :
+        children.setdefault(parent, set()).add(aCluster)
+        parent = aCluster
+      children.setdefault(parent, set()).add(i)
+    single = set(
+      aCluster for aCluster, members in children.items()
+      if aCluster != ROOT and len(members) < 2
+    )
+    if len(children[ROOT]) == 1 : single |= children[ROOT] - set(range(len(nodes)))
+    if not single : break
+    paths = [ [ c for c in path if c not in single ] for path in paths ]
+
+  ids = {}
+  clusters = []
+  for i in sorted(range(len(nodes)), key=lambda i : nodes[i]['id']) :
+    parent = None
+    for aCluster in paths[i] :
+      if aCluster not in ids :
+        ids[aCluster] = f"cluster-{len(ids)}"
+        clusters.append({ 'id' : ids[aCluster], 'parent' : parent, 'size' : 0, 'hub' : i })
+      parent = ids[aCluster]
+    if parent is None : nodes[i].pop('cluster', None)
+    else              : nodes[i]['cluster'] = parent
+
+  # the size of every cluster, and the node with the most links
+  byId = { aCluster['id'] : aCluster for aCluster in clusters }
+  for i, path in enumerate(paths) :
+    for aCluster in path :
+      aCluster = byId[ids[aCluster]]
+      aCluster['size'] += 1
+      if degrees[aCluster['hub']] < degrees[i] : aCluster['hub'] = i
+  unlinkedId = ids.get(('unlinked', 0))
+  for aCluster in clusters :
+    hub = nodes[aCluster.pop('hub')]
+    if aCluster['id'] == unlinkedId :
+      aCluster['title'] = "Unlinked pages"
+      aCluster['hub']   = None
+    else :
+      aCluster['title'] = hub['title']
+      aCluster['hub']   = hub['id']
+  graph['clusters'] = clusters
+
+class ClusterTree(object):
+  """
+  The clusters of a map's graph, from which the view of (the contents
+  of) any one cluster can be built.
+  """
+
+  def __init__(self, graph) :
+    self.graph = graph
+    self.clusters = { aCluster['id'] : aCluster for aCluster in graph.get('clusters', ()) }
+    self.nodes = { aNode['id'] : aNode for aNode in graph['nodes'] }
+    self.children = { ROOT : [] }
+    for anId, aCluster in self.clusters.items() :
+      self.children.setdefault(aCluster['parent'] or ROOT, []).append(anId)
+    for anId, aNode in self.nodes.items() :
+      self.children.setdefault(aNode.get('cluster') or ROOT, []).append(anId)
+
+    # the clusters from the top down to every node
+    self.paths = {}
+    for anId, aNode in self.nodes.items() :
+      path = [ anId ]
+      parent = aNode.get('cluster')
+      while parent :
+        path.append(parent)
+        parent = self.clusters[parent]['parent']
+      self.paths[anId] = path[::-1]
+
+    # place every cluster at the centre of its nodes
+    self.centres = {}
+    for anId, path in self.paths.items() :
+      aNode = self.nodes[anId]
+      if 'x' not in aNode : continue
+      for aCluster in path[:-1] :
+        x, y, count = self.centres.get(aCluster, (0, 0, 0))
+        self.centres[aCluster] = (x + aNode['x'], y + aNode['y'], count + 1)
+
+  def clusterNode(self, anId) :
+    aCluster = self.clusters[anId]
+    aNode = {
+      'id'       : anId,
+      'cluster'  : anId,
+      'title'    : f"{aCluster['title']} (+{aCluster['size'] - 1})",
+      'size'     : aCluster['size'],
+      'nodeType' : 'cluster',
+      'color'    : 'black'
+    }
+    if 'x' in aCluster :
+      aNode['x'] = aCluster['x']
+      aNode['y'] = aCluster['y']
+    elif anId in self.centres :
+      x, y, count = self.centres[anId]
+      aNode['x'] = round(x / count, 1)
+      aNode['y'] = round(y / count, 1)
+    return aNode
+
+  def view(self, clusterId) :
+    """
+    The contents of a cluster: its clusters and nodes, the links
+    between them (links between clusters are merged into one link,
+    weighted by the number of links it stands for) and the links to
+    the nodes outside the cluster. The outside end of each of the
+    latter is given as the path of clusters down to its node, so that
+    it can be attached to whichever of them is being shown.
+
+    :param str clusterId: the id of the cluster, or ROOT for the top
+                          level of the map
+
+    :returns: the view, or None if there is no such cluster
+    :rtype: dict
+    """
+    if clusterId != ROOT and clusterId not in self.clusters : return None
+    members = self.children.get(clusterId, [])
+    nodes = [
+      self.clusterNode(anId) if anId in self.clusters else self.nodes[anId]
+      for anId in members
+    ]
+
+    def member(anId) :
+      path = self.paths[anId]
+      if clusterId == ROOT : return path[0]
+      try :
+        return path[path.index(clusterId) + 1]
+      except ValueError :
+        return None
+
+    links = []
+    merged = {}
+    external = {}
+    for aLink in self.graph['links'] :
+      source = member(aLink['source'])
+      target = member(aLink['target'])
+      if source is None and target is None : continue
+      if source is None or target is None :
+        inside, outside, outgoing = (
+          (source, aLink['target'], True) if target is None
+          else (target, aLink['source'], False)
+        )
+        key = (inside, tuple(self.paths[outside]), outgoing)
+        external[key] = external.get(key, 0) + 1
+      elif source == aLink['source'] and target == aLink['target'] :
+        links.append(aLink)
+      elif source != target :
+        merged[(source, target)] = merged.get((source, target), 0) + 1
+    for (source, target), weight in merged.items() :
+      links.append({
+        'source' : source, 'target' : target, 'linkType' : 'cluster',
+        'weight' : weight, 'color' : 'grey'
+      })
+    return {
+      'cluster'  : clusterId,
+      'nodes'    : nodes,
+      'links'    : links,
+      'external' : [ {
+        'inside'   : inside,
+        'outside'  : list(path),
+        'outgoing' : outgoing,
+        'weight'   : weight
+      } for (inside, path, outgoing), weight in external.items() ]
+    }
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+    Link graph
+    ~~~~~~~~~~
+"""
+
+from array import array
+from bisect import bisect_left
+from heapq import heappop, heappush
+from itertools import chain
+
+def csrArrays(numNodes, edges, codeType='H'):
+  """
+  Pack sorted (node, other node, code) edges into compressed sparse
+  row arrays.
+
+  :param str codeType: the array type code of the codes
+
+  :returns: the start of every node's slice (plus the end of the
+            last one), the other end of every edge and its code
+  :rtype: tuple
+  """
+  starts = array('I', bytes(4 * (numNodes + 1)))
+  for aNode, _, _ in edges : starts[aNode + 1] += 1
+  for aNode in range(numNodes) : starts[aNode + 1] += starts[aNode]
+  return (
+    starts,
+    array('I', [ anOther for _, anOther, _ in edges ]),
+    array(codeType, [ aCode for _, _, aCode in edges ])
+  )
+
+def shortestPath(expand, source, target, bannedNodes=(), bannedSteps=()):
+  """
+  Find a shortest path between two nodes by a breadth first search
+  from both ends, always growing the smaller of the two frontiers by a
+  whole level.
+
+  :param expand: called with a frontier and whether it is being grown
+                 forwards (from the source) or backwards (from the
+                 target), yields the (node, neighbour) steps out of
+                 the frontier in a fixed order
+  :param bannedNodes: the nodes the path may not pass through
+  :param bannedSteps: the (node, next node) steps the path may not take
+
+  :returns: the nodes of the path, or None if there is no path
+  :rtype: list
+  """
+  if source == target : return [ source ]
+  parents = ({ source : None }, { target : None })
+  depths = ({ source : 0 }, { target : 0 })
+  frontiers = [ [ source ], [ target ] ]
+  while frontiers[0] and frontiers[1] :
+    side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+    seen, otherSeen = parents[side], parents[1 - side]
+    nextFrontier = []
+    meetings = []
+    for aNode, aNeighbour in expand(frontiers[side], side == 0) :
+      if aNeighbour in seen or aNeighbour in bannedNodes : continue
+      if ((aNode, aNeighbour) if side == 0 else (aNeighbour, aNode)) in bannedSteps :
+        continue
+      seen[aNeighbour] = aNode
+      depths[side][aNeighbour] = depths[side][aNode] + 1
+      nextFrontier.append(aNeighbour)
+      if aNeighbour in otherSeen : meetings.append(aNeighbour)
+    if meetings :
+      middle = min(meetings, key=lambda aNode : depths[1 - side][aNode])
+      path = []
+      aNode = middle
+      while aNode is not None :
+        path.append(aNode)
+        aNode = parents[0][aNode]
+      path.reverse()
+      aNode = parents[1][middle]
+      while aNode is not None :
+        path.append(aNode)
+        aNode = parents[1][aNode]
+      return path
+    frontiers[side] = nextFrontier
+  return None
+
+def shortestPaths(expand, source, target, count=1):
+  """
+  Find the `count` shortest (loopless) paths between two nodes, in
+  order of length, using Yen's algorithm over :func:`shortestPath`.
+
+  :returns: the nodes of every path found
+  :rtype: list
+  """
+  path = shortestPath(expand, source, target)
+  if path is None : return []
+  paths = [ path ]
+  candidates = []
+  seen = { tuple(path) }
+  while len(paths) < count :
+    previous = paths[-1]
+    for i in range(len(previous) - 1) :
+      root = previous[:i + 1]
+      spurPath = shortestPath(
+        expand, previous[i], target,
+        bannedNodes=set(root[:-1]),
+        bannedSteps=set(
+          (aPath[i], aPath[i + 1]) for aPath in paths if aPath[:i + 1] == root
+        )
+      )
+      if spurPath is None : continue
+      candidate = tuple(root[:-1] + spurPath)
+      if candidate in seen : continue
+      seen.add(candidate)
+      heappush(candidates, (len(candidate), candidate))
+    if not candidates : break
+    paths.append(list(heappop(candidates)[1]))
+  return paths
+
+class LinkGraph(object):
+  """
+  The links between (existing) pages as compressed sparse row arrays.
+
+  Pages are numbered in url order. The targets of a page's outgoing
+  links, and the sources of its incoming links, are each one slice of
+  an array of page numbers, with the modifier of every link kept as a
+  small integer code in a parallel array. The pages of every tag are
+  kept as a sorted array of page numbers. The whole graph is a
+  handful of flat arrays, which are cheap to keep in memory, to pickle
+  and to walk.
+  """
+
+  def __init__(self, urls, links, tags=None):
+    """
+    :param urls: the urls of the pages
+    :param links: the (source url, target url, modifier) of every
+                  link; links to missing pages are left out
+    :param dict tags: the tags of (some of) the pages keyed by url
+    """
+    self.urls = sorted(set(urls))
+    ids = { url : i for i, url in enumerate(self.urls) }
+    self.modifiers = []
+    codes = {}
+    edges = set()
+    for aSource, aTarget, aModifier in links :
+      source = ids.get(aSource)
+      target = ids.get(aTarget)
+      if source is None or target is None : continue
+      if aModifier not in codes :
+        codes[aModifier] = len(self.modifiers)
+        self.modifiers.append(aModifier)
+      edges.add((source, target, codes[aModifier]))
+    edges = sorted(edges)
+    self.outStart, self.outTargets, self.outCodes = csrArrays(len(self.urls), edges)
+    inEdges = sorted(
+      (target, source, k) for k, (source, target, _) in enumerate(edges)
+    )
+    # (the in edges are coded by the number of the same out edge)
+    self.inStart, self.inSources, self.inEdges = csrArrays(
+      len(self.urls), inEdges, 'I'
+    )
+    self.inCodes = array('H', [ self.outCodes[k] for k in self.inEdges ])
+
+    members = {}
+    for url, pageTags in (tags or {}).items() :
+      if url not in ids : continue
+      for aTag in pageTags : members.setdefault(aTag, []).append(ids[url])
+    self.tags = {
+      aTag : array('I', sorted(someIds)) for aTag, someIds in members.items()
+    }
+
+  @classmethod
+  def fromBacklinks(cls, urls, backlinks, tags=None):
+    """
+    Build the link graph from the outgoing links kept by a
+    :class:`~mindMapper.index.BacklinkIndex`.
+    """
+    return cls(urls, (
+      (aSource, links[k], links[k + 1])
+      for aSource, links in backlinks.pageLinks.items()
+      for k in range(0, len(links), 2)
+    ), tags)
+
+  def __len__(self):
+    return len(self.urls)
+
+  def id(self, url):
+    """
+    :returns: the number of a page, or None if there is no such page
+    :rtype: int
+    """
+    i = bisect_left(self.urls, url)
+    if i < len(self.urls) and self.urls[i] == url : return i
+    return None
+
+  def codes(self, modifiers):
+    """
+    :returns: the codes of the given modifiers (None for every modifier)
+    :rtype: set
+    """
+    if modifiers is None : return None
+    return set(
+      code for code, aModifier in enumerate(self.modifiers) if aModifier in modifiers
+    )
+
+  def neighbours(self, url):
+    """
+    :returns: the urls of the pages a page links to or is linked from
+    :rtype: set
+    """
+    i = self.id(url)
+    if i is None : return set()
+    return set(
+      self.urls[j] for j in chain(
+        self.outTargets[self.outStart[i]:self.outStart[i + 1]],
+        self.inSources[self.inStart[i]:self.inStart[i + 1]]
+      )
+    )
+
+  def tagMap(self, tag):
+    """
+    The link map of a tag: the pages with the tag, every link to or
+    from any of them and the pages at the other end of those links.
+
+    The tag's pages are marked in a byte mask, so that every link is
+    found exactly once, either from its source (if that has the tag)
+    or from its target (if only that has the tag).
+
+    :returns: the urls of the map's pages (sorted) and the (source
+              url, target url, modifier) of its links (sorted), or
+              None if no page has the tag
+    :rtype: tuple
+    """
+    members = self.tags.get(tag)
+    if not members : return None
+    mask = bytearray(len(self.urls))
+    for i in members : mask[i] = 1
+    edges = []
+    for i in members :
+      edges.extend((k, i) for k in range(self.outStart[i], self.outStart[i + 1]))
+      for k in range(self.inStart[i], self.inStart[i + 1]) :
+        source = self.inSources[k]
+        if not mask[source] : edges.append((self.inEdges[k], source))
+    edges.sort()
+
+    nodes = set(members)
+    links = []
+    for k, source in edges :
+      target = self.outTargets[k]
+      nodes.add(source)
+      nodes.add(target)
+      links.append((
+        self.urls[source], self.urls[target], self.modifiers[self.outCodes[k]]
+      ))
+    return [ self.urls[i] for i in sorted(nodes) ], links
+
+  def neighbourhood(self, url, hops=1, modifiers=None, limit=None):
+    """
+    Find the pages within `hops` links (followed in either direction)
+    of a page, and the links between them.
+
+    :param list modifiers: if given, only links with these modifiers
+                           are followed (and returned)
+    :param int limit: if given, the search stops once this many pages
+                      have been found
+
+    :returns: the urls of the pages (sorted) and the (source url,
+              target url, modifier) of the links between them
+    :rtype: tuple
+    """
+    start = self.id(url)
+    if start is None : return [], []
+    allowed = self.codes(modifiers)
+    seen = { start }
+    frontier = [ start ]
+    full = False
+    for _ in range(hops) :
+      nextFrontier = []
+      for aNode in frontier :
+        for starts, others, codes in (
+          (self.outStart, self.outTargets, self.outCodes),
+          (self.inStart, self.inSources, self.inCodes)
+        ) :
+          for k in range(starts[aNode], starts[aNode + 1]) :
+            if allowed is not None and codes[k] not in allowed : continue
+            anOther = others[k]
+            if anOther in seen : continue
+            if limit is not None and limit <= len(seen) :
+              full = True
+              break
+            seen.add(anOther)
+            nextFrontier.append(anOther)
+          if full : break
+        if full : break
+      frontier = nextFrontier
+      if full or not frontier : break
+
+    links = []
+    nodes = sorted(seen)
+    for aNode in nodes :
+      for k in range(self.outStart[aNode], self.outStart[aNode + 1]) :
+        if allowed is not None and self.outCodes[k] not in allowed : continue
+        if self.outTargets[k] in seen :
+          links.append((
+            self.urls[aNode], self.urls[self.outTargets[k]],
+            self.modifiers[self.outCodes[k]]
+          ))
+    return [ self.urls[aNode] for aNode in nodes ], links
+
+  def paths(self, fromUrl, toUrl, count=1, modifiers=None, tag=None, directed=False):
+    """
+    Find the shortest paths between two pages (see
+    :func:`shortestPaths`).
+
+    :param list modifiers: if given, only links with these modifiers
+                           are followed (and returned)
+    :param str tag: if given, the paths only pass through pages with
+                    this tag
+    :param bool directed: whether links are only followed from their
+                          source to their target, rather than either
+                          way
+
+    :returns: the urls of the pages on the paths (sorted), the (source
+              url, target url, modifier) of the links along the paths
+              and the urls of every path
+    :rtype: tuple
+    """
+    source = self.id(fromUrl)
+    target = self.id(toUrl)
+    if source is None or target is None : return [], [], []
+    allowed = self.codes(modifiers)
+    mask = None
+    if tag is not None :
+      mask = bytearray(len(self.urls))
+      for i in self.tags.get(tag, ()) : mask[i] = 1
+      mask[source] = mask[target] = 1
+    outSide = (self.outStart, self.outTargets, self.outCodes)
+    inSide  = (self.inStart, self.inSources, self.inCodes)
+
+    def expand(frontier, forwards):
+      if not directed : sides = (outSide, inSide)
+      elif forwards   : sides = (outSide,)
+      else            : sides = (inSide,)
+      for aNode in frontier :
+        for starts, others, codes in sides :
+          for k in range(starts[aNode], starts[aNode + 1]) :
+            if allowed is not None and codes[k] not in allowed : continue
+            if mask is not None and not mask[others[k]] : continue
+            yield aNode, others[k]
+
+    paths = shortestPaths(expand, source, target, count)
+    steps = set()
+    for aPath in paths :
+      steps.update(zip(aPath, aPath[1:]))
+      if not directed : steps.update(zip(aPath[1:], aPath))
+    links = []
+    for aSource, aTarget in sorted(steps) :
+      for k in range(self.outStart[aSource], self.outStart[aSource + 1]) :
+        if self.outTargets[k] != aTarget : continue
+        if allowed is not None and self.outCodes[k] not in allowed : continue
+        links.append((
+          self.urls[aSource], self.urls[aTarget], self.modifiers[self.outCodes[k]]
+        ))
+    nodes = sorted(set(chain.from_iterable(paths)))
+    return (
+      [ self.urls[aNode] for aNode in nodes ],
+      links,
+      [ [ self.urls[aNode] for aNode in aPath ] for aPath in paths ]
+    )
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+    Pages index
+    ~~~~~~~~~~~
+"""
+
+from bisect import bisect_left
+from bisect import insort
+import os
+import sys
+import threading
+
+from mindMapper.graph import LinkGraph
+from mindMapper.search import SearchIndex
+
+def splitTags(tags):
+  """
+  Split the (comma separated) tags of a page into its distinct,
+  non-empty tags.
+
+  :rtype: list
+  """
+  tagList = []
+  for aTag in tags.split(','):
+    aTag = aTag.strip()
+    if aTag and aTag not in tagList : tagList.append(aTag)
+  return tagList
+
+class TagIndex(object):
+  """
+  An index from every tag to the urls of its pages (kept sorted by
+  title) and from every page to its tags, which can be updated one
+  page at a time.
+  """
+
+  def __init__(self):
+    self.tagPages = {}
+    self.pageTags = {}
+    self.pageKeys = {}
+
+  def addPage(self, aPage):
+    """
+    Add (or replace) a page in the index.
+    """
+    url = aPage.url
+    if url in self.pageTags : self.removePage(url)
+    url = sys.intern(url)
+    key = (aPage.title.lower(), url)
+    self.pageKeys[url] = key
+    self.pageTags[url] = tuple(sys.intern(aTag) for aTag in splitTags(aPage.tags))
+    for aTag in self.pageTags[url]:
+      insort(self.tagPages.setdefault(aTag, []), key)
+
+  def removePage(self, url):
+    """
+    Remove a page from the index.
+    """
+    if url not in self.pageTags : return
+    key = self.pageKeys.pop(url)
+    for aTag in self.pageTags.pop(url):
+      keys = self.tagPages[aTag]
+      del keys[bisect_left(keys, key)]
+      if not keys : del self.tagPages[aTag]
+
+  def pages(self, tag):
+    """
+    :returns: the urls of the pages with exactly this tag, sorted by
+              title
+    :rtype: list
+    """
+    return [ url for _, url in self.tagPages.get(tag, ()) ]
+
+  def tags(self, url):
+    """
+    :returns: the tags of a page
+    :rtype: tuple
+    """
+    return self.pageTags.get(url, ())
+
+  def counts(self):
+    """
+    :returns: the number of pages of every tag
+    :rtype: dict
+    """
+    return { aTag : len(keys) for aTag, keys in self.tagPages.items() }
+
+class BacklinkIndex(object):
+  """
+  An index from every link target (whether or not that page exists)
+  to the (source url, modifier) pairs of the links to it, which can
+  be updated one page at a time.
+
+  The outgoing links of each page (needed to remove it again) are kept
+  as one flat (target, modifier, target, modifier, ...) tuple.
+  """
+
+  def __init__(self):
+    self.backlinks = {}
+    self.pageLinks = {}
+
+  def addPage(self, aPage):
+    """
+    Add (or replace) the outgoing links of a page.
+    """
+    url = sys.intern(aPage.url)
+    if url in self.pageLinks : self.removePage(url)
+    links = []
+    for aTarget, _, aModifier in aPage.linkTuples:
+      aPair = (sys.intern(aTarget), sys.intern(aModifier))
+      if aPair not in links : links.append(aPair)
+    self.pageLinks[url] = tuple(aString for aPair in links for aString in aPair)
+    for aTarget, aModifier in links:
+      insort(self.backlinks.setdefault(aTarget, []), (url, aModifier))
+
+  def removePage(self, url):
+    """
+    Remove the outgoing links of a page.
+    """
+    if url not in self.pageLinks : return
+    links = self.pageLinks.pop(url)
+    for aTarget, aModifier in zip(links[0::2], links[1::2]):
+      sources = self.backlinks[aTarget]
+      del sources[bisect_left(sources, (url, aModifier))]
+      if not sources : del self.backlinks[aTarget]
+
+  def links(self, url):
+    """
+    :returns: the (source url, modifier) pairs of the links to a page,
+              sorted by source url
+    :rtype: list
+    """
+    return list(self.backlinks.get(url, ()))
+
+class PagesIndex(object):
+  """
+  An immutable, in-memory snapshot of the pages cache.
+
+  The sorted list of pages is computed when the snapshot is built;
+  the search, tag and backlinks indexes and the link graph are each
+  loaded (or, if there is no loader for them, built) once, when they
+  are first used. A request never has to touch the cache on disk for
+  them again.
+  """
+
+  def __init__(
+    self, pagesMap, loadSearch=None, loadTags=None, loadBacklinks=None,
+    loadGraph=None
+  ):
+    self.pagesMap = dict(pagesMap)
+    self._loaders = {
+      'search'    : (loadSearch, lambda : self.buildSection(SearchIndex)),
+      'tags'      : (loadTags, lambda : self.buildSection(TagIndex)),
+      'backlinks' : (loadBacklinks, lambda : self.buildSection(BacklinkIndex)),
+      'graph'     : (loadGraph, lambda : LinkGraph.fromBacklinks(
+        self.pagesMap, self.backlinks, self.tagIndex.pageTags
+      ))
+    }
+    self._sections = {}
+    # (re-entrant, as the link graph is built from the backlinks)
+    self._sectionsLock = threading.RLock()
+    self._tags = None
+    self.pages = sorted(self.pagesMap.values(), key=lambda x: x.title.lower())
+
+  def get(self, url):
+    return self.pagesMap.get(url)
+
+  def tagged(self, tag):
+    """
+    :returns: the pages with exactly this tag, sorted by title
+    :rtype: list
+    """
+    return [ self.pagesMap[url] for url in self.tagIndex.pages(tag) ]
+
+  @property
+  def tags(self):
+    """
+    The pages (sorted by title) of every tag.
+
+    :rtype: dict
+    """
+    if self._tags is None:
+      self._tags = {
+        aTag : self.tagged(aTag) for aTag in self.tagIndex.tagPages
+      }
+    return self._tags
+
+  def buildSection(self, sectionClass):
+    section = sectionClass()
+    for page in self.pages: section.addPage(page)
+    return section
+
+  def section(self, name):
+    """
+    Load (or build) one of the search, tags or backlinks indexes or
+    the link graph the first time it is used.
+    """
+    section = self._sections.get(name)
+    if section is None:
+      with self._sectionsLock:
+        section = self._sections.get(name)
+        if section is None:
+          loader, build = self._loaders[name]
+          section = (loader or build)()
+          self._sections[name] = section
+    return section
+
+  @property
+  def search(self):
+    """
+    :rtype: SearchIndex
+    """
+    return self.section('search')
+
+  @property
+  def tagIndex(self):
+    """
+    :rtype: TagIndex
+    """
+    return self.section('tags')
+
+  @property
+  def backlinks(self):
+    """
+    :rtype: BacklinkIndex
+    """
+    return self.section('backlinks')
+
+  @property
+  def graph(self):
+    """
+    :rtype: LinkGraph
+    """
+    return self.section('graph')
+
+class SharedIndex(object):
+  """
+  A thread-safe holder of the current :class:`PagesIndex`.
+
+  One of these is shared by every request of the web app. The index
+  is loaded (once) on first use and is then replaced, as a whole,
+  whenever the pages cache is rebuilt. Readers simply pick up
+  whichever snapshot is current, so they never see a partial update.
+  """
+
+  def __init__(self):
+    self._lock  = threading.Lock()
+    self._index = None
+    self._stamp = None
+
+  def cacheStamp(self, cachePath):
+    try:
+      stat = os.stat(cachePath)
+    except OSError:
+      return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+  def get(self, cachePath, loader):
+    """
+    Return the current snapshot, (re)loading it with `loader` (which
+    returns a new :class:`PagesIndex`) if there is none yet, or if
+    the cache file has been changed by somebody else (for example by
+    `mindMapper buildCache`).
+    """
+    index = self._index
+    stamp = self.cacheStamp(cachePath)
+    if index is not None and stamp == self._stamp:
+      return index
+    with self._lock:
+      if self._index is None or self._stamp != stamp:
+        self._index = loader()
+        self._stamp = stamp
+      return self._index
+
+  def swap(self, index, cachePath):
+    """
+    Atomically replace the current snapshot after the pages cache at
+    `cachePath` has been rewritten.
+    """
+    with self._lock:
+      self._index = index
+      self._stamp = self.cacheStamp(cachePath)
+    return index
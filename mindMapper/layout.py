@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+    Concept map layout
+    ~~~~~~~~~~~~~~~~~~
+
+    A force-directed layout of the concept maps, computed after the maps
+    are built so that the browser only has to draw them (and only
+    simulates once somebody drags a node).
+
+    The forces are those of the concept mapper's d3 simulation (with
+    d3's default strengths): links pull their ends towards a fixed
+    distance, every node repels every other node (approximated using a
+    Barnes-Hut quadtree) and the map is kept centred on the origin.
+    A layout can be warm-started from the previous positions of the
+    nodes, in which case new nodes start next to their neighbours and
+    only a short, cool simulation is run.
+"""
+
+import math
+
+LINK_DISTANCE  = 30
+CHARGE         = -30
+THETA2         = 0.81
+DISTANCE_MIN2  = 1
+VELOCITY_DECAY = 0.4
+ALPHA_MIN      = 0.001
+WARM_ALPHA     = 0.1
+MAX_DEPTH      = 32
+
+GOLDEN_ANGLE   = math.pi * (3 - math.sqrt(5))
+
+#: maps with more nodes than this are left for the browser to lay out
+MAX_NODES = 500
+
+def spiral(index, radius=10) :
+  """
+  :returns: the index'th point of a phyllotaxis spiral (which is how
+            d3 places nodes without a position)
+  :rtype: tuple
+  """
+  distance = radius * math.sqrt(0.5 + index)
+  angle    = index * GOLDEN_ANGLE
+  return distance * math.cos(angle), distance * math.sin(angle)
+
+def buildQuad(xs, ys, members, x0, y0, size, depth=0) :
+  """
+  Build (a quad of) the Barnes-Hut quadtree of the given nodes.
+
+  :returns: the centre of mass, charge and squared size of the quad,
+            together with its child quads and, for a leaf, its node
+            (or for a leaf of coincident nodes, its nodes)
+  :rtype: tuple
+  """
+  count = len(members)
+  if count == 1 :
+    i = members[0]
+    return (xs[i], ys[i], CHARGE, 0.0, None, i)
+  cx = sum(xs[i] for i in members) / count
+  cy = sum(ys[i] for i in members) / count
+  if MAX_DEPTH < depth :
+    return (cx, cy, CHARGE * count, 0.0, None, members)
+  half = size / 2
+  mx = x0 + half
+  my = y0 + half
+  quads = ([], [], [], [])
+  for i in members :
+    quads[(mx <= xs[i]) + 2 * (my <= ys[i])].append(i)
+  children = [
+    buildQuad(
+      xs, ys, aQuad, x0 + half * (k & 1), y0 + half * (k >> 1), half, depth + 1
+    ) for k, aQuad in enumerate(quads) if aQuad
+  ]
+  return (cx, cy, CHARGE * count, size * size, children, None)
+
+def applyCharge(xs, ys, vxs, vys, alpha) :
+  """
+  Push every node away from every other node (d3's many-body force).
+  """
+  x0, x1 = min(xs), max(xs)
+  y0, y1 = min(ys), max(ys)
+  size = max(x1 - x0, y1 - y0, 1.0)
+  root = buildQuad(xs, ys, list(range(len(xs))), x0, y0, size)
+  for i, (x, y) in enumerate(zip(xs, ys)) :
+    vx = vy = 0.0
+    stack = [root]
+    pop = stack.pop
+    while stack :
+      cx, cy, charge, size2, children, member = pop()
+      dx = cx - x
+      dy = cy - y
+      l = dx * dx + dy * dy
+      if children is not None and THETA2 * l <= size2 :
+        stack.extend(children)
+        continue
+      if l == 0 :
+        if member == i : continue
+        # separate coincident nodes (deterministically)
+        members = member if isinstance(member, list) else [member]
+        for j in members :
+          if j != i : vx += (1e-6 if j < i else -1e-6) * CHARGE * alpha
+        continue
+      if l < DISTANCE_MIN2 : l = math.sqrt(DISTANCE_MIN2 * l)
+      vx += dx * charge * alpha / l
+      vy += dy * charge * alpha / l
+    vxs[i] += vx
+    vys[i] += vy
+
+def applyLinks(links, xs, ys, vxs, vys, alpha) :
+  """
+  Pull the ends of every link towards LINK_DISTANCE (d3's link
+  force).
+
+  :param list links: (source, target, strength, bias) tuples
+  """
+  for source, target, strength, bias in links :
+    dx = xs[target] + vxs[target] - xs[source] - vxs[source]
+    dy = ys[target] + vys[target] - ys[source] - vys[source]
+    l = math.sqrt(dx * dx + dy * dy) or 1e-6
+    l = (l - LINK_DISTANCE) / l * alpha * strength
+    dx *= l
+    dy *= l
+    vxs[target] -= dx * bias
+    vys[target] -= dy * bias
+    vxs[source] += dx * (1 - bias)
+    vys[source] += dy * (1 - bias)
+
+def layoutGraph(nodeIds, links, previous=None, iterations=300, warmIterations=60) :
+  """
+  Lay out a graph.
+
+  :param list nodeIds: the ids of the nodes
+  :param list links: the (source id, target id) of every link
+  :param dict previous: the previous (x, y) positions of (some of)
+                        the nodes, keyed by id, to warm-start from
+  :param int iterations: the number of steps of a cold start
+  :param int warmIterations: the number of steps of a warm start
+
+  :returns: the (x, y) position of every node keyed by id
+  :rtype: dict
+  """
+  if previous is None : previous = {}
+  index = { anId : i for i, anId in enumerate(nodeIds) }
+  numNodes = len(nodeIds)
+  if not numNodes : return {}
+
+  counts = [0] * numNodes
+  neighbours = [ [] for _ in range(numNodes) ]
+  pairs = []
+  for aSource, aTarget in links :
+    source = index.get(aSource)
+    target = index.get(aTarget)
+    if source is None or target is None or source == target : continue
+    counts[source] += 1
+    counts[target] += 1
+    neighbours[source].append(target)
+    neighbours[target].append(source)
+    pairs.append((source, target))
+  linkForces = [ (
+    source, target,
+    1 / min(counts[source], counts[target]),
+    counts[source] / (counts[source] + counts[target])
+  ) for source, target in pairs ]
+
+  xs = [0.0] * numNodes
+  ys = [0.0] * numNodes
+  placed = [False] * numNodes
+  for anId, i in index.items() :
+    if anId in previous :
+      xs[i], ys[i] = previous[anId]
+      placed[i] = True
+  warm = any(placed)
+  newNodes = [ i for i in range(numNodes) if not placed[i] ]
+  for k, i in enumerate(newNodes) :
+    anchors = [ j for j in neighbours[i] if placed[j] ]
+    if warm and anchors :
+      # start next to the new node's (already placed) neighbours
+      dx, dy = spiral(k, 1)
+      xs[i] = sum(xs[j] for j in anchors) / len(anchors) + dx
+      ys[i] = sum(ys[j] for j in anchors) / len(anchors) + dy
+    else :
+      xs[i], ys[i] = spiral(k)
+    placed[i] = True
+
+  alpha = WARM_ALPHA if warm else 1.0
+  steps = warmIterations if warm else iterations
+  alphaDecay = 1 - (ALPHA_MIN / alpha) ** (1 / steps)
+  vxs = [0.0] * numNodes
+  vys = [0.0] * numNodes
+  for _ in range(steps) :
+    alpha -= alpha * alphaDecay
+    applyLinks(linkForces, xs, ys, vxs, vys, alpha)
+    applyCharge(xs, ys, vxs, vys, alpha)
+    # keep the map centred on the origin
+    mx = sum(xs) / numNodes
+    my = sum(ys) / numNodes
+    for i in range(numNodes) :
+      vxs[i] *= 1 - VELOCITY_DECAY
+      vys[i] *= 1 - VELOCITY_DECAY
+      xs[i] += vxs[i] - mx
+      ys[i] += vys[i] - my
+  return { anId : (xs[i], ys[i]) for anId, i in index.items() }
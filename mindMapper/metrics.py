@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+    Concept map metrics
+    ~~~~~~~~~~~~~~~~~~~
+
+    Per node measures of how central every page of a concept map is,
+    computed as the maps are built so that the browser can size (and
+    colour) the nodes without computing anything itself. The degrees
+    and components are cheap to measure; the PageRank and betweenness
+    are measured apart, as they take a while for large maps.
+
+    Every node gets its in and out degree, its PageRank (scaled so
+    that the average page has a rank of 1), its betweenness centrality
+    (normalised to between 0 and 1, and estimated from a sample of
+    pages for large maps) and the number of its (weakly) connected
+    component, the largest component being 0.
+"""
+
+from collections import deque
+import random
+
+DAMPING        = 0.85
+TOLERANCE      = 1e-6
+MAX_ITERATIONS = 100
+
+#: maps with more nodes than this have their betweenness estimated
+EXACT_BETWEENNESS = 500
+
+#: the number of pages the betweenness is estimated from
+BETWEENNESS_SAMPLES = 100
+
+#: the metrics added to every node
+METRICS = ('inDegree', 'outDegree', 'pageRank', 'betweenness', 'component')
+
+#: the metrics which are only measured along with the centrality
+CENTRALITY = ('pageRank', 'betweenness')
+
+def pageRank(numNodes, edges, previous=None) :
+  """
+  The PageRank of every node, found by power iteration. The rank of
+  nodes without outgoing edges is spread over every node.
+
+  :param list edges: the (source, target) of every edge
+  :param list previous: the (approximate) ranks to start from, which
+                        makes re-ranking a slightly changed graph quick
+
+  :returns: the rank of every node (summing to 1)
+  :rtype: list
+  """
+  if not numNodes : return []
+  outDegrees = [0] * numNodes
+  for source, _ in edges : outDegrees[source] += 1
+  ranks = list(previous) if previous else [ 1 / numNodes ] * numNodes
+  total = sum(ranks)
+  ranks = [ aRank / total for aRank in ranks ]
+  for _ in range(MAX_ITERATIONS) :
+    dangling = sum(ranks[i] for i in range(numNodes) if not outDegrees[i])
+    base = (1 - DAMPING + DAMPING * dangling) / numNodes
+    newRanks = [ base ] * numNodes
+    for source, target in edges :
+      newRanks[target] += DAMPING * ranks[source] / outDegrees[source]
+    change = sum(abs(a - b) for a, b in zip(ranks, newRanks))
+    ranks = newRanks
+    if change < TOLERANCE : break
+  return ranks
+
+def betweenness(numNodes, successors, sources=None) :
+  """
+  The betweenness centrality of every node (Brandes' algorithm),
+  normalised by the number of ordered pairs of other nodes.
+
+  :param list successors: the targets of every node's edges
+  :param list sources: if given, the betweenness is estimated from the
+                       shortest paths from just these nodes
+
+  :rtype: list
+  """
+  centrality = [0.0] * numNodes
+  if numNodes < 3 : return centrality
+  if sources is None : sources = range(numNodes)
+  for s in sources :
+    stack = []
+    predecessors = [ [] for _ in range(numNodes) ]
+    paths = [0] * numNodes
+    paths[s] = 1
+    distances = [-1] * numNodes
+    distances[s] = 0
+    queue = deque([s])
+    while queue :
+      v = queue.popleft()
+      stack.append(v)
+      for w in successors[v] :
+        if distances[w] < 0 :
+          distances[w] = distances[v] + 1
+          queue.append(w)
+        if distances[w] == distances[v] + 1 :
+          paths[w] += paths[v]
+          predecessors[w].append(v)
+    dependencies = [0.0] * numNodes
+    while stack :
+      w = stack.pop()
+      for v in predecessors[w] :
+        dependencies[v] += paths[v] / paths[w] * (1 + dependencies[w])
+      if w != s : centrality[w] += dependencies[w]
+  scale = numNodes / len(sources) / ((numNodes - 1) * (numNodes - 2))
+  return [ aValue * scale for aValue in centrality ]
+
+def components(numNodes, edges) :
+  """
+  :returns: the (weakly) connected component of every node, numbered
+            from the largest component down
+  :rtype: list
+  """
+  parents = list(range(numNodes))
+  def find(i) :
+    while parents[i] != i :
+      parents[i] = parents[parents[i]]
+      i = parents[i]
+    return i
+  for source, target in edges :
+    a, b = find(source), find(target)
+    if a != b : parents[max(a, b)] = min(a, b)
+  roots = [ find(i) for i in range(numNodes) ]
+  sizes = {}
+  for aRoot in roots : sizes[aRoot] = sizes.get(aRoot, 0) + 1
+  numbers = {
+    aRoot : k for k, aRoot in enumerate(sorted(sizes, key=lambda r : (-sizes[r], r)))
+  }
+  return [ numbers[aRoot] for aRoot in roots ]
+
+def measureGraph(graph, oldGraph=None, centrality=True) :
+  """
+  Add the metrics of every node to a map's graph (in place). The
+  PageRank is warm-started from the ranks in the map's previous graph
+  (which may be the graph itself).
+
+  :param bool centrality: whether or not to measure the PageRank and
+                          betweenness, rather than just the degrees
+                          and components
+  """
+  nodes = graph['nodes']
+  numNodes = len(nodes)
+  index = { aNode['id'] : i for i, aNode in enumerate(nodes) }
+  edges = []
+  for aLink in graph['links'] :
+    source = index.get(aLink['source'])
+    target = index.get(aLink['target'])
+    if source is not None and target is not None : edges.append((source, target))
+
+  inDegrees  = [0] * numNodes
+  outDegrees = [0] * numNodes
+  for source, target in edges :
+    outDegrees[source] += 1
+    inDegrees[target]  += 1
+  numbers = components(numNodes, edges)
+  for i, aNode in enumerate(nodes) :
+    aNode['inDegree']  = inDegrees[i]
+    aNode['outDegree'] = outDegrees[i]
+    aNode['component'] = numbers[i]
+  if not centrality : return
+
+  previous = None
+  if oldGraph :
+    oldRanks = {
+      aNode['id'] : aNode['pageRank'] for aNode in oldGraph['nodes'] if 'pageRank' in aNode
+    }
+    if oldRanks :
+      previous = [ oldRanks.get(aNode['id'], 1) / numNodes for aNode in nodes ]
+  ranks = pageRank(numNodes, edges, previous)
+
+  successors = [ set() for _ in range(numNodes) ]
+  for source, target in edges :
+    if source != target : successors[source].add(target)
+  successors = [ sorted(someTargets) for someTargets in successors ]
+  sources = None
+  if EXACT_BETWEENNESS < numNodes :
+    # (a fixed sample, so that rebuilding a map gives the same values)
+    sources = sorted(random.Random(0).sample(range(numNodes), BETWEENNESS_SAMPLES))
+  values = betweenness(numNodes, successors, sources)
+  for i, aNode in enumerate(nodes) :
+    aNode['pageRank']    = round(ranks[i] * numNodes, 3)
+    aNode['betweenness'] = round(values[i], 4)
@@ -12,10 +12,24 @@ from mindMapper.processor import Processor
 from mindMapper.utils import InvalidFileException
 
 class Page(object):
-  def __init__(self, path, url, new=False):
-    self.links = []
-    self.content = None
-    self.mapData = None
+  """
+  A wiki page.
+
+  The links of a page are kept as (target, title, modifier) tuples.
+  A page loaded with `metaOnly` does not keep its content in memory;
+  the content (and html) are re-read from disk if they are needed.
+  """
+
+  __slots__ = (
+    'renderCache', 'linkTuples', '_content', '_mapData', '_html', 'body',
+    'path', 'url', '_meta'
+  )
+
+  def __init__(self, path, url, new=False, renderCache=None, metaOnly=False):
+    self.renderCache = renderCache
+    self.linkTuples = []
+    self._content = None
+    self._mapData = None
     self._html = None
     self.body = None
     self.path = path
@@ -23,25 +37,89 @@ class Page(object):
     self._meta = OrderedDict()
     if not new:
       self.load()
-      self.render()
+      if metaOnly :
+        self.scan()
+        # the content is re-read if the page is ever rendered
+        self._content = None
+      else :
+        self.render()
 
   def __repr__(self):
     return u"<Page: {}@{}>".format(self.url, self.path)
 
   def load(self):
     with open(self.path, 'r', encoding='utf-8') as f:
-      self.content = f.read()
-    mapDataPath = self.path.removesuffix('.md')+'.json'
-    if os.path.exists(mapDataPath) :
-      with open(mapDataPath) as mapDataFile :
-        self.mapData = mapDataFile.read()
+      self._content = f.read()
+    self._mapData = None
+
+  @property
+  def content(self):
+    if self._content is None and self.path and os.path.exists(self.path):
+      self.load()
+    return self._content
+
+  @content.setter
+  def content(self, value):
+    self._content = value
+
+  @property
+  def mapData(self):
+    """
+    The (JSON) concept map shown above the page, if there is one next
+    to the page's file.
+    """
+    if self._mapData is None and self.path:
+      self._mapData = ''
+      if self.hasMap :
+        with open(self.mapDataPath) as mapDataFile :
+          self._mapData = mapDataFile.read()
+    return self._mapData or None
+
+  @property
+  def mapDataPath(self):
+    return self.path.removesuffix('.md')+'.json'
+
+  @property
+  def hasMap(self):
+    """
+    Is there a concept map (served by the map endpoint) to show above
+    the page?
+    """
+    return bool(self.path) and os.path.exists(self.mapDataPath)
 
   def render(self):
+    self.linkTuples = []
+    key = None
+    if self.renderCache is not None:
+      key = self.renderCache.key(self.content)
+      entry = self.renderCache.get(key)
+      if entry is not None:
+        self._html, self.body, meta, links = entry
+        self._meta = OrderedDict(meta)
+        self.linkTuples = list(links)
+        return
     processor = Processor(self.content, self)
     try:
       self._html, self.body, self._meta = processor.process()
     except ValueError:
       raise InvalidFileException("No metadata & body.")
+    if key is not None:
+      self.renderCache.put(key, (
+        self._html, self.body, list(self._meta.items()), list(self.linkTuples)
+      ))
+
+  def scan(self):
+    """
+    Read the meta data, body and links of the page without rendering
+    it; the html is then only rendered if it is asked for.
+    """
+    self.linkTuples = []
+    self._html = None
+    processor = Processor(self.content, self)
+    try:
+      self.body, self._meta = processor.scan()
+    except ValueError:
+      raise InvalidFileException("No metadata & body.")
 
   def save(self, update=True):
     folder = os.path.dirname(self.path)
@@ -68,6 +146,8 @@ class Page(object):
 
   @property
   def html(self):
+    if self._html is None and self.content is not None:
+      self.render()
     return self._html
 
   def __html__(self):
@@ -96,10 +176,14 @@ class Page(object):
     self['tags'] = value
 
   def addLink(self, aBaseUrl, aTitle, aModifier) :
-    self.links.append({
+    #self.linkTuples.append((aBaseUrl.lower(), aTitle, aModifier))
+    self.linkTuples.append((aBaseUrl, aTitle, aModifier))
+
+  @property
+  def links(self):
+    return [ {
       'source'   : self.url,
-      'target'   : aBaseUrl,
-      #'target'   : aBaseUrl.lower(),
+      'target'   : aTarget,
       'title'    : aTitle,
       'modifier' : aModifier
-    })
+    } for aTarget, aTitle, aModifier in self.linkTuples ]
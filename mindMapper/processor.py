@@ -7,12 +7,39 @@ import traceback
 
 from collections import OrderedDict
 import markdown
+from markdown.extensions.meta import BEGIN_RE, END_RE, META_RE, META_MORE_RE
 import re
+import threading
 
+from flask import has_app_context
 from flask import url_for
+from werkzeug.routing import BuildError
 
 from mindMapper.utils import clean_url
 
+#: bump this whenever a change to the processing changes the html
+#: rendered for the same content
+RENDER_VERSION = '2'
+
+#: the wikilink syntax, see :func:`wikilink`
+LINK_REGEX = re.compile(
+  r"(\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
+  re.X | re.U
+)
+
+# Wikilinks inside code are not links. The same code is skipped in the
+# markdown (when scanning or rewriting links) as in the html rendered
+# from it (when rendering links):
+
+#: fenced code blocks and inline code spans of markdown text
+CODE_REGEX = re.compile(
+  r"^[ ]{0,3}(```|~~~).*?^[ ]{0,3}\1[ \t]*$ | `[^`\n]+`",
+  re.X | re.M | re.S
+)
+
+#: the code blocks (highlighted or not) and code spans of html
+HTML_CODE_REGEX = re.compile(r"<(pre|code)\b[^>]*>.*?</\1>", re.S)
+
 def wikilink(text, page, url_formatter=None):
   """
   Processes Wikilink syntax "[[Link]]" within the html body.
@@ -30,33 +57,162 @@ def wikilink(text, page, url_formatter=None):
     base location "/", therefore sub-pages need to use the
     [[page/subpage|Subpage]].
 
+  All of the links are replaced in a single pass over the html, except
+  for those inside code.
+
   :returns: the processed html
   :rtype: str
   """
   if url_formatter is None:
     url_formatter = url_for
-  link_regex = re.compile(
-    r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
-    re.X | re.U
-  )
-  for i in link_regex.findall(text):
-    baseUrl = i[1]
-    if 0 < baseUrl.find('{') :
-      baseUrl, modifier = baseUrl.split('{')
-    title = [i[-1] if i[-1] else i[1]][0]
-    modifier = 'link'
-    if 0 < title.find('{') : 
-      title, modifier = title.split('{')
-      modifier = modifier.removesuffix('}')
+
+  def replaceLink(match):
+    baseUrl, title, modifier = parseWikilink(match)
     url = clean_url(baseUrl)
     html_url = u"<a href='{0}' title='{1}'>{2}</a>".format(
       url_formatter('mindMapper.display', url=url),
       modifier,
       title
     )
-    text = re.sub(link_regex, html_url, text, count=1)
     page.addLink(baseUrl, title, modifier)
-  return text
+    return html_url
+
+  return ''.join(
+    aPiece if isCode else LINK_REGEX.sub(replaceLink, aPiece)
+    for aPiece, isCode in splitCode(text, HTML_CODE_REGEX)
+  )
+
+def parseWikilink(match):
+  """
+  Split a wikilink (matched by LINK_REGEX) into its parts.
+
+  :returns: the target, title and modifier of the link
+  :rtype: tuple
+  """
+  i = match.groups()
+  baseUrl = i[1]
+  if 0 < baseUrl.find('{') :
+    baseUrl, modifier = baseUrl.split('{')
+  title = [i[-1] if i[-1] else i[1]][0]
+  modifier = 'link'
+  if 0 < title.find('{') : 
+    title, modifier = title.split('{')
+    modifier = modifier.removesuffix('}')
+  return baseUrl, title, modifier
+
+def splitCode(text, codeRegex):
+  """
+  Split text into the code (as matched by `codeRegex`) and the text
+  around it.
+
+  :returns: the (piece, isCode) pairs of the text, in order
+  :rtype: list
+  """
+  pieces = []
+  end = 0
+  for code in codeRegex.finditer(text):
+    pieces.append((text[end:code.start()], False))
+    pieces.append((code.group(0), True))
+    end = code.end()
+  pieces.append((text[end:], False))
+  return pieces
+
+def scanWikilinks(text, page):
+  """
+  Record the wikilinks of (markdown) text with the page, without
+  rendering it. Links inside code are skipped, as they are not
+  rendered as links either.
+  """
+  for aPiece, isCode in splitCode(text, CODE_REGEX):
+    if isCode : continue
+    for match in LINK_REGEX.finditer(aPiece):
+      page.addLink(*parseWikilink(match))
+
+def rewriteWikilinks(text, oldUrl, newUrl):
+  """
+  Point every wikilink to `oldUrl` in (markdown) text at `newUrl`
+  instead, keeping the title and modifier of each link. Links inside
+  code are left alone, as they are not links.
+
+  :returns: the rewritten text and the number of links rewritten
+  :rtype: tuple
+  """
+  count = 0
+
+  def replaceTarget(match):
+    nonlocal count
+    baseUrl = match.group(2)
+    if 0 < baseUrl.find('{') :
+      baseUrl = baseUrl.split('{')[0]
+    if baseUrl != oldUrl :
+      return match.group(0)
+    count += 1
+    start = match.start(2) - match.start(0)
+    return (
+      match.group(0)[:start] + newUrl + match.group(0)[start + len(baseUrl):]
+    )
+
+  return ''.join(
+    aPiece if isCode else LINK_REGEX.sub(replaceTarget, aPiece)
+    for aPiece, isCode in splitCode(text, CODE_REGEX)
+  ), count
+
+def linkContext():
+  """
+  Describe how wikilinks are currently being formatted (relative to a
+  request or absolute to the server), as the same content renders to
+  different html in different contexts.
+
+  :rtype: str
+  """
+  if not has_app_context():
+    return ''
+  try:
+    return url_for('mindMapper.display', url='-')
+  except (BuildError, RuntimeError):
+    return ''
+
+#: the markdown extensions used to render every page
+EXTENSIONS = [
+  'codehilite',
+  'fenced_code',
+  'meta',
+  'tables',
+  'mdx_math'  # mathjax support
+]
+
+# each thread keeps its own pool of idle markdown converters
+converters = threading.local()
+
+def newConverter():
+  """
+  Build a fully configured markdown converter.
+
+  :rtype: markdown.Markdown
+  """
+  return markdown.Markdown(extensions=EXTENSIONS)
+
+def acquireConverter():
+  """
+  Take an idle markdown converter from this thread's pool, building a
+  new one only if the pool is empty.
+
+  :rtype: markdown.Markdown
+  """
+  pool = getattr(converters, 'pool', None)
+  if pool:
+    return pool.pop()
+  return newConverter()
+
+def releaseConverter(md):
+  """
+  Reset a markdown converter and return it to this thread's pool.
+  """
+  md.reset()
+  pool = getattr(converters, 'pool', None)
+  if pool is None:
+    pool = converters.pool = []
+  pool.append(md)
 
 class Processor(object):
   """
@@ -76,13 +232,7 @@ class Processor(object):
 
     :param str text: the text to process
     """
-    self.md = markdown.Markdown(extensions=[
-      'codehilite',
-      'fenced_code',
-      'meta',
-      'tables',
-      'mdx_math'  # mathjax support
-    ])
+    self.md = acquireConverter()
     self.input = text
     self.page  = page
     self.markdown = None
@@ -133,6 +283,33 @@ class Processor(object):
         self.meta[key.lower()] = \
           '\n'.join(self.md.Meta[key.lower()])
 
+  def scan_meta(self):
+    """
+    Get metadata straight from the raw meta data (in the same way as
+    the markdown meta plugin does), without converting the markdown.
+    """
+    self.meta = OrderedDict()
+    key = None
+    lines = self.meta_raw.split('\n')
+    if lines and BEGIN_RE.match(lines[0]):
+      lines.pop(0)
+    for line in lines:
+      if line.strip() == '' or END_RE.match(line):
+        break
+      keyMatch = META_RE.match(line)
+      if keyMatch:
+        key = keyMatch.group('key').lower().strip()
+        value = keyMatch.group('value').strip()
+        if key in self.meta:
+          self.meta[key] += '\n' + value
+        else:
+          self.meta[key] = value
+        continue
+      moreMatch = META_MORE_RE.match(line)
+      if not (moreMatch and key):
+        break
+      self.meta[key] += '\n' + moreMatch.group('value').strip()
+
   def process_post(self):
     """
     Content postprocessor.
@@ -148,10 +325,30 @@ class Processor(object):
     pre and post processing, markdown rendering and meta data
     handling.
     """
-    self.process_pre()
-    self.process_markdown()
-    self.split_raw()
-    self.process_meta()
+    try:
+      self.process_pre()
+      self.process_markdown()
+      self.split_raw()
+      self.process_meta()
+    finally:
+      # the converter is no longer needed once we have the meta data
+      releaseConverter(self.md)
+      self.md = None
     self.process_post()
 
     return self.final, self.markdown, self.meta
+
+  def scan(self):
+    """
+    Only read the meta data, markdown and wikilinks of the text,
+    which is all the pages cache needs, without rendering it.
+    """
+    # no markdown conversion is needed
+    releaseConverter(self.md)
+    self.md = None
+    self.process_pre()
+    self.split_raw()
+    self.scan_meta()
+    scanWikilinks(self.markdown, self.page)
+
+    return self.markdown, self.meta
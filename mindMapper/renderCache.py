@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+    Render cache
+    ~~~~~~~~~~~~
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+from tempfile import NamedTemporaryFile
+import threading
+
+from mindMapper.processor import RENDER_VERSION
+from mindMapper.processor import linkContext
+
+class RenderCache(object):
+  """
+  A cache of rendered pages keyed by a hash of the page content
+  together with the processor and configuration versions (and the
+  way links are being formatted).
+
+  Each entry holds the html, body, meta data and links of a page. The
+  most recently used entries are kept in memory (up to `maxEntries`)
+  and, if `diskDir` is given, every entry is also written to disk so
+  that it survives restarts.
+  """
+
+  def __init__(self, maxEntries=256, diskDir=None, version=''):
+    self.maxEntries = maxEntries
+    self.diskDir    = diskDir
+    self.version    = version
+    self.entries    = OrderedDict()
+    self.lock       = threading.Lock()
+    self.hits       = 0
+    self.misses     = 0
+    if diskDir : os.makedirs(diskDir, exist_ok=True)
+
+  def key(self, content):
+    keyHash = hashlib.sha1()
+    for aPart in (RENDER_VERSION, self.version, linkContext(), content):
+      keyHash.update(aPart.encode('utf-8'))
+      keyHash.update(b'\x00')
+    return keyHash.hexdigest()
+
+  def diskPath(self, key):
+    return os.path.join(self.diskDir, key[:2], key + '.pickle')
+
+  def get(self, key):
+    """
+    :returns: the (html, body, meta, links) entry for the key, or None
+    :rtype: tuple
+    """
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None:
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+    if self.diskDir:
+      try:
+        with open(self.diskPath(key), 'rb') as entryFile:
+          entry = pickle.load(entryFile)
+      except (OSError, pickle.UnpicklingError, EOFError):
+        entry = None
+      if entry is not None:
+        self.remember(key, entry)
+        with self.lock: self.hits += 1
+        return entry
+    with self.lock: self.misses += 1
+    return None
+
+  def put(self, key, entry):
+    self.remember(key, entry)
+    if not self.diskDir : return
+    path = self.diskPath(key)
+    if os.path.exists(path) : return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpName = None
+    try :
+      with NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmpFile :
+        tmpName = tmpFile.name
+        pickle.dump(entry, tmpFile)
+      os.replace(tmpName, path)
+    finally :
+      try : os.remove(tmpName)
+      except (TypeError, OSError) :
+        pass
+
+  def remember(self, key, entry):
+    with self.lock:
+      self.entries[key] = entry
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.maxEntries:
+        self.entries.popitem(last=False)
+
+  def __len__(self):
+    return len(self.entries)
+
+def configuredRenderCache(config, version):
+  """
+  Build a render cache as configured by RENDER_CACHE_SIZE (the number
+  of pages kept in memory) and RENDER_CACHE_DIR (the optional on-disk
+  tier) in the TOML configuration.
+
+  :rtype: RenderCache
+  """
+  diskDir = config.get('RENDER_CACHE_DIR') or None
+  if diskDir : diskDir = os.path.abspath(os.path.expanduser(diskDir))
+  return RenderCache(config.get('RENDER_CACHE_SIZE', 256), diskDir, version)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+    Full text search
+    ~~~~~~~~~~~~~~~~
+"""
+
+import math
+import re
+
+TOKEN_REGEX = re.compile(r"\w+", re.U)
+QUERY_REGEX = re.compile(r'"([^"]*)"|(\S+)', re.U)
+
+def tokenize(text):
+  """
+  Split text into (case folded) word tokens.
+
+  :rtype: list
+  """
+  return [ aToken.casefold() for aToken in TOKEN_REGEX.findall(text) ]
+
+def parseQuery(query):
+  """
+  Split a query into its phrases. Quoted text is kept together as one
+  phrase, every other word is a phrase of its own.
+
+  :returns: a list of phrases, each a list of tokens
+  :rtype: list
+  """
+  phrases = []
+  for quoted, bare in QUERY_REGEX.findall(query):
+    tokens = tokenize(quoted if quoted else bare)
+    if tokens : phrases.append(tokens)
+  return phrases
+
+class SearchIndex(object):
+  """
+  An inverted index of the title, tags and body of every page.
+
+  For every term we keep the positions at which it occurs in each
+  page, so that phrases can be matched, and results are ranked using
+  BM25.
+  """
+
+  K1 = 1.2
+  B  = 0.75
+
+  def __init__(self):
+    self.postings    = {}
+    self.docTerms    = {}
+    self.docLengths  = {}
+    self.totalLength = 0
+
+  def __len__(self):
+    return len(self.docLengths)
+
+  def addPage(self, aPage):
+    """
+    Add (or replace) a page in the index.
+    """
+    url = aPage.url
+    if url in self.docLengths : self.removePage(url)
+    tokens = tokenize('\n'.join((aPage.title, aPage.tags, aPage.body or '')))
+    for position, aToken in enumerate(tokens):
+      self.postings.setdefault(aToken, {}).setdefault(url, []).append(position)
+    self.docTerms[url]   = tuple(set(tokens))
+    self.docLengths[url] = len(tokens)
+    self.totalLength += len(tokens)
+
+  def removePage(self, url):
+    """
+    Remove a page from the index.
+    """
+    if url not in self.docLengths : return
+    self.totalLength -= self.docLengths.pop(url)
+    for aTerm in self.docTerms.pop(url):
+      docs = self.postings[aTerm]
+      del docs[url]
+      if not docs : del self.postings[aTerm]
+
+  def phraseDocs(self, phrase):
+    """
+    :returns: the urls of the pages containing the whole phrase
+    :rtype: set
+    """
+    docsList = [ self.postings.get(aTerm, {}) for aTerm in phrase ]
+    candidates = set(min(docsList, key=len))
+    for docs in docsList : candidates.intersection_update(docs)
+    if len(phrase) < 2 : return candidates
+    matched = set()
+    for url in candidates:
+      starts = set(docsList[0][url])
+      for offset, docs in enumerate(docsList[1:], 1):
+        starts.intersection_update(
+          aPosition - offset for aPosition in docs[url]
+        )
+        if not starts : break
+      if starts : matched.add(url)
+    return matched
+
+  def search(self, query):
+    """
+    Find the pages which contain every term and phrase of the query.
+
+    :returns: a list of (url, score) pairs, best match first
+    :rtype: list
+    """
+    phrases = parseQuery(query)
+    if not phrases : return []
+    matched = None
+    for aPhrase in phrases:
+      docs = self.phraseDocs(aPhrase)
+      matched = docs if matched is None else matched & docs
+      if not matched : return []
+
+    numDocs = len(self.docLengths)
+    avgLength = self.totalLength / numDocs
+    scores = dict.fromkeys(matched, 0.0)
+    for aTerm in set(aTerm for aPhrase in phrases for aTerm in aPhrase):
+      docs = self.postings[aTerm]
+      idf = math.log(1 + (numDocs - len(docs) + 0.5) / (len(docs) + 0.5))
+      for url in matched:
+        freq = len(docs[url])
+        norm = self.K1 * (1 - self.B + self.B * self.docLengths[url] / avgLength)
+        scores[url] += idf * freq * (self.K1 + 1) / (freq + norm)
+    return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+"""
+    SQLite pages store
+    ~~~~~~~~~~~~~~~~~~
+
+    An (optional) alternative to the pages cache which keeps the pages,
+    their tags and links, the manifest of the wiki directory and the
+    hashes of the written link maps in a SQLite database, with an FTS5
+    table over the title, tags and body of every page.
+
+    Listing, tag and search views as well as the link maps are then
+    answered by queries, updates are transactional, and nothing needs
+    to hold the whole wiki in memory.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import chain
+import json
+import sqlite3
+
+from mindMapper.graph import shortestPaths
+from mindMapper.search import parseQuery
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+  name  TEXT PRIMARY KEY,
+  value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+  url   TEXT PRIMARY KEY,
+  path  TEXT,
+  mtime INTEGER,
+  size  INTEGER,
+  hash  TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+  id    INTEGER PRIMARY KEY,
+  url   TEXT UNIQUE NOT NULL,
+  title TEXT,
+  tags  TEXT,
+  body  TEXT,
+  meta  TEXT
+);
+CREATE INDEX IF NOT EXISTS pagesByTitle ON pages (title COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS tags (
+  pageId INTEGER NOT NULL REFERENCES pages (id) ON DELETE CASCADE,
+  tag    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tagsByTag  ON tags (tag, pageId);
+CREATE INDEX IF NOT EXISTS tagsByPage ON tags (pageId);
+CREATE TABLE IF NOT EXISTS links (
+  sourceId INTEGER NOT NULL REFERENCES pages (id) ON DELETE CASCADE,
+  target   TEXT NOT NULL,
+  title    TEXT,
+  modifier TEXT
+);
+CREATE INDEX IF NOT EXISTS linksBySource ON links (sourceId);
+CREATE INDEX IF NOT EXISTS linksByTarget ON links (target);
+CREATE TABLE IF NOT EXISTS maps (
+  tag  TEXT PRIMARY KEY,
+  hash TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pagesText USING fts5 (title, tags, body);
+"""
+
+TABLES = ('state', 'files', 'tags', 'links', 'pages', 'maps', 'pagesText')
+
+VORTEX = 'theVortex'
+
+def ftsQuery(query):
+  """
+  Translate a search query (words and quoted phrases, see
+  :func:`~mindMapper.search.parseQuery`) into an FTS5 query matching
+  every phrase.
+
+  :rtype: str
+  """
+  return ' AND '.join(
+    '"' + ' '.join(aPhrase) + '"' for aPhrase in parseQuery(query)
+  )
+
+class SqliteStore(object):
+  """
+  The pages, tags, links and manifest of a wiki held in a SQLite
+  database.
+
+  A store (and its connection) must only be used by the thread which
+  opened it; every web request and the rebuild worker use their own,
+  which is closed when the request (or rebuild) ends.
+  """
+
+  def __init__(self, path, version):
+    self.path    = path
+    self.version = str(version)
+    self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+    self.db.execute("PRAGMA foreign_keys = ON")
+    # the schema only needs setting up once per database file (the
+    # journal mode is kept in the file too), which is when it has no
+    # version or another version
+    try :
+      version = self.state('version')
+    except sqlite3.OperationalError :
+      version = None
+    if version != self.version : self.prepare()
+
+  def prepare(self):
+    """
+    Create the tables of the store, or re-create them if they were
+    made for another version.
+    """
+    self.db.execute("PRAGMA journal_mode = WAL")
+    self.db.executescript(SCHEMA)
+    if self.state('version') != self.version :
+      with self.transaction() :
+        for aTable in TABLES : self.db.execute(f"DROP TABLE IF EXISTS {aTable}")
+      self.db.executescript(SCHEMA)
+      self.setState('version', self.version)
+
+  def close(self):
+    self.db.close()
+
+  @contextmanager
+  def transaction(self):
+    """
+    Run a block of updates as a single transaction, which is rolled
+    back if the block raises.
+    """
+    if self.db.in_transaction :
+      yield
+      return
+    self.db.execute("BEGIN IMMEDIATE")
+    try :
+      yield
+    except BaseException :
+      self.db.execute("ROLLBACK")
+      raise
+    self.db.execute("COMMIT")
+
+  def state(self, name):
+    row = self.db.execute(
+      "SELECT value FROM state WHERE name = ?", (name,)
+    ).fetchone()
+    return row[0] if row else None
+
+  def setState(self, name, value):
+    self.db.execute(
+      "INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (name, value)
+    )
+
+  def clear(self):
+    """
+    Remove every page, file and map (but keep the version).
+    """
+    with self.transaction() :
+      for aTable in ('files', 'tags', 'links', 'pages', 'pagesText') :
+        self.db.execute(f"DELETE FROM {aTable}")
+
+  # the manifest of the wiki directory
+  #
+  def manifest(self):
+    """
+    :returns: the path, mtime, size and hash of every page's file,
+              keyed by url
+    :rtype: dict
+    """
+    return { aUrl : {
+      'path' : aPath, 'mtime' : aMtime, 'size' : aSize, 'hash' : aHash
+    } for aUrl, aPath, aMtime, aSize, aHash in self.db.execute(
+      "SELECT url, path, mtime, size, hash FROM files"
+    ) }
+
+  def putFile(self, url, entry):
+    self.db.execute(
+      "INSERT OR REPLACE INTO files (url, path, mtime, size, hash) "
+      "VALUES (?, ?, ?, ?, ?)",
+      (url, entry['path'], entry['mtime'], entry['size'], entry['hash'])
+    )
+
+  def removeFile(self, url):
+    self.db.execute("DELETE FROM files WHERE url = ?", (url,))
+
+  # the pages
+  #
+  def putPage(self, aPage, tags):
+    """
+    Add (or replace) a page together with its tags and links.
+
+    :param set tags: the tags (maps) of the page, other than 'theVortex'
+    """
+    self.removePage(aPage.url)
+    pageId = self.db.execute(
+      "INSERT INTO pages (url, title, tags, body, meta) "
+      "VALUES (?, ?, ?, ?, ?)",
+      (
+        aPage.url, aPage.title, aPage.tags, aPage.body or '',
+        json.dumps(list(aPage.meta.items()))
+      )
+    ).lastrowid
+    self.db.executemany(
+      "INSERT INTO tags (pageId, tag) VALUES (?, ?)",
+      [ (pageId, aTag) for aTag in sorted(tags) ]
+    )
+    self.db.executemany(
+      "INSERT INTO links (sourceId, target, title, modifier) VALUES (?, ?, ?, ?)",
+      [ (pageId, aTarget, aTitle, aModifier)
+        for aTarget, aTitle, aModifier in aPage.linkTuples ]
+    )
+    self.db.execute(
+      "INSERT INTO pagesText (rowid, title, tags, body) VALUES (?, ?, ?, ?)",
+      (pageId, aPage.title, aPage.tags, aPage.body or '')
+    )
+
+  def removePage(self, url):
+    row = self.db.execute("SELECT id FROM pages WHERE url = ?", (url,)).fetchone()
+    if row is None : return
+    self.db.execute("DELETE FROM pagesText WHERE rowid = ?", row)
+    self.db.execute("DELETE FROM pages WHERE id = ?", row)
+
+  def storedPages(self, sql, params=()):
+    return [
+      StoredPage(self, *aRow) for aRow in self.db.execute(sql, params)
+    ]
+
+  def page(self, url):
+    pages = self.storedPages(
+      "SELECT id, url, title, tags FROM pages WHERE url = ?", (url,)
+    )
+    return pages[0] if pages else None
+
+  def pages(self):
+    """
+    :returns: every page, sorted by title
+    :rtype: list
+    """
+    return self.storedPages(
+      "SELECT id, url, title, tags FROM pages "
+      "ORDER BY title COLLATE NOCASE, url"
+    )
+
+  def taggedPages(self):
+    """
+    :returns: the pages (sorted by title) of every (non empty) tag
+    :rtype: dict
+    """
+    tags = {}
+    for aRow in self.db.execute(
+      "SELECT t.tag, p.id, p.url, p.title, p.tags "
+      "FROM tags t JOIN pages p ON p.id = t.pageId WHERE t.tag != '' "
+      "ORDER BY t.tag, p.title COLLATE NOCASE, p.url"
+    ) :
+      tags.setdefault(aRow[0], []).append(StoredPage(self, *aRow[1:]))
+    return tags
+
+  def pagesWithTag(self, tag):
+    """
+    :returns: the pages (sorted by title) with exactly this tag
+    :rtype: list
+    """
+    return self.storedPages(
+      "SELECT p.id, p.url, p.title, p.tags "
+      "FROM tags t JOIN pages p ON p.id = t.pageId WHERE t.tag = ? "
+      "ORDER BY p.title COLLATE NOCASE, p.url", (tag,)
+    )
+
+  def backlinks(self, url):
+    """
+    :returns: the (source page, modifier) pairs of every link to the
+              url, sorted by source url
+    :rtype: list
+    """
+    return [ (StoredPage(self, *aRow[:4]), aRow[4]) for aRow in self.db.execute(
+      "SELECT DISTINCT s.id, s.url, s.title, s.tags, l.modifier "
+      "FROM links l JOIN pages s ON s.id = l.sourceId WHERE l.target = ? "
+      "ORDER BY s.url, l.modifier", (url,)
+    ) ]
+
+  def tagCounts(self):
+    """
+    :returns: the number of pages of every (non empty) tag
+    :rtype: dict
+    """
+    return dict(self.db.execute(
+      "SELECT tag, count(*) FROM tags WHERE tag != '' GROUP BY tag"
+    ))
+
+  def column(self, pageId, name):
+    row = self.db.execute(
+      f"SELECT {name} FROM pages WHERE id = ?", (pageId,)
+    ).fetchone()
+    return row[0] if row else None
+
+  def links(self, pageId):
+    return self.db.execute(
+      "SELECT target, title, modifier FROM links WHERE sourceId = ? "
+      "ORDER BY rowid", (pageId,)
+    ).fetchall()
+
+  def search(self, query, offset=0, limit=20):
+    """
+    Find the pages which contain every term and phrase of the query.
+
+    :returns: this slice of the matching pages (best match first) and
+              the total number of matching pages
+    :rtype: tuple
+    """
+    match = ftsQuery(query)
+    if not match : return [], 0
+    total = self.db.execute(
+      "SELECT count(*) FROM pagesText WHERE pagesText MATCH ?", (match,)
+    ).fetchone()[0]
+    pages = self.storedPages(
+      "SELECT p.id, p.url, p.title, p.tags "
+      "FROM pagesText JOIN pages p ON p.id = pagesText.rowid "
+      "WHERE pagesText MATCH ? ORDER BY bm25(pagesText), p.url "
+      "LIMIT ? OFFSET ?", (match, limit, offset)
+    )
+    return pages, total
+
+  # the link maps
+  #
+  def mapTags(self):
+    """
+    :returns: the tags of every map there should be
+    :rtype: set
+    """
+    tags = set(aRow[0] for aRow in self.db.execute("SELECT DISTINCT tag FROM tags"))
+    if self.db.execute("SELECT 1 FROM pages LIMIT 1").fetchone() :
+      tags.add(VORTEX)
+    return tags
+
+  def neighbourTags(self, urls):
+    """
+    Collect the tags of every map in which the given pages can appear,
+    that is the pages' own tags together with the tags of every page
+    they link to or which links to them.
+
+    :rtype: set
+    """
+    urls = json.dumps(list(urls))
+    tags = set(aRow[0] for aRow in self.db.execute(
+      "WITH touched AS (SELECT value AS url FROM json_each(?)) "
+      "SELECT DISTINCT tag FROM tags WHERE pageId IN ("
+      "  SELECT id FROM pages WHERE url IN touched "
+      "  UNION SELECT t.id FROM links l "
+      "    JOIN pages s ON s.id = l.sourceId JOIN pages t ON t.url = l.target "
+      "    WHERE s.url IN touched "
+      "  UNION SELECT sourceId FROM links WHERE target IN touched"
+      ")", (urls,)
+    ))
+    tags.add(VORTEX)
+    return tags
+
+  def brokenLinks(self):
+    """
+    :returns: the (source, target) urls of links to missing pages
+    :rtype: list
+    """
+    return self.db.execute(
+      "SELECT s.url, l.target FROM links l JOIN pages s ON s.id = l.sourceId "
+      "WHERE l.target NOT IN (SELECT url FROM pages) ORDER BY s.url, l.rowid"
+    ).fetchall()
+
+  def buildMap(self, tag):
+    """
+    Build the link map of a tag, in the same form as
+    :meth:`~mindMapper.graph.LinkGraph.tagMap`.
+
+    :returns: the map (or None if the tag has no nodes) and the pages
+              of its nodes keyed by url
+    :rtype: tuple
+    """
+    if tag == VORTEX :
+      tagged = "SELECT id FROM pages"
+      params = {}
+    else :
+      tagged = "SELECT pageId FROM tags WHERE tag = :tag"
+      params = { 'tag' : tag }
+    nodes = {}
+    for aRow in self.db.execute(
+      f"WITH tagged AS ({tagged}) "
+      "SELECT id, url, title, tags FROM pages WHERE id IN tagged "
+      "  OR id IN (SELECT l.sourceId FROM links l JOIN pages t ON t.url = l.target "
+      "    WHERE t.id IN tagged) "
+      "  OR url IN (SELECT target FROM links WHERE sourceId IN tagged) "
+      "ORDER BY url", params
+    ) :
+      nodes[aRow[1]] = StoredPage(self, *aRow)
+    if not nodes : return None, nodes
+    links = self.db.execute(
+      f"WITH tagged AS ({tagged}) "
+      "SELECT DISTINCT s.url, t.url, l.modifier FROM links l "
+      "  JOIN pages s ON s.id = l.sourceId JOIN pages t ON t.url = l.target "
+      "WHERE l.sourceId IN tagged OR t.id IN tagged "
+      "ORDER BY s.url, t.url, l.modifier", params
+    ).fetchall()
+    return (list(nodes), links), nodes
+
+  def neighbourhood(self, url, hops=1, modifiers=None, limit=None):
+    """
+    Find the pages within `hops` links (in either direction) of a
+    page, one query per hop, see
+    :meth:`~mindMapper.graph.LinkGraph.neighbourhood`.
+
+    :returns: the urls of the pages (sorted) and the (source url,
+              target url, modifier) of the links between them
+    :rtype: tuple
+    """
+    if self.page(url) is None : return [], []
+    modifierFilter = ""
+    params = {}
+    if modifiers is not None :
+      modifierFilter = "AND l.modifier IN (SELECT value FROM json_each(:modifiers)) "
+      params['modifiers'] = json.dumps(list(modifiers))
+    linksSql = (
+      "SELECT s.url, t.url, l.modifier FROM links l "
+      "  JOIN pages s ON s.id = l.sourceId JOIN pages t ON t.url = l.target "
+      "WHERE {} " + modifierFilter
+    )
+    seen = { url }
+    frontier = [ url ]
+    for _ in range(hops) :
+      nextFrontier = []
+      params['urls'] = json.dumps(frontier)
+      for aRow in self.db.execute(linksSql.format(
+        "(s.url IN (SELECT value FROM json_each(:urls)) "
+        "OR l.target IN (SELECT value FROM json_each(:urls)))"
+      ) + "ORDER BY s.url, l.rowid", params) :
+        for anEnd in aRow[:2] :
+          if anEnd in seen : continue
+          if limit is not None and limit <= len(seen) : break
+          seen.add(anEnd)
+          nextFrontier.append(anEnd)
+      frontier = nextFrontier
+      if not frontier : break
+    params['urls'] = json.dumps(list(seen))
+    links = self.db.execute(linksSql.format(
+      "s.url IN (SELECT value FROM json_each(:urls)) "
+      "AND l.target IN (SELECT value FROM json_each(:urls))"
+    ) + "ORDER BY s.url, t.url, l.modifier", params).fetchall()
+    return sorted(seen), sorted(set(links))
+
+  def paths(self, fromUrl, toUrl, count=1, modifiers=None, tag=None, directed=False):
+    """
+    Find the shortest paths between two pages, one query per level of
+    the search, see :meth:`~mindMapper.graph.LinkGraph.paths`.
+
+    :returns: the urls of the pages on the paths (sorted), the (source
+              url, target url, modifier) of the links along the paths
+              and the urls of every path
+    :rtype: tuple
+    """
+    if self.page(fromUrl) is None or self.page(toUrl) is None : return [], [], []
+    modifierFilter = ""
+    tagFilter = ""
+    params = { 'ends' : json.dumps([ fromUrl, toUrl ]) }
+    if modifiers is not None :
+      modifierFilter = "AND l.modifier IN (SELECT value FROM json_each(:modifiers)) "
+      params['modifiers'] = json.dumps(list(modifiers))
+    if tag is not None and tag != VORTEX :
+      # (the steps may only lead to the ends or to pages with the tag)
+      tagFilter = (
+        "AND ({1}.url IN (SELECT value FROM json_each(:ends)) "
+        "OR {1}.id IN (SELECT pageId FROM tags WHERE tag = :tag)) "
+      )
+      params['tag'] = tag
+    stepsSql = (
+      "SELECT {0}.url, {1}.url FROM links l "
+      "  JOIN pages s ON s.id = l.sourceId JOIN pages t ON t.url = l.target "
+      "WHERE {0}.url IN (SELECT value FROM json_each(:urls)) " +
+      modifierFilter + tagFilter + "ORDER BY {0}.url, l.rowid"
+    )
+
+    def expand(frontier, forwards):
+      params['urls'] = json.dumps(frontier)
+      if not directed : ends = (('s', 't'), ('t', 's'))
+      elif forwards   : ends = (('s', 't'),)
+      else            : ends = (('t', 's'),)
+      for aNode, anOther in ends :
+        yield from self.db.execute(stepsSql.format(aNode, anOther), params)
+
+    paths = shortestPaths(expand, fromUrl, toUrl, count)
+    steps = set()
+    for aPath in paths :
+      steps.update(zip(aPath, aPath[1:]))
+      if not directed : steps.update(zip(aPath[1:], aPath))
+    nodes = sorted(set(chain.from_iterable(paths)))
+    params['urls'] = json.dumps(nodes)
+    links = [ aLink for aLink in self.db.execute(
+      "SELECT DISTINCT s.url, t.url, l.modifier FROM links l "
+      "  JOIN pages s ON s.id = l.sourceId JOIN pages t ON t.url = l.target "
+      "WHERE s.url IN (SELECT value FROM json_each(:urls)) "
+      "  AND t.url IN (SELECT value FROM json_each(:urls)) " +
+      modifierFilter + "ORDER BY s.url, t.url, l.modifier", params
+    ) if aLink[:2] in steps ]
+    return nodes, links, paths
+
+  def mapHashes(self):
+    return dict(self.db.execute("SELECT tag, hash FROM maps"))
+
+  def setMapHash(self, tag, mapHash):
+    if mapHash is None :
+      self.db.execute("DELETE FROM maps WHERE tag = ?", (tag,))
+    else :
+      self.db.execute(
+        "INSERT OR REPLACE INTO maps (tag, hash) VALUES (?, ?)", (tag, mapHash)
+      )
+
+class StoredPage(object):
+  """
+  A page as held in the SQLite store.
+
+  The url, title and tags are read with the page's row; the body,
+  meta data and links are only queried when they are used.
+  """
+
+  __slots__ = ('store', 'pageId', 'url', 'title', 'tags')
+
+  def __init__(self, store, pageId, url, title, tags):
+    self.store  = store
+    self.pageId = pageId
+    self.url    = url
+    self.title  = title
+    self.tags   = tags
+
+  def __repr__(self):
+    return u"<StoredPage: {}>".format(self.url)
+
+  @property
+  def linkTuples(self):
+    return self.store.links(self.pageId)
+
+  @property
+  def links(self):
+    return [ {
+      'source'   : self.url,
+      'target'   : aTarget,
+      'title'    : aTitle,
+      'modifier' : aModifier
+    } for aTarget, aTitle, aModifier in self.linkTuples ]
+
+  @property
+  def body(self):
+    return self.store.column(self.pageId, 'body')
+
+  @property
+  def meta(self):
+    return OrderedDict(json.loads(self.store.column(self.pageId, 'meta')))
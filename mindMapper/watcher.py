@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+    Wiki directory watcher
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Notices pages which are created, edited, moved or deleted directly
+    in the wiki directory and feeds them into the incremental pages
+    cache update. Uses inotify (on Linux) and otherwise falls back to
+    periodically scanning the directory.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from mindMapper.utils import clean_url
+
+#: returned (in the set of touched urls) when the watcher has lost
+#: track of individual pages and the whole directory must be re-synced
+RESCAN = None
+
+def pathToUrl(root, path):
+  """
+  :returns: the url of a markdown file, or None for any other file
+  :rtype: str
+  """
+  if not path.endswith('.md') : return None
+  return clean_url(os.path.relpath(path, root)[:-3])
+
+class PollingWatcher(object):
+  """
+  Watches the wiki directory by scanning it (at most) every `interval`
+  seconds and comparing the mtime and size of every page.
+  """
+
+  def __init__(self, root, interval=2.0):
+    self.root     = os.path.abspath(root)
+    self.interval = interval
+    self.nextScan = time.monotonic() + interval
+    self.state    = self.scan()
+
+  def scan(self):
+    state = {}
+    for cur_dir, _, files in os.walk(self.root):
+      for cur_file in files:
+        url = pathToUrl(self.root, os.path.join(cur_dir, cur_file))
+        if url is None : continue
+        try:
+          stat = os.stat(os.path.join(cur_dir, cur_file))
+        except OSError:
+          continue
+        state[url] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+  def poll(self, timeout):
+    """
+    Wait (up to `timeout` seconds) for pages to change.
+
+    :returns: the urls of the pages which have changed
+    :rtype: set
+    """
+    delay = self.nextScan - time.monotonic()
+    if timeout < delay :
+      time.sleep(max(timeout, 0))
+      return set()
+    if 0 < delay : time.sleep(delay)
+    self.nextScan = time.monotonic() + self.interval
+    newState = self.scan()
+    touched = set()
+    for aUrl, aStamp in newState.items():
+      if self.state.get(aUrl) != aStamp : touched.add(aUrl)
+    touched.update(aUrl for aUrl in self.state if aUrl not in newState)
+    self.state = newState
+    return touched
+
+  def close(self):
+    pass
+
+class InotifyWatcher(object):
+  """
+  Watches the wiki directory (and every sub-directory) using Linux's
+  inotify.
+  """
+
+  IN_MODIFY      = 0x00000002
+  IN_CLOSE_WRITE = 0x00000008
+  IN_MOVED_FROM  = 0x00000040
+  IN_MOVED_TO    = 0x00000080
+  IN_CREATE      = 0x00000100
+  IN_DELETE      = 0x00000200
+  IN_DELETE_SELF = 0x00000400
+  IN_MOVE_SELF   = 0x00000800
+  IN_Q_OVERFLOW  = 0x00004000
+  IN_IGNORED     = 0x00008000
+  IN_ISDIR       = 0x40000000
+
+  WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+  )
+
+  EVENT = struct.Struct('iIII')
+
+  def __init__(self, root):
+    self.root = os.path.abspath(root)
+    libcName = ctypes.util.find_library('c')
+    if not libcName : raise OSError("no C library found")
+    self.libc = ctypes.CDLL(libcName, use_errno=True)
+    try :
+      initInotify = self.libc.inotify_init1
+    except AttributeError :
+      raise OSError("inotify is not available")
+    self.fd = initInotify(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0 :
+      raise OSError(ctypes.get_errno(), "could not initialise inotify")
+    self.watches = {}
+    self.addWatches(self.root)
+
+  def addWatches(self, directory):
+    """
+    Watch a directory tree.
+
+    :returns: the urls of the pages already in the tree
+    :rtype: set
+    """
+    urls = set()
+    for cur_dir, _, files in os.walk(directory):
+      wd = self.libc.inotify_add_watch(
+        self.fd, os.fsencode(cur_dir), self.WATCH_MASK
+      )
+      if 0 <= wd : self.watches[wd] = cur_dir
+      for cur_file in files:
+        url = pathToUrl(self.root, os.path.join(cur_dir, cur_file))
+        if url is not None : urls.add(url)
+    return urls
+
+  def removeWatches(self, directory):
+    """
+    Stop watching a directory tree (which has been moved or deleted),
+    so that no later event is reported under its old path.
+    """
+    prefix = os.path.join(directory, '')
+    for wd, watched in list(self.watches.items()):
+      if watched == directory or watched.startswith(prefix) :
+        del self.watches[wd]
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+  def poll(self, timeout):
+    """
+    Wait (up to `timeout` seconds) for pages to change.
+
+    :returns: the urls of the pages which have changed, which will
+              include RESCAN if whole directories have changed
+    :rtype: set
+    """
+    touched = set()
+    readable, _, _ = select.select([self.fd], [], [], timeout)
+    if not readable : return touched
+    while True :
+      try :
+        data = os.read(self.fd, 65536)
+      except BlockingIOError :
+        break
+      offset = 0
+      while offset < len(data) :
+        wd, mask, _, nameLen = self.EVENT.unpack_from(data, offset)
+        offset += self.EVENT.size
+        name = os.fsdecode(data[offset:offset + nameLen].rstrip(b'\0'))
+        offset += nameLen
+        self.handleEvent(wd, mask, name, touched)
+    return touched
+
+  def handleEvent(self, wd, mask, name, touched):
+    if mask & self.IN_Q_OVERFLOW :
+      touched.add(RESCAN)
+      return
+    if mask & self.IN_IGNORED :
+      self.watches.pop(wd, None)
+      return
+    directory = self.watches.get(wd)
+    if directory is None or not name : return
+    path = os.path.join(directory, name)
+    if mask & self.IN_ISDIR :
+      if mask & (self.IN_CREATE | self.IN_MOVED_TO) :
+        # (a directory moved within the tree is watched afresh under
+        # its new path)
+        touched.update(self.addWatches(path))
+      else :
+        # a whole directory of pages has gone (or moved)
+        if mask & self.IN_MOVED_FROM : self.removeWatches(path)
+        touched.add(RESCAN)
+      return
+    url = pathToUrl(self.root, path)
+    if url is not None : touched.add(url)
+
+  def close(self):
+    os.close(self.fd)
+
+def newWatcher(root, interval=2.0):
+  """
+  :returns: an inotify based watcher if possible, otherwise a polling
+            one
+  """
+  try :
+    return InotifyWatcher(root)
+  except OSError as err :
+    print(f" * Using a polling watcher ({err})")
+    return PollingWatcher(root, interval)
+
+def collectChanges(watcher, debounce=0.5, timeout=1.0):
+  """
+  Wait for a burst of changes (for example a `git pull` touching many
+  pages) to end, that is until nothing has changed for `debounce`
+  seconds.
+
+  :returns: the touched urls (empty if nothing changed within
+            `timeout` seconds)
+  :rtype: set
+  """
+  touched = watcher.poll(timeout)
+  if not touched : return touched
+  while True :
+    more = watcher.poll(debounce)
+    if not more : return touched
+    touched |= more
+
+def applyChanges(wiki, touched):
+  """
+  Feed a set of touched urls into the wiki's incremental pages cache
+  update, then finish the maps it wrote.
+  """
+  if RESCAN in touched :
+    report = wiki.syncPagesCache()
+  else :
+    report = wiki.syncPagesCache(touched)
+  wiki.finishMaps(report)
+
+def watch(watcher, onChanges, debounce=0.5, stopEvent=None):
+  """
+  Pass every (debounced) burst of changes to `onChanges` until
+  `stopEvent` is set (or forever).
+
+  :param function onChanges: called with the set of touched urls, for
+         example `lambda touched: applyChanges(wiki, touched)`
+  """
+  try :
+    while stopEvent is None or not stopEvent.is_set() :
+      touched = collectChanges(watcher, debounce)
+      if touched :
+        print(f" * Noticed changes to {len(touched)} pages")
+        onChanges(touched)
+  finally :
+    watcher.close()
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import os
 import tomllib
 
@@ -9,8 +10,12 @@ from flask import g
 from flask_login import LoginManager
 from werkzeug.local import LocalProxy
 
+from mindMapper.index import SharedIndex
+from mindMapper.renderCache import configuredRenderCache
 from mindMapper.wiki import Wiki
+from mindMapper.web.maps import MapCache
 from mindMapper.web.user import UserManager
+from mindMapper.web.rebuilder import RebuildScheduler
 
 class WikiError(Exception):
   pass
@@ -22,12 +27,30 @@ def get_wiki():
     wiki = g._wiki = Wiki(
       current_app.config['CONTENT_DIR'],
       current_app.config['CONFIG_PATH'],
-      current_app.config['CACHE_PATH']
+      current_app.config['CACHE_PATH'],
+      current_app.extensions['mindMapper.index'],
+      current_app.config.get('JOBS'),
+      current_app.extensions['mindMapper.renderCache']
     )
   return wiki
 
 current_wiki = LocalProxy(get_wiki)
 
+def close_wiki(exception=None):
+  wiki = g.pop('_wiki', None)
+  if wiki is not None:
+    wiki.close()
+
+def get_rebuilder():
+  return current_app.extensions['mindMapper.rebuilder']
+
+current_rebuilder = LocalProxy(get_rebuilder)
+
+def get_maps():
+  return current_app.extensions['mindMapper.maps']
+
+current_maps = LocalProxy(get_maps)
+
 def get_users():
   users = getattr(g, '_users', None)
   if users is None:
@@ -43,9 +66,16 @@ def create_app(ctxMeta):
   app.config['CONFIG_PATH'] = ctxMeta['configPath']
   app.config['CACHE_PATH']  = ctxMeta['cachePath']
   app.config['TITLE'] = u'wiki'
+  app.extensions['mindMapper.index'] = SharedIndex()
+  app.extensions['mindMapper.rebuilder'] = RebuildScheduler(app)
+  app.extensions['mindMapper.maps'] = MapCache()
   try:
     with open(app.config['CONFIG_PATH'], "rb") as tomlFile :
-      tomlData = tomllib.load(tomlFile)
+      tomlBytes = tomlFile.read()
+      tomlData = tomllib.loads(tomlBytes.decode('utf-8'))
+      app.extensions['mindMapper.renderCache'] = configuredRenderCache(
+        tomlData, hashlib.sha1(tomlBytes).hexdigest()
+      )
       nodeMapping = {}
       if 'nodeMapping' in tomlData : nodeMapping = tomlData['nodeMapping']
       linkMapping = {}
@@ -85,6 +115,7 @@ def create_app(ctxMeta):
   if 'SERVER_NAME' not in app.config or app.config['SERVER_NAME'] is None :
     app.config['SERVER_NAME'] = f"{app.config['HOST']}:{app.config['PORT']}"
 
+  app.teardown_appcontext(close_wiki)
   loginmanager.init_app(app)
 
   from mindMapper.web.routes import bp
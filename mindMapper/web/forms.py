@@ -31,12 +31,22 @@ class URLForm(FlaskForm):
         return clean_url(url)
 
 
+class MoveForm(URLForm):
+    rewrite_links = BooleanField(
+        'Update the links to this page',
+        default=True)
+
+
 class SearchForm(FlaskForm):
     term = StringField('', [InputRequired()])
     ignore_case = BooleanField(
         description='Ignore Case',
         # FIXME: default is not correctly populated
         default=True)
+    regex = BooleanField(
+        'Regex',
+        description='Search using a regular expression (slow)',
+        default=False)
 
 
 class EditorForm(FlaskForm):
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+    Concept map cache
+    ~~~~~~~~~~~~~~~~~
+"""
+from datetime import datetime
+from datetime import timezone
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from mindMapper.cluster import ClusterTree
+
+
+class MapEntry(object):
+    """
+    The serialised (JSON) concept map of one map file, together with
+    its gzipped bytes and the validators used for conditional requests.
+    The views of the map's clusters are built (and kept) as they are
+    asked for.
+    """
+
+    __slots__ = (
+        'stamp', 'data', 'gzipped', 'etag', 'lastModified', 'tree', 'views'
+    )
+
+    def __init__(self, stamp, data):
+        self.stamp = stamp
+        self.data = data
+        # mtime=0 keeps the gzipped bytes (and so their ETag) stable
+        self.gzipped = gzip.compress(data, compresslevel=6, mtime=0)
+        self.etag = hashlib.sha1(data).hexdigest()
+        self.lastModified = datetime.fromtimestamp(
+            stamp[0] // 10**9, tz=timezone.utc)
+        self.tree = None
+        self.views = {}
+
+    def view(self, clusterId):
+        """
+        :returns: the JSON and gzipped JSON of the view of one of the
+                  map's clusters (see :meth:`ClusterTree.view`), or
+                  None if there is no such cluster (or the file is not
+                  a map of nodes and links)
+        :rtype: tuple
+        """
+        if clusterId not in self.views:
+            if self.tree is None:
+                try:
+                    graph = json.loads(self.data)
+                except ValueError:
+                    return None
+                if not (isinstance(graph, dict)
+                        and isinstance(graph.get('nodes'), list)
+                        and isinstance(graph.get('links'), list)):
+                    return None
+                self.tree = ClusterTree(graph)
+            view = self.tree.view(clusterId)
+            if view is None:
+                return None
+            data = json.dumps(view).encode('utf-8')
+            self.views[clusterId] = (
+                data, gzip.compress(data, compresslevel=6, mtime=0))
+        return self.views[clusterId]
+
+
+class MapCache(object):
+    """
+    Keeps the concept maps served by the web app in memory.
+
+    An entry is only re-read when the mtime or size of its map file
+    changes, so the maps written by a rebuild (in this or any other
+    process) are picked up by the next request, while unchanged maps
+    cost a single `fstat`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, path):
+        """
+        :returns: the map stored in the file at `path`, or None if
+                  there is no such map
+        :rtype: MapEntry
+        """
+        try:
+            mapFile = open(path, 'rb')
+        except OSError:
+            with self.lock:
+                self.entries.pop(path, None)
+            return None
+        with mapFile:
+            # maps are replaced (not rewritten) so the open file and its
+            # stat always belong together
+            stat = os.fstat(mapFile.fileno())
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            with self.lock:
+                entry = self.entries.get(path)
+            if entry is not None and entry.stamp == stamp:
+                return entry
+            entry = MapEntry(stamp, mapFile.read())
+        with self.lock:
+            self.entries[path] = entry
+        return entry
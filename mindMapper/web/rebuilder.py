@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+    Rebuild scheduler
+    ~~~~~~~~~~~~~~~~~
+"""
+import threading
+import time
+import traceback
+
+from mindMapper.watcher import RESCAN
+
+
+class RebuildScheduler(object):
+    """
+    Runs pages cache updates on a single worker thread.
+
+    Requests made while an update is running are coalesced into one
+    pending job, so however many pages are saved at the same time
+    there is at most one update running and one waiting. Each request
+    is given the number of the job which will include it, which can be
+    compared against :meth:`status`.
+
+    The maps written by an update are finished (see
+    :meth:`Wiki.finishMap`) one at a time on the same thread, but only
+    while there is no update waiting, so that laying out and clustering
+    large maps never holds up the pages cache.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.condition = threading.Condition()
+        self.thread = None
+        self.urls = set()
+        self.rescan = False
+        self.full = False
+        self.unfinished = set()
+        self.running = False
+        self.requested = 0
+        self.completed = 0
+        self.lastError = None
+        self.lastDuration = None
+
+    def submit(self, urls=(), rescan=False, full=False):
+        """
+        Ask for the pages cache to be brought up to date.
+
+        :param list urls: the urls of pages which may have changed
+        :param bool rescan: re-check every page in the wiki directory
+        :param bool full: rebuild the whole pages cache
+
+        :returns: the number of the job which will include this request
+        :rtype: int
+        """
+        urls = set(urls)
+        if RESCAN in urls:
+            urls.discard(RESCAN)
+            rescan = True
+        with self.condition:
+            if not (urls or rescan or full):
+                return self.requested
+            if not self.hasPending():
+                self.requested += 1
+            self.urls |= urls
+            self.rescan = self.rescan or rescan
+            self.full = self.full or full
+            self.start()
+            return self.requested
+
+    def finishMaps(self, tags):
+        """
+        Ask for some maps to be finished (see :meth:`Wiki.finishMap`),
+        once there are no updates waiting.
+
+        :param list tags: the tags of the maps
+        """
+        with self.condition:
+            self.unfinished |= set(tags)
+            if self.unfinished:
+                self.start()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.work, name='mindMapper-rebuilder', daemon=True
+            )
+            self.thread.start()
+        self.condition.notify_all()
+
+    def hasPending(self):
+        return bool(self.urls) or self.rescan or self.full
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not (self.hasPending() or self.unfinished):
+                    self.condition.wait()
+                if not self.hasPending():
+                    tag = min(self.unfinished)
+                    self.unfinished.discard(tag)
+                    job = None
+                else:
+                    urls, rescan, full = self.urls, self.rescan, self.full
+                    self.urls, self.rescan, self.full = set(), False, False
+                    self.running = True
+                    job = self.requested
+            if job is None:
+                self.finish(tag)
+                continue
+            start = time.monotonic()
+            error = None
+            tags = ()
+            try:
+                tags = self.run(urls, rescan, full) or ()
+            except Exception:
+                error = traceback.format_exc()
+                print(error)
+            with self.condition:
+                self.running = False
+                self.completed = job
+                self.lastError = error
+                self.lastDuration = time.monotonic() - start
+                self.unfinished |= set(tags)
+                self.condition.notify_all()
+
+    def run(self, urls, rescan, full):
+        """
+        :returns: the tags of the maps written which are still to be
+                  finished
+        :rtype: list
+        """
+        from mindMapper.web import current_wiki
+        with self.app.app_context():
+            if full:
+                report = current_wiki.rebuildPagesCache()
+            elif rescan:
+                report = current_wiki.syncPagesCache()
+            else:
+                report = current_wiki.syncPagesCache(urls)
+            return current_wiki.unfinishedMaps(report)
+
+    def finish(self, tag):
+        from mindMapper.web import current_wiki
+        try:
+            with self.app.app_context():
+                current_wiki.finishMap(tag)
+        except Exception:
+            print(traceback.format_exc())
+
+    def wait(self, job, timeout=None):
+        """
+        Wait for the given job to complete.
+
+        :returns: whether or not the job has completed
+        :rtype: bool
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: job <= self.completed, timeout
+            )
+
+    def status(self):
+        with self.condition:
+            if self.running:
+                state = 'running'
+            elif self.hasPending():
+                state = 'pending'
+            else:
+                state = 'idle'
+            return {
+                'state': state,
+                'requested': self.requested,
+                'completed': self.completed,
+                'lastError': self.lastError,
+                'lastDuration': self.lastDuration,
+                'unfinishedMaps': len(self.unfinished),
+            }
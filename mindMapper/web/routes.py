@@ -3,8 +3,14 @@
     Routes
     ~~~~~~
 """
+import hashlib
+import os
+import re
+
+from flask import abort
 from flask import Blueprint
 from flask import flash
+from flask import jsonify
 from flask import redirect
 from flask import render_template
 from flask import request
@@ -14,14 +20,18 @@ from flask_login import current_user
 from flask_login import login_required
 from flask_login import login_user
 from flask_login import logout_user
+from werkzeug.security import safe_join
 
 from mindMapper.processor import Processor
 from mindMapper.web.forms import EditorForm
 from mindMapper.web.forms import LoginForm
+from mindMapper.web.forms import MoveForm
 from mindMapper.web.forms import SearchForm
 from mindMapper.web.forms import URLForm
 from mindMapper.web.forms import RegistrationForm
+from mindMapper.web import current_maps
 from mindMapper.web import current_wiki
+from mindMapper.web import current_rebuilder
 from mindMapper.web import current_users
 from mindMapper.web.user import protect
 from mindMapper.web.user import UserManager
@@ -53,6 +63,57 @@ def display(url):
     return render_template('page.html', page=page)
 
 
+def map_path(url):
+    """
+    :returns: the path of the concept map served for a url, either one
+              of the link maps (in the `maps` directory) or the JSON
+              next to a page (see `Page.hasMap`), or None for any other
+              JSON file, above all the users file
+    """
+    path = safe_join(current_wiki.root, url + '.json')
+    if path is None:
+        return None
+    path = os.path.abspath(path)
+    if path == os.path.abspath(current_users.file):
+        return None
+    mapsDir = os.path.dirname(current_wiki.mapPath('map'))
+    if path.startswith(mapsDir + os.sep) or current_wiki.exists(url):
+        return path
+    return None
+
+
+@bp.route('/map/<path:url>.json')
+@protect
+def map_json(url):
+    path = map_path(url)
+    entry = current_maps.get(path) if path else None
+    if entry is None:
+        abort(404)
+    # either the whole map or the view of one of its clusters
+    cluster = request.args.get('cluster')
+    data, gzipped, etag = entry.data, entry.gzipped, entry.etag
+    if cluster is not None:
+        view = entry.view(cluster)
+        if view is None:
+            abort(404)
+        data, gzipped = view
+        etag = f"{entry.etag}-{hashlib.sha1(cluster.encode('utf-8')).hexdigest()[:12]}"
+    response = current_app.response_class(mimetype='application/json')
+    # always revalidate, which costs one round trip (and no body) for
+    # an unchanged map
+    response.cache_control.no_cache = True
+    response.last_modified = entry.lastModified
+    response.vary.add('Accept-Encoding')
+    if 'gzip' in request.accept_encodings:
+        response.set_data(gzipped)
+        response.content_encoding = 'gzip'
+        response.set_etag(etag + '-gzip')
+    else:
+        response.set_data(data)
+        response.set_etag(etag)
+    return response.make_conditional(request)
+
+
 @bp.route('/create/', methods=['GET', 'POST'])
 @login_required
 @protect
@@ -77,7 +138,7 @@ def edit(url):
         page.save()
         #current_wiki.markRebuildPagesCache()
         flash('"%s" was saved.' % page.title, 'success')
-        return redirect(url_for('mindMapper.rebuild', url=url))
+        return redirect(url_for('mindMapper.rebuild', url=url, changed=url))
     return render_template('editor.html', form=form, page=page)
 
 
@@ -96,11 +157,20 @@ def preview(url):
 @protect
 def move(url):
     page = current_wiki.get_or_404(url)
-    form = URLForm(obj=page)
+    form = MoveForm(obj=page)
     if form.validate_on_submit():
         newurl = form.url.data
-        renamed = current_wiki.move(url, newurl)
-        return redirect(url_for('mindMapper.rebuild', url=renamed))
+        linking = []
+        if form.rewrite_links.data:
+            linking = [
+                source.url for source, _ in current_wiki.get_backlinks(url)
+                if source.url != url
+            ]
+        renamed = current_wiki.move(
+            url, newurl, rewrite_links=form.rewrite_links.data)
+        return redirect(url_for(
+            'mindMapper.rebuild', url=renamed, changed=[renamed] + linking,
+            removed=url))
     return render_template('move.html', form=form, page=page)
 
 
@@ -111,20 +181,31 @@ def delete(url):
     page = current_wiki.get_or_404(url)
     current_wiki.delete(url)
     flash('Page "%s" was deleted.' % page.title, 'success')
-    return redirect(url_for('mindMapper.rebuild', url='home'))
+    return redirect(url_for('mindMapper.rebuild', url='home', removed=url))
 
 @bp.route('/rebuild/<path:url>/')
 @login_required
 @protect
 def rebuild(url) :
-    current_wiki.rebuildPagesCache()
+    changed = request.args.getlist('changed')
+    removed = request.args.getlist('removed')
+    # the pages cache is brought up to date in the background
+    if changed or removed :
+        current_rebuilder.submit(changed + removed)
+    else :
+        current_rebuilder.submit(full=True)
     #flash('The pages cache has been rebuilt')
     return redirect(url_for('mindMapper.display', url=url))
 
+@bp.route('/rebuild/status')
+@protect
+def rebuild_status() :
+    return jsonify(current_rebuilder.status())
+
 @bp.route('/tags/')
 @protect
 def tags():
-    tags = current_wiki.get_tags()
+    tags = current_wiki.get_tag_counts()
     return render_template('tags.html', tags=tags)
 
 
@@ -137,15 +218,98 @@ def tag(name):
     )
 
 
+@bp.route('/backlinks/<path:url>/')
+@protect
+def backlinks(url):
+    backlinks = current_wiki.get_backlinks(url)
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'url': url,
+            'backlinks': [
+                {'source': source.url, 'title': source.title, 'modifier': modifier}
+                for source, modifier in backlinks
+            ],
+        })
+    return render_template(
+        'backlinks.html', url=url, page=current_wiki.get(url),
+        backlinks=backlinks
+    )
+
+
+@bp.route('/graph/<path:url>/')
+@protect
+def graph(url):
+    hops = max(request.args.get('hops', 1, type=int), 0)
+    modifiers = [
+        modifier.strip()
+        for modifier in request.args.get('modifiers', '').split(',')
+        if modifier.strip()
+    ]
+    if request.args.get('format') == 'json':
+        graph = current_wiki.get_neighbourhood(
+            url, hops, modifiers or None,
+            limit=current_app.config.get('GRAPH_NODE_LIMIT', 1000))
+        if not graph['nodes']:
+            abort(404)
+        return jsonify(graph)
+    page = current_wiki.get_or_404(url)
+    return render_template(
+        'graph.html', page=page, hops=hops, modifiers=modifiers)
+
+
+@bp.route('/path/')
+@protect
+def path():
+    source = request.args.get('from', '').strip()
+    target = request.args.get('to', '').strip()
+    count = min(max(request.args.get('count', 1, type=int), 1), 10)
+    modifiers = [
+        modifier.strip()
+        for modifier in request.args.get('modifiers', '').split(',')
+        if modifier.strip()
+    ]
+    tag = request.args.get('tag', '').strip() or None
+    directed = bool(request.args.get('directed'))
+    if request.args.get('format') == 'json':
+        if not (current_wiki.exists(source) and current_wiki.exists(target)):
+            abort(404)
+        return jsonify(current_wiki.get_paths(
+            source, target, count, modifiers or None, tag, directed))
+    return render_template(
+        'path.html', source=source, target=target, count=count,
+        modifiers=modifiers, tag=tag, directed=directed)
+
+
 @bp.route('/search/', methods=['GET', 'POST'])
 @protect
 def search():
     form = SearchForm()
     if form.validate_on_submit():
-        results = current_wiki.search(form.term.data, form.ignore_case.data)
-        return render_template('search.html', form=form,
-                               results=results, search=form.term.data)
-    return render_template('search.html', form=form, search=None)
+        term = form.term.data
+        page = 1
+    elif request.args.get('q'):
+        term = form.term.data = request.args['q']
+        form.ignore_case.data = bool(request.args.get('ignore_case'))
+        form.regex.data = bool(request.args.get('regex'))
+        page = request.args.get('page', 1, type=int)
+    else:
+        return render_template('search.html', form=form, search=None)
+
+    per_page = current_app.config.get('SEARCH_PAGE_SIZE', 20)
+    if form.regex.data:
+        # the slow path, which scans every page
+        try:
+            matched = current_wiki.search(term, form.ignore_case.data)
+        except re.error as err:
+            flash('Invalid regular expression: %s' % err, 'error')
+            matched = []
+        start = (max(page, 1) - 1) * per_page
+        results, total = matched[start:start + per_page], len(matched)
+    else:
+        results, total = current_wiki.search_pages(term, page, per_page)
+    return render_template('search.html', form=form, results=results,
+                           search=term, total=total, page=page,
+                           pages=(total + per_page - 1) // per_page)
 
 
 @bp.route('/user/login/', methods=['GET', 'POST'])
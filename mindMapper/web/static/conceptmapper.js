@@ -2,6 +2,15 @@
 //
 // REQUIRES graph GLOBAL variable.
 //
+// If every node of the graph already has a position (mindMapper can lay
+// out the maps, and always lays out the top level of clustered maps)
+// the graph is simply drawn, and the force simulation only runs while
+// a node is being dragged.
+//
+// Large maps are clustered; their graph then starts with the top level
+// clusters, and double clicking a cluster fetches its contents from
+// mapUrl (a GLOBAL variable) and shows them in its place.
+//
 // the following has been modified from:
 // https://bl.ocks.org/mbostock/2675ff61ea5e063ede2b5d63c08020c7
 // https://bl.ocks.org/puzzler10/4438752bb93f45dc5ad5214efaa12e4a
@@ -48,26 +57,67 @@ function drag() {
       .on("end", dragended);
 }
 
+// pages are sized by their PageRank (which averages 1 over a map)
+function radius(d) {
+  if (d.nodeType === "cluster") return 2.5 + Math.sqrt(d.size);
+  return 2.5 * Math.sqrt(Math.max(1, d.pageRank || 1));
+}
+
 function nodeClicked(event, d, i) {
   if (event.defaultPrevented) return; // dragged
+  if (d.nodeType === "cluster") return;
 
   var thisNode = d3.select(this);
 
-  if (+thisNode.attr("r") < 4) {
-    thisNode.transition()
-      .attr("fill", "red")
-      .attr("r",  5);
-  } else {
-    thisNode.transition()
-      .attr("fill", "black")
-      .attr("r",  2.5);
-  }
+  d.selected = !d.selected;
+  thisNode.transition()
+    .attr("fill", d.selected ? "red" : d.color)
+    .attr("r", radius(d) + (d.selected ? 2.5 : 0));
 }
 
 function nodeDblClicked(event, d) {
   if (event.defaultPrevented) return; // dragged
 
-  window.open(d.id);
+  if (d.nodeType === "cluster") expandCluster(d);
+  else window.open(d.id);
+}
+
+// replace a cluster by its contents
+function expandCluster(cluster) {
+  d3.json(mapUrl + "?cluster=" + encodeURIComponent(cluster.cluster))
+    .then(function(view) {
+      // the contents start out (if they have not been laid out) where
+      // the cluster was, and are then settled by a short simulation
+      var unplaced = false;
+      view.nodes.forEach(function(d) {
+        if (d.x === undefined || d.y === undefined) {
+          unplaced = true;
+          d.x = cluster.x + Math.random() - 0.5;
+          d.y = cluster.y + Math.random() - 0.5;
+        }
+      });
+      graph.nodes = graph.nodes.filter(function(d) { return d !== cluster; })
+        .concat(view.nodes);
+      graph.links = graph.links.filter(function(d) {
+        return d.source !== cluster && d.target !== cluster;
+      }).concat(view.links);
+      // attach the links leaving the cluster to whatever is showing
+      // their other end
+      var shown = new Set(graph.nodes.map(function(d) { return d.id; }));
+      view.external.forEach(function(e) {
+        var outside = e.outside.find(function(id) { return shown.has(id); });
+        if (outside === undefined) return;
+        graph.links.push({
+          source : e.outgoing ? e.inside : outside,
+          target : e.outgoing ? outside : e.inside,
+          linkType : "cluster",
+          weight : e.weight,
+          color : "grey"
+        });
+      });
+      draw();
+      if (unplaced) simulation.alpha(0.3).restart();
+    });
 }
 
 var svg = d3.select("svg"),
@@ -79,9 +129,13 @@ function zoomActions(event) {
   outerSvg.attr("transform", event.transform);
 }
 
-  svg.call(d3.zoom()
+// the maps are centred on the origin, so start with it in the middle
+var zoom = d3.zoom()
     .scaleExtent([1 / 4, 8])
-    .on("zoom", zoomActions));
+    .on("zoom", zoomActions);
+
+  svg.call(zoom)
+    .call(zoom.transform, d3.zoomIdentity.translate(width / 2, height / 2));
 
   svg.append("defs").append("marker")
       .attr("id", "arrow")
@@ -99,41 +153,76 @@ function zoomActions(event) {
 var simulation = d3.forceSimulation()
     .force("link", d3.forceLink().id(function(d) { return d.id; }))
     .force("charge", d3.forceManyBody())
-    .force("center", d3.forceCenter(width / 2, height / 2));
+    .force("center", d3.forceCenter(0, 0));
 
-var link = outerSvg.append("g")
-    .attr("class", "links")
-    .selectAll("line")
-    .data(graph.links)
-    .enter().append("line")
-      .attr("stroke", function(d) { return d.color; })
-      .attr("marker-end", "url(#arrow)");
+var linkGroup = outerSvg.append("g")
+    .attr("class", "links");
 
-link.append("title")
-  .text(function(d) { return d.linkType; });
+var nodeGroup = outerSvg.append("g")
+    .attr("class", "nodes");
 
-var node = outerSvg.append("g")
-    .attr("class", "nodes")
-    .selectAll("circle")
-    .data(graph.nodes)
-    .enter().append("circle")
-      .attr("fill", function(d) { return d.color; })
-      .attr("r", 2.5)
-      .call(drag())
-      .on("click", nodeClicked)
-      .on("dblclick", nodeDblClicked);
-
-node.append("title")
-    .text(function(d) { return d.title; });
-
-node.append("a")
-    .attr("href", function(d) { return d.id ; })
-    .text(function(d) { return d.id ; });
+var link, node;
 
-simulation
-   .nodes(graph.nodes)
-   .on("tick", ticked);
-
-simulation.force("link")
-   .links(graph.links);
+function draw() {
+  link = linkGroup
+    .selectAll("line")
+    .data(graph.links, function(d) {
+      return (d.source.id || d.source) + " " + (d.target.id || d.target) +
+        " " + d.linkType;
+    })
+    .join(function(enter) {
+      var line = enter.append("line")
+        .attr("stroke", function(d) { return d.color; })
+        .attr("stroke-width", function(d) {
+          return d.weight ? 1 + Math.log(d.weight) : 1;
+        })
+        .attr("marker-end", "url(#arrow)");
+      line.append("title")
+        .text(function(d) { return d.linkType; });
+      return line;
+    });
+
+  node = nodeGroup
+    .selectAll("circle")
+    .data(graph.nodes, function(d) { return d.id; })
+    .join(function(enter) {
+      var circle = enter.append("circle")
+        .attr("fill", function(d) { return d.color; })
+        .attr("r", radius)
+        .call(drag())
+        .on("click", nodeClicked)
+        .on("dblclick", nodeDblClicked);
+      circle.append("title")
+        .text(function(d) {
+          if (d.pageRank === undefined) return d.title;
+          return d.title + "\nPageRank " + d.pageRank +
+            ", betweenness " + d.betweenness +
+            "\n" + d.inDegree + " links in, " + d.outDegree + " out";
+        });
+      circle.append("a")
+        .attr("href", function(d) { return d.id ; })
+        .text(function(d) { return d.id ; });
+      return circle;
+    });
+
+  // (checked before the simulation gives every node a position)
+  var positioned = graph.nodes.every(function(d) {
+    return d.x !== undefined && d.y !== undefined;
+  });
+
+  simulation
+     .nodes(graph.nodes)
+     .on("tick", ticked);
+
+  simulation.force("link")
+     .links(graph.links);
+
+  if (positioned) {
+    simulation.alpha(0).stop();
+    ticked();
+  } else {
+    simulation.alpha(1).restart();
+  }
+}
 
+draw();
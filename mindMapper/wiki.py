@@ -4,9 +4,14 @@
     ~~~~
 """
 
+import hashlib
 import json
 import os
 import pickle
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 from tempfile import NamedTemporaryFile
 import tomllib
 
@@ -15,22 +20,72 @@ from flask import abort
 from mindMapper.utils import clean_url
 from mindMapper.utils import InvalidFileException
 from mindMapper.page  import Page
+from mindMapper.processor import rewriteWikilinks
+from mindMapper.cluster import clusterGraph
+from mindMapper.cluster import ClusterTree
+from mindMapper.cluster import ROOT
+from mindMapper.cluster import MIN_NODES
+from mindMapper.graph import LinkGraph
+from mindMapper.index import BacklinkIndex
+from mindMapper.index import PagesIndex
+from mindMapper.index import SharedIndex
+from mindMapper.index import TagIndex
+from mindMapper.layout import layoutGraph
+from mindMapper.layout import MAX_NODES as LAYOUT_MAX_NODES
+from mindMapper.metrics import CENTRALITY
+from mindMapper.metrics import METRICS
+from mindMapper.metrics import measureGraph
+from mindMapper.search import SearchIndex
+from mindMapper.renderCache import configuredRenderCache
+from mindMapper.cacheStore import InvalidCacheException
+from mindMapper.cacheStore import PagesStore
+from mindMapper.cacheStore import writeStore
+from mindMapper.sqliteStore import SqliteStore
+
+CACHE_VERSION = 12
 
 class Wiki(object):
-  def __init__(self, root, configPath, cachePath):
+  def __init__(
+    self, root, configPath, cachePath,
+    sharedIndex=None, jobs=None, renderCache=None
+  ):
     self.root          = os.path.abspath(root)
     self.configPath    = os.path.abspath(configPath)
     self.rebuildMarker = os.path.abspath(os.path.join(self.root, '.rebuild'))
     self.pagesCache    = os.path.abspath(cachePath)
+    if sharedIndex is None : sharedIndex = SharedIndex()
+    self.sharedIndex   = sharedIndex
 
     with open(configPath, "rb") as tomlFile :
-      tomlData = tomllib.load(tomlFile)
+      tomlBytes = tomlFile.read()
+      self.configHash = hashlib.sha1(tomlBytes).hexdigest()
+      tomlData = tomllib.loads(tomlBytes.decode('utf-8'))
       self.nodeMapping = {}
       if 'nodeMapping' in tomlData : self.nodeMapping = tomlData['nodeMapping']
       self.nodeMapping['default'] = {'color' : 'black' }
       self.linkMapping = {}
       if 'linkMapping' in tomlData : self.linkMapping = tomlData['linkMapping']
       self.linkMapping['default'] = {'color' : 'black' }
+      if jobs is None : jobs = tomlData.get('JOBS', 1)
+      if renderCache is None :
+        renderCache = configuredRenderCache(tomlData, self.configHash)
+      # where the pages are stored: 'cache' (the memory-mapped pages
+      # cache) or 'sqlite'
+      self.storage = tomlData.get('STORAGE', 'cache')
+      # whether or not to lay out the maps (rather than leave it to the
+      # browser)
+      self.layoutMaps = tomlData.get('LAYOUT_MAPS', False)
+      # maps with more than this many nodes are never laid out
+      self.layoutMaxNodes = tomlData.get('LAYOUT_MAX_NODES', LAYOUT_MAX_NODES)
+      # maps with (at least) this many nodes are clustered
+      self.clusterMinNodes = tomlData.get('CLUSTER_MIN_NODES', MIN_NODES)
+      databasePath = tomlData.get('SQLITE_PATH') or self.pagesCache + '.sqlite'
+    self.databasePath = os.path.abspath(os.path.expanduser(databasePath))
+    self._database = None
+    self.renderCache = renderCache
+    # the number of processes used to load pages (0 => one per core)
+    if not jobs : jobs = os.cpu_count() or 1
+    self.jobs = jobs
 
   def path(self, url):
     return os.path.join(self.root, url + '.md')
@@ -42,7 +97,7 @@ class Wiki(object):
   def get(self, url):
     path = os.path.join(self.root, url + '.md')
     if self.exists(url):
-      return Page(path, url)
+      return Page(path, url, renderCache=self.renderCache)
     return None
 
   def get_or_404(self, url):
@@ -55,9 +110,18 @@ class Wiki(object):
     path = self.path(url)
     if self.exists(url):
       return False
-    return Page(path, url, new=True)
+    return Page(path, url, new=True, renderCache=self.renderCache)
+
+  def move(self, url, newurl, rewrite_links=False):
+    """
+    Move (rename) a page.
 
-  def move(self, url, newurl):
+    :param bool rewrite_links: whether or not to point the wikilinks
+           of the pages linking to this page at its new url
+
+    :returns: the (cleaned) new url of the page
+    :rtype: str
+    """
     newurl = clean_url(newurl)
     source = os.path.join(self.root, url) + '.md'
     target = os.path.join(self.root, newurl) + '.md'
@@ -77,9 +141,52 @@ class Wiki(object):
     folder = os.path.dirname(target)
     if not os.path.exists(folder):
       os.makedirs(folder)
+    if rewrite_links : self.rewriteLinks(url, newurl)
     os.rename(source, target)
     return newurl
 
+  def rewriteLinks(self, url, newurl) :
+    """
+    Point every wikilink to `url` at `newurl` instead. Only the pages
+    the backlinks index lists as linking to `url` are read, and their
+    new contents are all written to temporary files before any page
+    is replaced.
+
+    :returns: the urls of the pages which were rewritten
+    :rtype: list
+    """
+    rewritten = {}
+    for aSource in sorted(set(aPage.url for aPage, _ in self.get_backlinks(url))) :
+      path = self.path(aSource)
+      try :
+        with open(path, 'r', encoding='utf-8') as aFile :
+          content = aFile.read()
+      except OSError :
+        continue
+      content, count = rewriteWikilinks(content, url, newurl)
+      if count : rewritten[aSource] = content
+
+    tmpNames = {}
+    try :
+      for aSource, content in rewritten.items() :
+        path = self.path(aSource)
+        with NamedTemporaryFile(
+          'w', encoding='utf-8', dir=os.path.dirname(path), delete=False
+        ) as tmpFile :
+          tmpNames[aSource] = tmpFile.name
+          tmpFile.write(content)
+        shutil.copymode(path, tmpFile.name)
+      for aSource, tmpName in tmpNames.items() :
+        os.replace(tmpName, self.path(aSource))
+    finally :
+      for tmpName in tmpNames.values() :
+        try : os.remove(tmpName)
+        except OSError :
+          pass
+    if rewritten :
+      print(f" * Rewrote the links to {url} in {len(rewritten)} pages")
+    return list(rewritten)
+
   def delete(self, url):
     path = self.path(url)
     if not self.exists(url):
@@ -94,8 +201,37 @@ class Wiki(object):
     :returns: a list of all the wiki pages
     :rtype: list
     """
-    pages = self.loadPagesCache()
-    return sorted(pages, key=lambda x: x.title.lower())
+    if self.usesDatabase() : return self.database().pages()
+    return self.pagesIndex().pages
+
+  def usesDatabase(self) :
+    return self.storage == 'sqlite'
+
+  def database(self) :
+    """
+    The SQLite store of this wiki (opened on first use).
+
+    :rtype: SqliteStore
+    """
+    if self._database is None :
+      self._database = SqliteStore(self.databasePath, CACHE_VERSION)
+    return self._database
+
+  def close(self) :
+    """
+    Close the SQLite store of this wiki, if it was opened.
+    """
+    if self._database is not None :
+      self._database.close()
+      self._database = None
+
+  def pagesIndex(self):
+    """
+    The current in-memory snapshot of the pages cache.
+
+    :rtype: PagesIndex
+    """
+    return self.sharedIndex.get(self.pagesCache, self.loadPagesIndex)
 
   def index_by(self, key):
     """
@@ -122,29 +258,122 @@ class Wiki(object):
   #  return pages.get(title)
 
   def get_tags(self):
-    pages = self.index()
-    tags = {}
-    for page in pages:
-      pagetags = page.tags.split(',')
-      for tag in pagetags:
-        tag = tag.strip()
-        if tag == '':
-          continue
-        elif tags.get(tag):
-          tags[tag].append(page)
-        else:
-          tags[tag] = [page]
-    return tags
+    """
+    :returns: the pages (sorted by title) of every tag
+    :rtype: dict
+    """
+    if self.usesDatabase() : return self.database().taggedPages()
+    return self.pagesIndex().tags
+
+  def get_tag_counts(self):
+    """
+    :returns: the number of pages of every tag
+    :rtype: dict
+    """
+    if self.usesDatabase() : return self.database().tagCounts()
+    return self.pagesIndex().tagIndex.counts()
 
   def index_by_tag(self, tag):
-    pages = self.index()
-    tagged = []
-    for page in pages:
-      if tag in page.tags:
-        tagged.append(page)
-    return sorted(tagged, key=lambda x: x.title.lower())
+    """
+    :returns: the pages with exactly the given tag, sorted by title
+    :rtype: list
+    """
+    if self.usesDatabase() : return self.database().pagesWithTag(tag)
+    return self.pagesIndex().tagged(tag)
+
+  def get_backlinks(self, url):
+    """
+    Find the links to a page (which need not exist).
+
+    :returns: the (source page, modifier) pairs of every link to the
+              page, sorted by source url
+    :rtype: list
+    """
+    if self.usesDatabase() : return self.database().backlinks(url)
+    pagesIndex = self.pagesIndex()
+    return [
+      (pagesIndex.get(aSource), aModifier)
+      for aSource, aModifier in pagesIndex.backlinks.links(url)
+    ]
+
+  def get_neighbourhood(self, url, hops=1, modifiers=None, limit=None):
+    """
+    Find the pages within `hops` links (in either direction) of a
+    page, see :meth:`~mindMapper.graph.LinkGraph.neighbourhood`.
+
+    :returns: the graph (as loaded by the concept mapper) of the pages
+              and the links between them
+    :rtype: dict
+    """
+    if self.usesDatabase() :
+      database = self.database()
+      urls, links = database.neighbourhood(url, hops, modifiers, limit)
+      pagesMap = { aUrl : database.page(aUrl) for aUrl in urls }
+    else :
+      pagesIndex = self.pagesIndex()
+      urls, links = pagesIndex.graph.neighbourhood(url, hops, modifiers, limit)
+      pagesMap = { aUrl : pagesIndex.get(aUrl) for aUrl in urls }
+    return self.mapGraph(urls, links, pagesMap)
+
+  def get_paths(self, fromUrl, toUrl, count=1, modifiers=None, tag=None, directed=False):
+    """
+    Find the shortest paths between two pages, see
+    :meth:`~mindMapper.graph.LinkGraph.paths`.
+
+    :returns: the graph (as loaded by the concept mapper) of the pages
+              and links along the paths, together with the ids of the
+              nodes of every path (as 'paths')
+    :rtype: dict
+    """
+    if self.usesDatabase() :
+      database = self.database()
+      urls, links, paths = database.paths(
+        fromUrl, toUrl, count, modifiers, tag, directed
+      )
+      pagesMap = { aUrl : database.page(aUrl) for aUrl in urls }
+    else :
+      pagesIndex = self.pagesIndex()
+      urls, links, paths = pagesIndex.graph.paths(
+        fromUrl, toUrl, count, modifiers, tag, directed
+      )
+      pagesMap = { aUrl : pagesIndex.get(aUrl) for aUrl in urls }
+    graph = self.mapGraph(urls, links, pagesMap)
+    graph['paths'] = [
+      [ '/'+pagesMap[aUrl].url for aUrl in aPath ] for aPath in paths
+    ]
+    return graph
+
+  def search_pages(self, query, page=1, per_page=20):
+    """
+    Search the full text index for pages containing every word and
+    (quoted) phrase of the query.
+
+    :param str query: the words and phrases to search for
+    :param int page: the (1 based) page of results to return
+    :param int per_page: the number of results per page
+
+    :returns: the pages of this page of results, best match first,
+              and the total number of matching pages
+    :rtype: tuple
+    """
+    start = (max(page, 1) - 1) * per_page
+    if self.usesDatabase() :
+      return self.database().search(query, start, per_page)
+    pagesIndex = self.pagesIndex()
+    matched = pagesIndex.search.search(query)
+    return (
+      [ pagesIndex.get(aUrl) for aUrl, _ in matched[start:start + per_page] ],
+      len(matched)
+    )
 
   def search(self, term, ignore_case=True, attrs=('title', 'tags', 'body')):
+    """
+    Search every page for a regular expression. This scans the whole
+    wiki, so use :meth:`search_pages` unless a regex is really needed.
+
+    :returns: the matching pages
+    :rtype: list
+    """
     pages = self.index()
     regex = re.compile(term, re.IGNORECASE if ignore_case else 0)
     matched = []
@@ -158,140 +387,894 @@ class Wiki(object):
   def removePagesCache(self) :
     if os.path.exists(self.pagesCache) : os.remove(self.pagesCache)
 
-  def loadPagesCache(self) :
-    pages = []
-    if os.path.exists(self.pagesCache) :
-      with open(self.pagesCache, 'rb') as pickelFile :
-        pages = pickle.load(pickelFile)
-        print(" * Loaded pages cache")
-    return pages
+  def openStore(self) :
+    """
+    Open the (memory-mapped) pages cache.
 
-  def rebuildPagesCache(self) :
-    print(" * Rebuilding pages cache")
+    :returns: the pages store, or None if there is no (usable) cache
+              on disk
+    :rtype: PagesStore
+    """
+    if not os.path.exists(self.pagesCache) : return None
+    try :
+      return PagesStore(self.pagesCache, CACHE_VERSION)
+    except InvalidCacheException as err :
+      print(f" * Ignoring unreadable pages cache ({err})")
+      return None
 
-    # start by loading all of the pages
-    #
-    pages = []
+  def loadCache(self) :
+    """
+    Load the full pages cache (pages keyed by url together with the
+    manifest and the link maps they produced).
+
+    :returns: the cache dictionary, or None if there is no (usable)
+              cache on disk
+    :rtype: dict
+    """
+    store = self.openStore()
+    if store is None : return None
+    try :
+      cache = store.state()
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) :
+      print(" * Ignoring unreadable pages cache")
+      return None
+    cache['pages'] = store.pages()
+    return cache
+
+  def loadPagesMap(self) :
     pagesMap = {}
+    store = self.openStore()
+    if store :
+      pagesMap = store.pages()
+      print(" * Loaded pages cache")
+    return pagesMap
+
+  def loadPagesCache(self) :
+    return list(self.loadPagesMap().values())
+
+  def loadPagesIndex(self, store=None) :
+    """
+    Build an in-memory index of the pages cache, whose search, tag
+    and backlinks indexes are only unpickled when they are first used.
+
+    :rtype: PagesIndex
+    """
+    if store is None : store = self.openStore()
+    if store is None : return PagesIndex({}, SearchIndex)
+    print(" * Loaded pages cache")
+    return PagesIndex(
+      store.pages(),
+      lambda : store.section('search'),
+      lambda : store.section('tags'),
+      lambda : store.section('backlinks'),
+      lambda : store.section('graph')
+    )
+
+  def saveCache(self, cache) :
+    state = dict(cache)
+    pages = state.pop('pages')
+    tmpName = None
+    try :
+      with NamedTemporaryFile(
+        dir=os.path.abspath(self.root), delete=False
+      ) as tmpFile :
+        tmpName = tmpFile.name
+        writeStore(tmpFile, pages.values(), state, CACHE_VERSION)
+      os.replace(tmpName, self.pagesCache)
+      print(f" * Saved pagesCache to {self.pagesCache}")
+      self.sharedIndex.swap(self.loadPagesIndex(), self.pagesCache)
+    finally :
+      try : os.remove(tmpName)
+      except (TypeError, OSError) :
+        pass
+
+  def walkPages(self) :
+    """
+    Walk the wiki directory tree.
+
+    :returns: a dictionary mapping the url of every markdown file
+              to its path
+    :rtype: dict
+    """
+    paths = {}
     root = os.path.abspath(self.root)
     for cur_dir, _, files in os.walk(root):
       # get the url of the current directory
       cur_dir_url = cur_dir[len(root) + 1:]
       for cur_file in files:
-        path = os.path.join(cur_dir, cur_file)
         if cur_file.endswith('.md'):
           url = clean_url(os.path.join(cur_dir_url, cur_file[:-3]))
-          try:
-            page = Page(path, url)
-            pages.append(page)
-            pagesMap[page.url] = page
-          except InvalidFileException:
-            # for now we just ignore files that are invalid
-            # entirely
-            pass
-    #
-    # now build the link maps
-    #
-    maps = {}
-    for aPage in pages :
-      # insert all nodes
-      pageTags = {}
-      for aTag in aPage.tags.split(',') : pageTags[aTag.strip()] = True
-      pageTags['theVortex'] = True
-      for aTag in pageTags :
-        if aTag not in maps : maps[aTag] = {
-          'nodes' : {},
-          'links' : {}
-        }
-        tagMap = maps[aTag]
-        tagMap['nodes'][aPage.url] = True
-
-      # inseart all links
-      for aLink in aPage.links :
-        sourcePage = pagesMap[aLink['source']]
-        if aLink['target'] not in pagesMap :
-          print(f" * BROKEN LINK: {aLink['source']} -> {aLink['target']}")
-          continue
-        targetPage = pagesMap[aLink['target']]
-        modifier   = aLink['modifier']
-
-        pageTags = {}
-        for aTag in sourcePage.tags.split(',') : pageTags[aTag.strip()] = True
-        for aTag in targetPage.tags.split(',') : pageTags[aTag.strip()] = True
-        pageTags['theVortex'] = True
-        for aTag in pageTags :
-          if aTag not in maps : maps[aTag] = {
-            'nodes' : {},
-            'links' : {}
-          }
-          tagMap = maps[aTag]
-          tagMap['nodes'][sourcePage.url] = True
-          tagMap['nodes'][targetPage.url] = True
-          if sourcePage.url not in tagMap['links'] :
-            tagMap['links'][sourcePage.url] = {}
-          srcMap = tagMap['links'][sourcePage.url]
-          if targetPage.url not in srcMap :
-            srcMap[targetPage.url] = {}
-          srcMap[targetPage.url][modifier] = True
-    #
-    # now save the pages cache
-    #
-    tmpName = None
+          paths[url] = os.path.join(cur_dir, cur_file)
+    return paths
+
+  def manifestEntry(self, path) :
+    """
+    Record the state of a page's file, so that we can later tell
+    whether or not it has changed.
+
+    :returns: a dictionary of the path (relative to the wiki root),
+              mtime, size and content hash of the file
+    :rtype: dict
+    """
+    stat = os.stat(path)
+    return {
+      'path'  : os.path.relpath(path, self.root),
+      'mtime' : stat.st_mtime_ns,
+      'size'  : stat.st_size,
+      'hash'  : fileHash(path)
+    }
+
+  def loadPage(self, url, path=None) :
+    """
+    Load (scan) a single page for the pages cache.
+
+    :returns: the page, or None if the file is missing or invalid
+    :rtype: Page
+    """
+    if path is None : path = self.path(url)
+    return loadPage(url, path)
+
+  def loadPages(self, paths) :
+    """
+    Load (scan) many pages for the pages cache, spreading the work
+    over `self.jobs` worker processes when there is more than one
+    page to load.
+
+    :param dict paths: the paths of the pages to load keyed by url
+
+    :returns: the (valid) pages keyed by url
+    :rtype: dict
+    """
+    pagesMap = {}
+    for page in self.iterPages(paths) : pagesMap[page.url] = page
+    return pagesMap
+
+  def iterPages(self, paths) :
+    """
+    Load many pages (see :meth:`loadPages`), yielding each (valid)
+    page as soon as it has been loaded.
+
+    :param dict paths: the paths of the pages to load keyed by url
+    """
+    if self.jobs < 2 or len(paths) < 2 :
+      for url, path in paths.items() :
+        page = self.loadPage(url, path)
+        if page : yield page
+      return
+
+    jobs = min(self.jobs, len(paths))
+    chunkSize = max(1, len(paths) // (jobs * 4))
+    print(f" * Loading {len(paths)} pages using {jobs} processes")
+    # (workers are spawned rather than forked, as forking a process
+    # with other threads running, such as the web server's, can
+    # deadlock on the locks those threads hold)
+    with ProcessPoolExecutor(
+      max_workers=jobs, mp_context=multiprocessing.get_context('spawn')
+    ) as executor :
+      for page in executor.map(
+        loadPage, paths.keys(), paths.values(), chunksize=chunkSize
+      ) :
+        if page : yield page
+
+  def reportBrokenLinks(self, pagesMap, urls=None) :
+    """
+    Print the links (of the given pages) to pages which do not exist.
+
+    :param urls: if given, only the links of these pages are checked
+    """
+    if urls is None : urls = pagesMap.keys()
+    for aUrl in sorted(urls) :
+      if aUrl not in pagesMap : continue
+      for targetUrl, _, _ in pagesMap[aUrl].linkTuples :
+        if targetUrl not in pagesMap :
+          print(f" * BROKEN LINK: {aUrl} -> {targetUrl}")
+
+  def mapPath(self, aTag) :
+    return os.path.abspath(os.path.join(self.root, 'maps', f"{aTag}.json"))
+
+  def mapGraph(self, urls, mapLinks, pagesMap) :
+    """
+    :param list urls: the urls of the map's pages
+    :param list mapLinks: the (source url, target url, modifier) of
+                          the map's links
+
+    :returns: the (canonically sorted) graph, as loaded by the concept
+              mapper, of a link map
+    :rtype: dict
+    """
+    theMap = { 'nodes' : [], 'links' : []}
+    links  = theMap['links']
+    nodes  = theMap['nodes']
+    for aUrl in urls :
+      aNode = {
+        'id'       : '/'+pagesMap[aUrl].url,
+        'title'    : pagesMap[aUrl].title,
+        'nodeType' : 'default'
+      }
+      for aKey, aValue in self.nodeMapping['default'].items() :
+        aNode[aKey] = aValue
+      nodes.append(aNode)
+    for aSource, aTarget, aModifier in mapLinks :
+      aLink = {
+        'source'   : '/'+pagesMap[aSource].url,
+        'target'   : '/'+pagesMap[aTarget].url,
+        'linkType' : aModifier
+      }
+      linkModifier = aModifier
+      if linkModifier not in self.linkMapping :
+        linkModifier = 'default'
+      for aKey, aValue in self.linkMapping[linkModifier].items() :
+        aLink[aKey] = aValue
+      links.append(aLink)
+    nodes.sort(key=lambda aNode : aNode['id'])
+    links.sort(key=lambda aLink : (aLink['source'], aLink['target'], aLink['linkType']))
+    return theMap
+
+  def readMap(self, aTag) :
+    """
+    :returns: the graph of a link map as it is on disk, or None
+    :rtype: dict
+    """
+    try :
+      with open(self.mapPath(aTag), encoding='utf-8') as tagFile :
+        return json.load(tagFile)
+    except (OSError, ValueError) :
+      return None
+
+  def layoutMap(self, graph) :
+    """
+    Position the nodes of a map's graph (see :mod:`mindMapper.layout`),
+    warm-starting from the positions its nodes already have.
+    """
+    previous = {}
+    for aNode in graph['nodes'] :
+      if 'x' in aNode and 'y' in aNode :
+        previous[aNode['id']] = (aNode['x'], aNode['y'])
+    positions = layoutGraph(
+      [ aNode['id'] for aNode in graph['nodes'] ],
+      [ (aLink['source'], aLink['target']) for aLink in graph['links'] ],
+      previous
+    )
+    for aNode in graph['nodes'] :
+      x, y = positions[aNode['id']]
+      aNode['x'] = round(x, 1)
+      aNode['y'] = round(y, 1)
+
+  def layoutClusters(self, graph) :
+    """
+    Position the top level of a clustered map's graph: its top level
+    clusters and the nodes outside of every cluster, as they are shown
+    by the map's root view (see :meth:`ClusterTree.view`), unless
+    there are more than LAYOUT_MAX_NODES of them.
+    """
+    view = ClusterTree(graph).view(ROOT)
+    if self.layoutMaxNodes < len(view['nodes']) : return
+    positions = layoutGraph(
+      [ aNode['id'] for aNode in view['nodes'] ],
+      [ (aLink['source'], aLink['target']) for aLink in view['links'] ]
+    )
+    items = { aNode['id'] : aNode for aNode in graph['nodes'] }
+    for aCluster in graph['clusters'] : items[aCluster['id']] = aCluster
+    for anId, (x, y) in positions.items() :
+      items[anId]['x'] = round(x, 1)
+      items[anId]['y'] = round(y, 1)
+
+  def measureMap(self, graph, oldGraph=None) :
+    """
+    Add the metrics of every node (see :mod:`mindMapper.metrics`) to a
+    map's graph. If neither the nodes nor the links have changed the
+    previous metrics are kept as they are. Otherwise only the degrees
+    and components are measured, and the nodes keep their previous
+    PageRank and betweenness until :meth:`finishMap` measures them.
+    """
+    if sameLinks(graph, oldGraph) and all(
+      aKey in aNode for aNode in oldGraph['nodes'] for aKey in METRICS
+    ) :
+      for aNode, oldNode in zip(graph['nodes'], oldGraph['nodes']) :
+        for aKey in METRICS : aNode[aKey] = oldNode[aKey]
+      return
+    measureGraph(graph, centrality=False)
+    if not oldGraph : return
+    oldNodes = { aNode['id'] : aNode for aNode in oldGraph['nodes'] }
+    for aNode in graph['nodes'] :
+      oldNode = oldNodes.get(aNode['id'], {})
+      for aKey in CENTRALITY :
+        if aKey in oldNode : aNode[aKey] = oldNode[aKey]
+
+  def writeMapJson(self, aTag, jsonStr) :
+    os.makedirs(os.path.dirname(self.mapPath(aTag)), exist_ok=True)
+    tagFileName = None
     try :
       with NamedTemporaryFile(
         dir=os.path.abspath(self.root), delete=False
-      ) as tmpFile :
-        tmpName = tmpFile.name
-        pickle.dump(pages, tmpFile)
-      os.replace(tmpName, self.pagesCache)
-      print(f" * Saved pagesCache to {self.pagesCache}")
+      ) as tagFile :
+        tagFileName = tagFile.name
+        tagFile.write(jsonStr.encode())
+        tagFile.write(b"\n")
+      os.replace(tagFileName, self.mapPath(aTag))
     finally :
-      try : os.remove(tmpName)
+      try : os.remove(tagFileName)
       except (TypeError, OSError) :
         pass
+
+  def removeMap(self, aTag) :
+    try : os.remove(self.mapPath(aTag))
+    except OSError :
+      pass
+
+  def refreshMap(self, aTag, graph, oldHash) :
+    """
+    Write the link map of a tag, unless its graph is the same as when
+    it was last written, or remove it if `graph` is None. The nodes of
+    a map are (partly) measured just before it is written. If the map
+    is to be laid out its nodes keep their previous positions, and if
+    neither its nodes nor its links have changed it keeps its
+    clusters, until :meth:`finishMap` measures, lays out and clusters
+    it again.
+
+    :param str oldHash: the hash of the map's (canonical) JSON as last
+                        written, None if it was never written
+
+    :returns: the hash of the map's JSON (None if it was removed)
+              and its changes (None if nothing was written)
+    :rtype: tuple
+    """
+    if graph is None :
+      if oldHash is None : return None, None
+      changes = mapChanges(self.readMap(aTag), None)
+      self.removeMap(aTag)
+      return None, changes
+    # the hash does not include the metrics, layout or clusters, which
+    # all follow from the graph
+    jsonStr = json.dumps(graph, sort_keys=True)
+    mapHash = hashlib.sha1(jsonStr.encode('utf-8')).hexdigest()
+    if mapHash == oldHash and os.path.exists(self.mapPath(aTag)) :
+      return mapHash, None
+    oldGraph = self.readMap(aTag)
+    changes = mapChanges(oldGraph, graph)
+    self.measureMap(graph, oldGraph)
+    if self.layoutMaps and len(graph['nodes']) <= self.layoutMaxNodes :
+      keepLayout(graph, oldGraph)
+    if self.clusterMinNodes <= len(graph['nodes']) and sameLinks(graph, oldGraph) :
+      keepClusters(graph, oldGraph)
+    self.writeMapJson(aTag, json.dumps(graph, sort_keys=True))
+    return mapHash, changes
+
+  def finishMap(self, aTag) :
+    """
+    Measure the PageRank and betweenness of the nodes of a map written
+    by :meth:`refreshMap` whose nodes or links have changed (starting
+    from the ranks its nodes were written with), lay it out (if
+    LAYOUT_MAPS is set) starting from the positions its nodes were
+    written with, and cluster it if it is large (see
+    :mod:`mindMapper.cluster`). This is kept out of the pages cache
+    updates, as all of these take a while for a large map. Maps with
+    more than LAYOUT_MAX_NODES nodes are not laid out, but the top
+    level of every clustered map is (see :meth:`layoutClusters`), so
+    that even the largest maps open laid out.
+
+    :returns: whether or not the map was rewritten (it may have gone)
+    :rtype: bool
+    """
+    graph = self.readMap(aTag)
+    if graph is None : return False
+    numNodes = len(graph['nodes'])
+    measureGraph(graph, graph)
+    layout = self.layoutMaps and numNodes <= self.layoutMaxNodes
+    if layout : self.layoutMap(graph)
+    if self.clusterMinNodes <= numNodes :
+      clusterGraph(graph)
+      # (the clusters of a laid out map are placed amongst their nodes)
+      if not layout : self.layoutClusters(graph)
+    self.writeMapJson(aTag, json.dumps(graph, sort_keys=True))
+    return True
+
+  def unfinishedMaps(self, report) :
+    """
+    :param dict report: the changes of the maps written by an update
+                        of the pages cache (see :meth:`refreshMaps`)
+
+    :returns: the tags of the maps which still have to be finished
+              (see :meth:`finishMap`)
+    :rtype: list
+    """
+    return sorted(aTag for aTag, changes in report.items() if any(changes.values()))
+
+  def finishMaps(self, report) :
+    """
+    Finish (see :meth:`finishMap`) every map written by an update of
+    the pages cache.
+
+    :param dict report: the changes of the maps written by the update
+                        (see :meth:`refreshMaps`)
+    """
+    for aTag in self.unfinishedMaps(report) : self.finishMap(aTag)
+
+  def refreshMaps(self, tagMaps, mapHashes) :
+    """
+    Write the link maps whose JSON has changed, and remove the maps
+    of tags which no longer have any nodes.
+
+    :param tagMaps: (tag, graph) pairs, the graph being None for maps
+                    which have gone
+    :param dict mapHashes: the hashes of the maps as last written,
+                           which are brought up to date
+
+    :returns: the changes (see :func:`mapChanges`) of every map which
+              was written or removed, keyed by tag
+    :rtype: dict
+    """
+    report = {}
+    numRemoved = 0
+    for aTag, graph in tagMaps :
+      mapHash, changes = self.refreshMap(aTag, graph, mapHashes.get(aTag))
+      if mapHash is None : mapHashes.pop(aTag, None)
+      else               : mapHashes[aTag] = mapHash
+      if changes is None : continue
+      report[aTag] = changes
+      if graph is None :
+        numRemoved += 1
+        print(f" * Removed map {aTag}")
+      else :
+        print(f" * Map {aTag}: {describeChanges(changes)}")
+    print(f" * Updated {len(report) - numRemoved} and removed {numRemoved} maps")
+    return report
+
+  def loadMapHashes(self) :
+    """
+    :returns: the hashes of the maps written by the last build of the
+              pages cache (empty if there is no usable cache)
+    :rtype: dict
+    """
+    store = self.openStore()
+    if store is None : return {}
+    try :
+      return store.section('mapHashes')
+    except (KeyError, pickle.UnpicklingError, EOFError) :
+      return {}
+
+  def rebuildPagesCache(self) :
+    """
+    Rebuild the pages cache (or database) and the link maps from
+    scratch. Only the maps which have changed since the last build
+    are written.
+
+    :returns: the changes of every map which was written or removed
+              (see :meth:`refreshMaps`)
+    :rtype: dict
+    """
+    if self.usesDatabase() :
+      return self.rebuildDatabase()
+    print(" * Rebuilding pages cache")
+    mapHashes = self.loadMapHashes()
+
+    # start by loading all of the pages
+    #
+    paths    = self.walkPages()
+    manifest = {}
+    for url, path in paths.items() :
+      manifest[url] = self.manifestEntry(path)
+    pagesMap = self.loadPages(paths)
+    self.reportBrokenLinks(pagesMap)
+    #
+    # now build the link graph (from which the link maps are derived)
+    #
+    graph = linkGraph(pagesMap)
+    #
+    # now index the tags, links and text of every page
+    #
+    tags      = TagIndex()
+    backlinks = BacklinkIndex()
+    search    = SearchIndex()
+    for aPage in pagesMap.values() :
+      tags.addPage(aPage)
+      backlinks.addPage(aPage)
+      search.addPage(aPage)
+    #
+    # now write out each (changed) link map
     #
-    # now write out each link map
+    report = self.refreshMaps(
+      self.tagMaps(graph, pagesMap, set(graph.tags) | set(mapHashes)), mapHashes
+    )
     #
-    os.makedirs(os.path.abspath(os.path.join(self.root, 'maps')), exist_ok=True)
-    for aTag, aMap in maps.items() :
-      theMap = { 'nodes' : [], 'links' : []}
-      links  = theMap['links']
-      nodes  = theMap['nodes']
-      for aNode in aMap['nodes'] :
-        aNode = {
-          'id'       : '/'+pagesMap[aNode].url,
-          'title'    : pagesMap[aNode].title,
-          'nodeType' : 'default'
-        }
-        for aKey, aValue in self.nodeMapping['default'].items() :
-          aNode[aKey] = aValue
-        nodes.append(aNode)
-      for aSource in aMap['links'] :
-        for aTarget in aMap['links'][aSource] :
-          for aModifier in aMap['links'][aSource][aTarget] :
-            aLink = {
-              'source'   : '/'+pagesMap[aSource].url,
-              'target'   : '/'+pagesMap[aTarget].url,
-              'linkType' : aModifier
-            }
-            linkModifier = aModifier
-            if linkModifier not in self.linkMapping :
-              linkModifier = 'default'
-            for aKey, aValue in self.linkMapping[linkModifier].items() :
-              aLink[aKey] = aValue
-            links.append(aLink)
-      tagFileName = None
+    # now save the pages cache
+    #
+    self.saveCache({
+      'version'   : CACHE_VERSION,
+      'config'    : self.configHash,
+      'manifest'  : manifest,
+      'pages'     : pagesMap,
+      'mapHashes' : mapHashes,
+      'tags'      : tags,
+      'backlinks' : backlinks,
+      'graph'     : graph,
+      'search'    : search
+    })
+    return report
+
+  def updatePages(self, changedUrls=(), removedUrls=()) :
+    """
+    Incrementally update the pages cache and the link maps.
+
+    Only the changed pages are re-loaded, and only
+    the maps of tags whose nodes or links could have been affected
+    are rebuilt. Of those, only the maps which actually changed are
+    written back to disk.
+
+    :param list changedUrls: the urls of pages created or edited
+    :param list removedUrls: the urls of pages deleted (or moved away)
+
+    :returns: the changes of every map which was written or removed
+              (see :meth:`refreshMaps`)
+    :rtype: dict
+    """
+    if self.usesDatabase() :
+      return self.updateDatabase(changedUrls, removedUrls)
+    cache = self.loadCache()
+    if cache is None or cache['config'] != self.configHash :
+      return self.rebuildPagesCache()
+    return self.patchCache(cache, changedUrls, removedUrls)
+
+  def patchCache(self, cache, changedUrls, removedUrls) :
+    """
+    Apply the changed and removed pages to an already loaded cache
+    (see :meth:`updatePages`) and save it.
+    """
+    print(" * Updating pages cache")
+    pagesMap = cache['pages']
+    manifest = cache['manifest']
+
+    touched = set(changedUrls) | set(removedUrls)
+    linked = self.linkedPages(cache['graph'], touched)
+    affectedTags = pagesTags(pagesMap, linked)
+
+    for aUrl in removedUrls :
+      pagesMap.pop(aUrl, None)
+      manifest.pop(aUrl, None)
+    changedPages = self.loadPages(
+      { aUrl : self.path(aUrl) for aUrl in changedUrls }
+    )
+    for aUrl in changedUrls :
+      if aUrl in changedPages : pagesMap[aUrl] = changedPages[aUrl]
+      else                    : pagesMap.pop(aUrl, None)
+      if self.exists(aUrl) : manifest[aUrl] = self.manifestEntry(self.path(aUrl))
+      else                 : manifest.pop(aUrl, None)
+
+    graph = linkGraph(pagesMap)
+    newlyLinked = self.linkedPages(graph, touched)
+    affectedTags |= pagesTags(pagesMap, newlyLinked)
+    self.reportBrokenLinks(pagesMap, linked | newlyLinked)
+
+    tags      = cache['tags']
+    backlinks = cache['backlinks']
+    search    = cache['search']
+    for aUrl in touched :
+      tags.removePage(aUrl)
+      backlinks.removePage(aUrl)
+      search.removePage(aUrl)
+      if aUrl in pagesMap :
+        tags.addPage(pagesMap[aUrl])
+        backlinks.addPage(pagesMap[aUrl])
+        search.addPage(pagesMap[aUrl])
+
+    # only the affected maps which have actually changed are written
+    report = self.refreshMaps(
+      self.tagMaps(graph, pagesMap, affectedTags), cache['mapHashes']
+    )
+    cache['graph'] = graph
+    self.saveCache(cache)
+    return report
+
+  def tagMaps(self, graph, pagesMap, tags) :
+    """
+    Derive the link maps of the given tags from the link graph.
+
+    :returns: the (tag, graph) pairs of the maps, in tag order, the
+              graph being None for tags without any pages
+    """
+    for aTag in sorted(tags) :
+      aMap = graph.tagMap(aTag)
+      yield aTag, None if aMap is None else self.mapGraph(*aMap, pagesMap)
+
+  def syncPagesCache(self, urls=None) :
+    """
+    Bring the pages cache up to date with the wiki directory.
+
+    The cache's manifest is compared with the files on disk; only the
+    pages whose size or mtime changed (and whose content hash then
+    differs) are re-processed, and pages whose files have gone are
+    removed. If there is no usable cache, or the configuration has
+    changed, the whole cache is rebuilt.
+
+    :param list urls: if given, only these pages are checked rather
+                      than the whole wiki directory
+
+    :returns: the changes of every map which was written or removed
+              (see :meth:`refreshMaps`)
+    :rtype: dict
+    """
+    if self.usesDatabase() :
+      return self.syncDatabase(urls)
+    cache = self.loadCache()
+    if cache is None or cache['config'] != self.configHash :
+      return self.rebuildPagesCache()
+    changedUrls, removedUrls, touchedUrls = self.compareManifest(
+      cache['manifest'], urls
+    )
+    if changedUrls or removedUrls :
+      return self.patchCache(cache, changedUrls, removedUrls)
+    if touchedUrls : self.saveCache(cache)
+    print(" * Pages cache is up to date")
+    return {}
+
+  def compareManifest(self, manifest, urls=None) :
+    """
+    Compare a manifest with the files on disk. The entries of pages
+    which were touched, but whose content has not changed, are
+    brought up to date.
+
+    :param list urls: if given, only these pages are checked rather
+                      than the whole wiki directory
+
+    :returns: the urls of the changed, removed and touched (only)
+              pages
+    :rtype: tuple
+    """
+    if urls is None :
+      paths = self.walkPages()
+      urls  = manifest.keys()
+    else :
+      paths = { aUrl : self.path(aUrl) for aUrl in urls if self.exists(aUrl) }
+    changedUrls = []
+    touchedUrls = []
+    for aUrl, aPath in list(paths.items()) :
+      entry = manifest.get(aUrl)
       try :
-        with NamedTemporaryFile(
-          dir=os.path.abspath(self.root), delete=False
-        ) as tagFile :
-          tagFileName = tagFile.name
-          #jsonStr = json.dumps(theMap, indent=2)
-          jsonStr = json.dumps(theMap)
-          tagFile.write(jsonStr.encode())
-          tagFile.write(b"\n")
-        os.replace(tagFileName, os.path.abspath(os.path.join(self.root, 'maps', f"{aTag}.json")))
-      finally :
-        try : os.remove(tagFileName)
-        except (TypeError, OSError) :
-          pass
+        stat = os.stat(aPath)
+      except OSError :
+        # removed while we were looking
+        del paths[aUrl]
+        continue
+      if entry :
+        if entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size :
+          continue
+        if entry['hash'] == fileHash(aPath) :
+          # touched but not changed
+          entry['mtime'] = stat.st_mtime_ns
+          entry['size']  = stat.st_size
+          touchedUrls.append(aUrl)
+          continue
+      changedUrls.append(aUrl)
+    removedUrls = [
+      aUrl for aUrl in urls if aUrl in manifest and aUrl not in paths
+    ]
+    return changedUrls, removedUrls, touchedUrls
+
+  def linkedPages(self, graph, urls) :
+    """
+    Collect the pages whose maps can change when the given pages
+    change, that is the pages themselves together with every page
+    they link to or which links to them.
+
+    :rtype: set
+    """
+    linked = set(urls)
+    for aUrl in urls : linked |= graph.neighbours(aUrl)
+    return linked
+
+  def rebuildDatabase(self) :
+    """
+    Rebuild the SQLite store from scratch (in one transaction). Pages
+    are written to the database as they are loaded, so the wiki is
+    never held in memory as a whole.
+    """
+    print(" * Rebuilding pages database")
+    database = self.database()
+    paths = self.walkPages()
+    with database.transaction() :
+      database.clear()
+      for url, path in paths.items() :
+        database.putFile(url, self.manifestEntry(path))
+      for aPage in self.iterPages(paths) :
+        database.putPage(aPage, pageTags(aPage) - { 'theVortex' })
+      database.setState('config', self.configHash)
+    print(f" * Saved pages database to {self.databasePath}")
+    for aSource, aTarget in database.brokenLinks() :
+      print(f" * BROKEN LINK: {aSource} -> {aTarget}")
+    return self.refreshDatabaseMaps(database.mapTags() | set(database.mapHashes()))
+
+  def updateDatabase(self, changedUrls=(), removedUrls=()) :
+    """
+    Incrementally update the SQLite store (in one transaction) and
+    the link maps, see :meth:`updatePages`.
+    """
+    database = self.database()
+    if database.state('config') != self.configHash :
+      return self.rebuildDatabase()
+    print(" * Updating pages database")
+    touched = set(changedUrls) | set(removedUrls)
+    paths = { aUrl : self.path(aUrl) for aUrl in changedUrls if self.exists(aUrl) }
+    with database.transaction() :
+      affectedTags = database.neighbourTags(touched)
+      for aUrl in touched :
+        database.removePage(aUrl)
+        if aUrl in paths : database.putFile(aUrl, self.manifestEntry(paths[aUrl]))
+        else             : database.removeFile(aUrl)
+      for aPage in self.iterPages(paths) :
+        database.putPage(aPage, pageTags(aPage) - { 'theVortex' })
+      affectedTags |= database.neighbourTags(touched)
+    return self.refreshDatabaseMaps(affectedTags)
+
+  def syncDatabase(self, urls=None) :
+    """
+    Bring the SQLite store up to date with the wiki directory, see
+    :meth:`syncPagesCache`.
+    """
+    database = self.database()
+    if database.state('config') != self.configHash :
+      return self.rebuildDatabase()
+    manifest = database.manifest()
+    changedUrls, removedUrls, touchedUrls = self.compareManifest(manifest, urls)
+    with database.transaction() :
+      for aUrl in touchedUrls : database.putFile(aUrl, manifest[aUrl])
+    if changedUrls or removedUrls :
+      return self.updateDatabase(changedUrls, removedUrls)
+    print(" * Pages database is up to date")
+    return {}
+
+  def refreshDatabaseMaps(self, tags) :
+    """
+    Rebuild the link maps of the given tags from the SQLite store,
+    see :meth:`refreshMaps`.
+
+    :returns: the changes of every map which was written or removed
+    :rtype: dict
+    """
+    database = self.database()
+    mapHashes = database.mapHashes()
+    def tagMaps() :
+      for aTag in sorted(tags) :
+        aMap, pagesMap = database.buildMap(aTag)
+        yield aTag, None if aMap is None else self.mapGraph(*aMap, pagesMap)
+    with database.transaction() :
+      report = self.refreshMaps(tagMaps(), mapHashes)
+      for aTag in report : database.setMapHash(aTag, mapHashes.get(aTag))
+    return report
+
+def loadPage(url, path) :
+  """
+  Load a single page (in this or a worker process). Only the meta
+  data, body and links of the page are read; it is not rendered to
+  html unless somebody asks for its html.
+
+  :returns: the page, or None if the file is missing or invalid
+  :rtype: Page
+  """
+  if not os.path.exists(path) : return None
+  try:
+    return Page(path, url, metaOnly=True)
+  except InvalidFileException:
+    # for now we just ignore files that are invalid
+    # entirely
+    return None
+
+def mapChanges(oldGraph, newGraph) :
+  """
+  Compare two versions of the graph of a link map (either of which
+  may be None).
+
+  :returns: the sorted ids of the added and removed nodes, and the
+            (source, target, linkType) of the added and removed links
+  :rtype: dict
+  """
+  def mapSets(theMap) :
+    if theMap is None : return set(), set()
+    return (
+      set(aNode['id'] for aNode in theMap['nodes']),
+      set(
+        (aLink['source'], aLink['target'], aLink['linkType'])
+        for aLink in theMap['links']
+      )
+    )
+  oldNodes, oldLinks = mapSets(oldGraph)
+  newNodes, newLinks = mapSets(newGraph)
+  return {
+    'addedNodes'   : sorted(newNodes - oldNodes),
+    'removedNodes' : sorted(oldNodes - newNodes),
+    'addedLinks'   : sorted(newLinks - oldLinks),
+    'removedLinks' : sorted(oldLinks - newLinks)
+  }
+
+def sameLinks(graph, oldGraph) :
+  """
+  :returns: whether or not two versions of the graph of a link map
+            (the older of which may be None) have the same nodes and
+            the same links between them, whatever their modifiers
+  :rtype: bool
+  """
+  if not oldGraph : return False
+  return [ aNode['id'] for aNode in graph['nodes'] ] == [
+    aNode['id'] for aNode in oldGraph['nodes']
+  ] and [ (aLink['source'], aLink['target']) for aLink in graph['links'] ] == [
+    (aLink['source'], aLink['target']) for aLink in oldGraph['links']
+  ]
+
+def keepLayout(graph, oldGraph) :
+  """
+  Give the nodes of a map's graph the positions they had in the map's
+  previous graph (if any), so that the browser starts drawing from
+  there until the map has been laid out again.
+  """
+  if not oldGraph : return
+  previous = {
+    aNode['id'] : aNode for aNode in oldGraph['nodes'] if 'x' in aNode and 'y' in aNode
+  }
+  for aNode in graph['nodes'] :
+    oldNode = previous.get(aNode['id'])
+    if oldNode is not None :
+      aNode['x'] = oldNode['x']
+      aNode['y'] = oldNode['y']
+
+def keepClusters(graph, oldGraph) :
+  """
+  Give a map's graph the clusters of the map's previous graph, which
+  has the same nodes and links, retitling them after their hubs.
+  """
+  if 'clusters' not in oldGraph : return
+  titles = { aNode['id'] : aNode['title'] for aNode in graph['nodes'] }
+  for aNode, oldNode in zip(graph['nodes'], oldGraph['nodes']) :
+    if 'cluster' in oldNode : aNode['cluster'] = oldNode['cluster']
+  graph['clusters'] = oldGraph['clusters']
+  for aCluster in graph['clusters'] :
+    if aCluster.get('hub') in titles : aCluster['title'] = titles[aCluster['hub']]
+
+def describeChanges(changes) :
+  """
+  :returns: a one line summary of the changes to a map
+  :rtype: str
+  """
+  return (
+    f"+{len(changes['addedNodes'])}/-{len(changes['removedNodes'])} nodes, "
+    f"+{len(changes['addedLinks'])}/-{len(changes['removedLinks'])} links"
+  )
+
+def fileHash(path) :
+  with open(path, 'rb') as aFile :
+    return hashlib.sha1(aFile.read()).hexdigest()
+
+def linkGraph(pagesMap) :
+  """
+  :returns: the link graph, with the tags of every page, of the pages
+  :rtype: LinkGraph
+  """
+  return LinkGraph(
+    pagesMap,
+    (
+      (aUrl, aTarget, aModifier)
+      for aUrl, aPage in pagesMap.items()
+      for aTarget, _, aModifier in aPage.linkTuples
+    ),
+    { aUrl : pageTags(aPage) for aUrl, aPage in pagesMap.items() }
+  )
+
+def pagesTags(pagesMap, urls) :
+  """
+  :returns: the tags of (those of) the given pages (which exist)
+  :rtype: set
+  """
+  tags = set()
+  for aUrl in urls :
+    if aUrl in pagesMap : tags |= pageTags(pagesMap[aUrl])
+  return tags
+
+def pageTags(aPage) :
+  """
+  The set of tags (maps) a page belongs to, which always includes
+  'theVortex'.
+
+  :rtype: set
+  """
+  tags = set()
+  for aTag in aPage.tags.split(',') : tags.add(aTag.strip())
+  tags.add('theVortex')
+  return tags
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from io import open
 from unittest import TestCase
+import gc
+import json
 import os
+import tracemalloc
 from mock import patch
 
 import pytest
@@ -45,7 +48,20 @@ def simpleWikilinkProcessorInit(self, text, aPage) :
 mindMapper.processor.Processor.__init__ = simpleWikilinkProcessorInit
 
 from mindMapper.page import Page
+from mindMapper.cacheStore import InvalidCacheException
+from mindMapper.cacheStore import PagesStore
+from mindMapper.cacheStore import writeStore
+from mindMapper.cluster import ClusterTree, ROOT, clusterGraph
+from mindMapper.graph import LinkGraph
+from mindMapper.metrics import betweenness, measureGraph, pageRank
+from mindMapper.index import PagesIndex
+from mindMapper.renderCache import RenderCache
+from mindMapper.sqliteStore import SqliteStore
+from mindMapper.watcher import InotifyWatcher, PollingWatcher
+from mindMapper.watcher import RESCAN, applyChanges, collectChanges
+import mindMapper.wiki
 
+from utils import CONFIGURATION
 from utils import WikiBaseTestCase
 
 class MockPage :
@@ -152,6 +168,32 @@ class WikilinkTestCase(TestCase):
         )
 
 
+    def test_wikilink_records(self):
+        """
+            Assert every wikilink, including its title and modifier, is
+            recorded on the page in order.
+        """
+        page = Page(None, 'source', new=True)
+        formatted = mindMapper.processor.wikilink(
+            u'[[target|Target{uses}]], [[other page]] and [[target]]',
+            page,
+            simple_url_formatter
+        )
+        assert formatted == (
+            "<a href='/target' title='uses'>Target</a>,"
+            " <a href='/other_page' title='link'>other page</a> and"
+            " <a href='/target' title='link'>target</a>"
+        )
+        assert [
+            (link['target'], link['title'], link['modifier'])
+            for link in page.links
+        ] == [
+            ('target', 'Target', 'uses'),
+            ('other page', 'other page', 'link'),
+            ('target', 'target', 'link'),
+        ]
+
+
 class ProcessorTestCase(WikiBaseTestCase):
     """
         Contains various tests for the :class:`~wiki.core.Processors`
@@ -189,6 +231,22 @@ class ProcessorTestCase(WikiBaseTestCase):
         assert html == WIKILINK_CONTENT_HTML
 
 
+    def test_converter_reuse(self):
+        """
+            Assert markdown converters are reused, and reset between
+            pages so no meta data leaks from one page to the next.
+        """
+        self.processor.process()
+        md = mindMapper.processor.acquireConverter()
+        mindMapper.processor.releaseConverter(md)
+
+        processor = mindMapper.processor.Processor(u"Hello\n\nyou", MockPage())
+        assert processor.md is md
+        html, _, meta = processor.process()
+        assert meta == {}
+        assert html == u"<p>Hello</p>\n<p>you</p>"
+
+
 class PageTestCase(WikiBaseTestCase):
     """
         Contains various tests for the :class:`~wiki.core.Page`
@@ -226,6 +284,44 @@ class PageTestCase(WikiBaseTestCase):
             saved = fhd.read()
         assert saved == self.page_content
 
+    def test_meta_only_loading(self):
+        """
+            Assert scanning a page gives the same meta data, body and
+            links as rendering it, and that it is only rendered when
+            its html is used.
+        """
+        content = u"title: Scanned\ntags: one, two\n\n[[page-a|A{is-a}]] `[[page-b]]`\n\n```\n[[page-c]]\n```\n"
+        path = self.create_file('scanned.md', content)
+        rendered = Page(path, 'scanned')
+        with patch.object(mindMapper.processor.Processor, 'process') as process:
+            scanned = Page(path, 'scanned', metaOnly=True)
+            assert process.call_count == 0
+        assert scanned.meta == rendered.meta
+        assert scanned.body == rendered.body
+        assert scanned.links == rendered.links == [{
+            'source': 'scanned', 'target': 'page-a', 'title': 'A', 'modifier': 'is-a'
+        }]
+        assert scanned.html == rendered.html
+
+
+    def test_links_in_code(self):
+        """
+            Assert links inside code (even after other text) are
+            neither rendered nor recorded, whether a page is rendered
+            or scanned.
+        """
+        content = (
+            u"title: Code\ntags: one\n\n[[page-a]] `see [[page-b]]` and "
+            u"``also [[page-c]]``\n\n~~~\nfirst\n[[page-d]]\n~~~\n\n"
+            u"```python\nx = '[[page-e]]'\n```\n"
+        )
+        path = self.create_file('code.md', content)
+        rendered = Page(path, 'code')
+        scanned = Page(path, 'code', metaOnly=True)
+        assert [link['target'] for link in rendered.links] == ['page-a']
+        assert scanned.links == rendered.links
+        assert rendered.html.count(u"<a href=") == 1
+        assert u"see [[page-b]]" in rendered.html
 
 class InvalidPageTestCase(WikiBaseTestCase):
     """
@@ -246,6 +342,355 @@ class InvalidPageTestCase(WikiBaseTestCase):
         """
         with pytest.raises(InvalidFileException):
             Page(self.page_path, 'test')
+        with pytest.raises(InvalidFileException):
+            Page(self.page_path, 'test', metaOnly=True)
+
+
+class CacheStoreTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the memory-mapped pages cache.
+    """
+
+    def test_round_trip(self):
+        """
+            Assert pages written to the store are read back lazily
+            and unchanged.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('link.md', WIKILINK_PAGE_CONTENT)
+        pages = [
+            Page(os.path.join(self.rootdir, 'test.md'), 'test'),
+            Page(os.path.join(self.rootdir, 'link.md'), 'link')
+        ]
+        storePath = os.path.join(self.baseDir, 'store')
+        with open(storePath, 'wb') as fhd:
+            writeStore(fhd, pages, {'some': 'state'}, 1)
+
+        store = PagesStore(storePath, 1)
+        assert store.state() == {'some': 'state'}
+        cached = store.pages()
+        assert list(cached) == ['test', 'link']
+        assert cached['test'].title == u'Test'
+        assert cached['test'].tags == u'one, two, 3, jö'
+        assert cached['test'].body == pages[0].body
+        assert cached['test'].meta == pages[0].meta
+        assert cached['link'].links == pages[1].links
+
+        with pytest.raises(InvalidCacheException):
+            PagesStore(storePath, 2)
+
+    def test_index_memory(self):
+        """
+            Assert the pages are compact and the in-memory index of
+            the cache only holds a few hundred bytes per page.
+        """
+        path = self.create_file('test.md', PAGE_CONTENT)
+        page = Page(path, 'test', metaOnly=True)
+        assert not hasattr(page, '__dict__')
+        pages = []
+        for number in range(2000):
+            page = Page(path, 'page-%d' % number, new=True)
+            page.title = u'Page %d' % number
+            page.tags = u'one, two'
+            page.body = u'body'
+            page.addLink('page-%d' % (number // 2), 'title', 'link')
+            pages.append(page)
+        storePath = os.path.join(self.baseDir, 'store')
+        with open(storePath, 'wb') as fhd:
+            writeStore(fhd, pages, {}, 1)
+        store = PagesStore(storePath, 1)
+
+        gc.collect()
+        tracemalloc.start()
+        index = PagesIndex(store.pages())
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert not hasattr(index.pages[0], '__dict__')
+        assert used / len(pages) < 400
+
+
+class RenderCacheTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the page render cache.
+    """
+
+    def test_hot_page_is_not_rerendered(self):
+        """
+            Assert an unchanged page is served from the render cache,
+            and a changed one is rendered again.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        first = self.wiki.get('page-a')
+        with patch.object(mindMapper.processor.Processor, 'process') as process:
+            second = self.wiki.get('page-a')
+            assert process.call_count == 0
+        assert second.html == first.html
+        assert second.meta == first.meta
+        assert second.links == first.links
+
+        self.create_file('page-a.md', u"title: New A\ntags: one\n\nA\n")
+        assert self.wiki.get('page-a').title == u'New A'
+        assert self.wiki.renderCache.misses == 2
+        assert self.wiki.renderCache.hits == 1
+
+    def test_memory_bound_and_disk_tier(self):
+        """
+            Assert the in-memory tier is bounded, and entries evicted
+            from it are still found on disk.
+        """
+        diskDir = os.path.join(self.baseDir, 'renderCache')
+        cache = RenderCache(maxEntries=2, diskDir=diskDir)
+        for aNumber in range(3):
+            cache.put(cache.key(str(aNumber)), ('html', 'body', [], []))
+        assert len(cache) == 2
+        assert cache.get(cache.key('0')) == ('html', 'body', [], [])
+        other = RenderCache(maxEntries=2, diskDir=diskDir)
+        assert other.get(other.key('2')) == ('html', 'body', [], [])
+        assert other.get(other.key('3')) is None
+
+
+class WatcherTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the wiki directory watchers.
+    """
+
+    def assert_notices_changes(self, watcher):
+        self.create_file('page-a.md', u"title: A\ntags: one\n\nA\n")
+        self.create_file('sub/page-b.md', u"title: B\ntags: one\n\nB\n")
+        touched = collectChanges(watcher, debounce=0.1, timeout=0.5)
+        assert touched == {'page-a', 'sub/page-b'}
+        applyChanges(self.wiki, touched)
+        assert [page.title for page in self.wiki.index()] == ['A', 'B']
+
+        os.remove(os.path.join(self.rootdir, 'page-a.md'))
+        self.create_file('sub/page-b.md', u"title: New B\ntags: one\n\nB\n")
+        self.create_file('notes.txt', u"not a page")
+        touched = collectChanges(watcher, debounce=0.1, timeout=0.5)
+        assert touched == {'page-a', 'sub/page-b'}
+        applyChanges(self.wiki, touched)
+        assert [page.title for page in self.wiki.index()] == ['New B']
+        watcher.close()
+
+    def test_polling_watcher(self):
+        """
+            Assert the polling watcher notices created, changed and
+            removed pages.
+        """
+        self.wiki.rebuildPagesCache()
+        self.assert_notices_changes(PollingWatcher(self.rootdir, interval=0.05))
+
+    def test_inotify_watcher(self):
+        """
+            Assert the inotify watcher notices created, changed and
+            removed pages (including those in new sub-directories).
+        """
+        self.wiki.rebuildPagesCache()
+        try:
+            watcher = InotifyWatcher(self.rootdir)
+        except OSError:
+            pytest.skip("inotify is not available")
+        self.assert_notices_changes(watcher)
+
+
+    def test_inotify_watcher_moved_directory(self):
+        """
+            Assert the pages of a directory moved within the wiki are
+            reported under their new urls, and those of a directory
+            moved out of the wiki are no longer reported.
+        """
+        self.create_file('old/page-a.md', u"title: A\ntags: one\n\nA\n")
+        self.wiki.rebuildPagesCache()
+        try:
+            watcher = InotifyWatcher(self.rootdir)
+        except OSError:
+            pytest.skip("inotify is not available")
+        os.rename(os.path.join(self.rootdir, 'old'), os.path.join(self.rootdir, 'new'))
+        touched = collectChanges(watcher, debounce=0.1, timeout=0.5)
+        assert touched == {RESCAN, 'new/page-a'}
+        applyChanges(self.wiki, touched)
+        assert [page.url for page in self.wiki.index()] == ['new/page-a']
+
+        self.create_file('new/page-a.md', u"title: New A\ntags: one\n\nA\n")
+        touched = collectChanges(watcher, debounce=0.1, timeout=0.5)
+        assert touched == {'new/page-a'}
+
+        # pages in a directory moved out of the wiki are not reported
+        # under its old path
+        outside = os.path.join(self.baseDir, 'outside')
+        os.rename(os.path.join(self.rootdir, 'new'), outside)
+        assert collectChanges(watcher, debounce=0.1, timeout=0.5) == {RESCAN}
+        with open(os.path.join(outside, 'page-a.md'), 'a') as fhd:
+            fhd.write(u"more\n")
+        assert collectChanges(watcher, debounce=0.1, timeout=0.5) == set()
+        watcher.close()
+
+class SearchIndexTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the full text search index.
+    """
+
+    def setUp(self):
+        super(SearchIndexTestCase, self).setUp()
+        self.create_file('page-a.md', u"title: Apples\ntags: fruit\n\nred apples and green pears\n")
+        self.create_file('page-b.md', u"title: Pears\ntags: fruit\n\ngreen apples, pears, pears\n")
+        self.create_file('page-c.md', u"title: Cars\ntags: cars\n\na red car\n")
+        self.wiki.rebuildPagesCache()
+
+    def search(self, query, page=1, per_page=20):
+        results, total = self.wiki.search_pages(query, page, per_page)
+        return [result.url for result in results], total
+
+    def test_terms_and_phrases(self):
+        """
+            Assert every term and phrase of a query must match.
+        """
+        assert self.search(u'red') == (['page-c', 'page-a'], 2)
+        assert self.search(u'RED apples') == (['page-a'], 1)
+        assert self.search(u'"green apples"') == (['page-b'], 1)
+        assert self.search(u'"apples green"') == ([], 0)
+        assert self.search(u'bananas') == ([], 0)
+
+    def test_ranking_and_pagination(self):
+        """
+            Assert results are ranked by BM25 and can be paged.
+        """
+        assert self.search(u'pears') == (['page-b', 'page-a'], 2)
+        assert self.search(u'fruit', page=2, per_page=1) == (['page-a'], 2)
+
+    def test_incremental_update(self):
+        """
+            Assert the index follows changed and removed pages.
+        """
+        self.create_file('page-c.md', u"title: Cars\ntags: cars\n\na blue car\n")
+        os.remove(os.path.join(self.rootdir, 'page-a.md'))
+        self.wiki.updatePages(['page-c'], ['page-a'])
+        assert self.search(u'red') == ([], 0)
+        assert self.search(u'blue car') == (['page-c'], 1)
+        assert self.search(u'apples') == (['page-b'], 1)
+
+
+class SqliteSearchTestCase(SearchIndexTestCase):
+    """
+        Runs the full text search tests against the SQLite store.
+    """
+    config_content = CONFIGURATION + "STORAGE = 'sqlite'\n"
+
+
+class LinkGraphTestCase(TestCase):
+    """
+        Contains various tests for the link graph.
+    """
+
+    def test_tag_maps(self):
+        """
+            Assert a tag's map holds its pages, every link to or from
+            them (once) and the pages at the other ends.
+        """
+        graph = LinkGraph(
+            ['a', 'b', 'c', 'd', 'e'],
+            [
+                ('a', 'b', 'link'), ('a', 'b', 'is-a'), ('a', 'b', 'link'),
+                ('c', 'a', 'link'), ('d', 'e', 'link'), ('b', 'missing', 'link'),
+            ],
+            {'a': {'one'}, 'b': {'one', 'two'}, 'd': {'two'}, 'missing': {'two'}}
+        )
+        assert graph.tagMap('one') == (
+            ['a', 'b', 'c'],
+            [('a', 'b', 'link'), ('a', 'b', 'is-a'), ('c', 'a', 'link')]
+        )
+        assert graph.tagMap('two') == (
+            ['a', 'b', 'd', 'e'],
+            [('a', 'b', 'link'), ('a', 'b', 'is-a'), ('d', 'e', 'link')]
+        )
+        assert graph.tagMap('three') is None
+        assert graph.neighbours('a') == {'b', 'c'}
+        assert graph.neighbours('missing') == set()
+
+
+class MetricsTestCase(TestCase):
+    """
+        Contains various tests for the metrics of the maps' nodes.
+    """
+
+    def test_metrics(self):
+        """
+            Assert the degrees, PageRank, betweenness and component of
+            every node are measured.
+        """
+        graph = {
+            'nodes': [{'id': anId} for anId in ('/a', '/b', '/c', '/d')],
+            'links': [
+                {'source': '/a', 'target': '/b'}, {'source': '/b', 'target': '/c'}
+            ],
+        }
+        measureGraph(graph)
+        assert [
+            (n['inDegree'], n['outDegree'], n['betweenness'], n['component'])
+            for n in graph['nodes']
+        ] == [(0, 1, 0, 0), (1, 1, 0.1667, 0), (1, 0, 0, 0), (0, 0, 0, 1)]
+        ranks = [n['pageRank'] for n in graph['nodes']]
+        assert ranks[0] < ranks[1] < ranks[2] and ranks[3] == ranks[0]
+        assert abs(sum(ranks) - 4) < 0.01
+
+        edges = [(0, 1), (1, 2)]
+        cold = pageRank(4, edges)
+        warm = pageRank(4, edges, [r / 4 for r in ranks])
+        assert all(abs(a - b) < 1e-4 for a, b in zip(cold, warm))
+        # every page lies on the paths from a sample of just two pages
+        assert betweenness(4, [[1], [2], [], []], [0, 1]) == [0, 4 / 12, 0, 0]
+
+
+class ClusterTestCase(TestCase):
+    """
+        Contains various tests for the clustering of large maps.
+    """
+
+    def graph(self):
+        nodes = [{'id': f'/{g}{i}', 'title': f'{g}{i}'} for g in 'ab' for i in range(5)]
+        nodes += [{'id': '/x', 'title': 'x'}, {'id': '/y', 'title': 'y'}]
+        links = [
+            {'source': f'/{g}{i}', 'target': f'/{g}{j}', 'linkType': 'link'}
+            for g in 'ab' for i in range(5) for j in range(i + 1, 5)
+        ]
+        links.append({'source': '/a0', 'target': '/b0', 'linkType': 'is-a'})
+        return {'nodes': nodes, 'links': links}
+
+    def test_clusters(self):
+        """
+            Assert densely linked nodes are clustered together, unlinked
+            nodes are collected and every cluster can be viewed on its
+            own.
+        """
+        graph = self.graph()
+        clusterGraph(graph)
+        tree = ClusterTree(graph)
+        top = tree.view(ROOT)
+        assert sorted(n['size'] for n in top['nodes']) == [2, 5, 5]
+        assert all(n['nodeType'] == 'cluster' for n in top['nodes'])
+        clusterA = tree.paths['/a0'][0]
+        clusterB = tree.paths['/b0'][0]
+        assert tree.paths['/a4'][0] == clusterA != clusterB
+        assert [(l['source'], l['target'], l['weight']) for l in top['links']] == [
+            (clusterA, clusterB, 1)]
+
+        view = tree.view(clusterA)
+        assert sorted(n['id'] for n in view['nodes']) == ['/a0', '/a1', '/a2', '/a3', '/a4']
+        assert len(view['links']) == 10
+        assert view['external'] == [{
+            'inside': '/a0', 'outside': [clusterB, '/b0'], 'outgoing': True, 'weight': 1
+        }]
+        assert tree.view('cluster-99') is None
+
+    def test_small_graphs(self):
+        """
+            Assert a graph without any structure is shown as it is.
+        """
+        graph = {'nodes': [{'id': '/a', 'title': 'a'}, {'id': '/b', 'title': 'b'}],
+                 'links': [{'source': '/a', 'target': '/b', 'linkType': 'link'}]}
+        clusterGraph(graph)
+        assert graph['clusters'] == []
+        assert ClusterTree(graph).view(ROOT)['nodes'] == graph['nodes']
 
 
 class WikiTestCase(WikiBaseTestCase):
@@ -319,3 +764,542 @@ class WikiTestCase(WikiBaseTestCase):
         assert self.wiki.move('test_2', 'Test 3') == "test_3"
         assert self.wiki.exists('test_3')
         assert not self.wiki.exists('test_2')
+
+    def test_move_rewrites_links(self):
+        """
+            Assert moving a page can rewrite the links to it, reading
+            only the pages which link to it.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-c]], [[page-c|See C{is-a}]] and [[page-cc]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\n[[page-c{part-of}]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\n[[page-c]]\n")
+        self.create_file('page-d.md', u"title: D\ntags: one\n\nD\n")
+        self.wiki.rebuildPagesCache()
+        with patch('mindMapper.wiki.rewriteWikilinks', wraps=mindMapper.wiki.rewriteWikilinks) as rewrite:
+            assert self.wiki.move('page-c', 'page-z', rewrite_links=True) == 'page-z'
+            assert rewrite.call_count == 3
+        with open(os.path.join(self.rootdir, 'page-a.md')) as fhd:
+            assert u"[[page-z]], [[page-z|See C{is-a}]] and [[page-cc]]" in fhd.read()
+        with open(os.path.join(self.rootdir, 'page-b.md')) as fhd:
+            assert u"[[page-z{part-of}]]" in fhd.read()
+        with open(os.path.join(self.rootdir, 'page-z.md')) as fhd:
+            assert u"[[page-z]]" in fhd.read()
+
+        self.wiki.syncPagesCache(['page-a', 'page-b', 'page-c', 'page-z'])
+        backlinks = [(p.url, m) for p, m in self.wiki.get_backlinks('page-z')]
+        assert backlinks == [('page-a', 'is-a'), ('page-a', 'link'), ('page-b', 'part-of'), ('page-z', 'link')]
+        assert self.wiki.get_backlinks('page-c') == []
+
+    def test_move_leaves_code_alone(self):
+        """
+            Assert moving a page does not rewrite the (would be) links
+            to it inside code.
+        """
+        content = (
+            u"title: A\ntags: one\n\n[[page-c]] and `see [[page-c]]`\n\n"
+            u"```\n[[page-c]]\n```\n"
+        )
+        self.create_file('page-a.md', content)
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        self.wiki.rebuildPagesCache()
+        self.wiki.move('page-c', 'page-z', rewrite_links=True)
+        with open(os.path.join(self.rootdir, 'page-a.md')) as fhd:
+            assert fhd.read() == content.replace(u"[[page-c]] and", u"[[page-z]] and")
+
+    def test_update_pages(self):
+        """
+            Assert an incremental update re-reads only the changed
+            pages and rewrites only the affected maps.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\nB\n")
+        self.create_file('page-c.md', u"title: C\ntags: two\n\nC\n")
+        self.create_file('page-e.md', u"title: E\ntags: four\n\nE\n")
+        self.wiki.rebuildPagesCache()
+        fourMap = os.path.join(self.rootdir, 'maps', 'four.json')
+        os.remove(fourMap)
+
+        self.create_file('page-b.md', u"title: New B\ntags: one, three\n\nB\n")
+        self.create_file('page-d.md', u"title: D\ntags: three\n\n[[page-a]]\n")
+        os.remove(os.path.join(self.rootdir, 'page-c.md'))
+        self.wiki.updatePages(['page-b', 'page-d'], ['page-c'])
+
+        titles = [page.title for page in self.wiki.index()]
+        assert titles == ['A', 'D', 'E', 'New B']
+        assert os.path.exists(os.path.join(self.rootdir, 'maps', 'three.json'))
+        assert not os.path.exists(os.path.join(self.rootdir, 'maps', 'two.json'))
+        # the map for tag 'four' is unaffected and must not be rewritten
+        assert not os.path.exists(fourMap)
+        with open(os.path.join(self.rootdir, 'maps', 'one.json')) as fhd:
+            oneMap = json.load(fhd)
+        assert {'/page-a', '/page-b', '/page-d'} == set(n['id'] for n in oneMap['nodes'])
+        assert 'New B' in [n['title'] for n in oneMap['nodes']]
+
+    def test_unchanged_maps_are_not_rewritten(self):
+        """
+            Assert a rebuild only writes the maps whose JSON changed,
+            and reports the nodes and links added to or removed from
+            each map.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\nB\n")
+        self.create_file('page-c.md', u"title: C\ntags: two\n\nC\n")
+        report = self.wiki.rebuildPagesCache()
+        assert sorted(report) == ['one', 'theVortex', 'two']
+        assert report['one']['addedNodes'] == ['/page-a', '/page-b']
+        assert report['one']['addedLinks'] == [('/page-a', '/page-b', 'link')]
+
+        with patch.object(self.wiki, 'writeMapJson', wraps=self.wiki.writeMapJson) as write:
+            assert self.wiki.rebuildPagesCache() == {}
+            assert write.call_count == 0
+
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-c]]\n")
+        os.remove(os.path.join(self.rootdir, 'page-b.md'))
+        report = self.wiki.rebuildPagesCache()
+        assert sorted(report) == ['one', 'theVortex', 'two']
+        assert report['two']['addedNodes'] == ['/page-a']
+        assert report['one'] == {
+            'addedNodes': ['/page-c'],
+            'removedNodes': ['/page-b'],
+            'addedLinks': [('/page-a', '/page-c', 'link')],
+            'removedLinks': [('/page-a', '/page-b', 'link')],
+        }
+
+        os.remove(os.path.join(self.rootdir, 'page-c.md'))
+        report = self.wiki.rebuildPagesCache()
+        assert report['two']['removedNodes'] == ['/page-a', '/page-c']
+        assert not os.path.exists(os.path.join(self.rootdir, 'maps', 'two.json'))
+
+    def test_map_metrics(self):
+        """
+            Assert the nodes of the maps are measured (their PageRank
+            and betweenness once the maps have been written), and keep
+            their metrics while the links do not change.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]] [[page-c]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\n[[page-c]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        report = self.wiki.rebuildPagesCache()
+        mapPath = os.path.join(self.rootdir, 'maps', 'one.json')
+        with open(mapPath) as fhd:
+            nodes = json.load(fhd)['nodes']
+        assert [(n['inDegree'], n['outDegree']) for n in nodes] == [(0, 2), (1, 1), (2, 0)]
+        assert 'pageRank' not in nodes[0]
+        self.wiki.finishMaps(report)
+        with open(mapPath) as fhd:
+            nodes = json.load(fhd)['nodes']
+        assert nodes[0]['pageRank'] < nodes[1]['pageRank'] < nodes[2]['pageRank']
+        assert 'x' not in nodes[0]
+
+        self.create_file('page-c.md', u"title: See\ntags: one\n\nC\n")
+        with patch('mindMapper.wiki.measureGraph') as measure:
+            self.wiki.syncPagesCache()
+            assert measure.call_count == 0
+        with open(mapPath) as fhd:
+            retitled = json.load(fhd)['nodes']
+        assert retitled[2]['title'] == 'See'
+        assert [n['pageRank'] for n in retitled] == [n['pageRank'] for n in nodes]
+
+        self.create_file('page-d.md', u"title: D\ntags: one\n\n[[page-a]]\n")
+        with patch('mindMapper.wiki.measureGraph', wraps=mindMapper.wiki.measureGraph) as measure:
+            report = self.wiki.syncPagesCache()
+            assert measure.call_args.kwargs == {'centrality': False}
+            with open(mapPath) as fhd:
+                added = json.load(fhd)['nodes']
+            assert [n.get('pageRank') for n in added] == [n['pageRank'] for n in nodes] + [None]
+            assert added[0]['inDegree'] == 1
+            self.wiki.finishMaps(report)
+        with open(mapPath) as fhd:
+            assert json.load(fhd)['nodes'][3]['pageRank'] > 0
+
+    def test_map_clusters(self):
+        """
+            Assert large maps are clustered once they have been written,
+            and keep their clusters (retitled) while their links do not
+            change.
+        """
+        self.wiki.clusterMinNodes = 0
+        for group in 'ab':
+            for i in range(3):
+                links = ' '.join(f"[[{group}-{j}]]" for j in range(3) if j != i)
+                self.create_file(f'{group}-{i}.md', f"title: {group}{i}\ntags: one\n\n{links}\n")
+        self.create_file('a-0.md', u"title: a0\ntags: one\n\n[[a-1]] [[a-2]] [[b-0]]\n")
+        report = self.wiki.rebuildPagesCache()
+        mapPath = os.path.join(self.rootdir, 'maps', 'one.json')
+        with open(mapPath) as fhd:
+            assert 'clusters' not in json.load(fhd)
+        self.wiki.finishMaps(report)
+        with open(mapPath) as fhd:
+            clusters = json.load(fhd)['clusters']
+        assert [(c['hub'], c['title']) for c in clusters] == [('/a-0', 'a0'), ('/b-0', 'b0')]
+        # only the top level of the map is laid out
+        with open(mapPath) as fhd:
+            graph = json.load(fhd)
+        assert not any('x' in n for n in graph['nodes'])
+        assert all('x' in n for n in ClusterTree(graph).view(ROOT)['nodes'])
+
+        self.create_file('a-0.md', u"title: Hub\ntags: one\n\n[[a-1]] [[a-2]] [[b-0]]\n")
+        with patch('mindMapper.wiki.clusterGraph') as cluster:
+            self.wiki.finishMaps(self.wiki.syncPagesCache())
+            assert cluster.call_count == 0
+        with open(mapPath) as fhd:
+            retitled = json.load(fhd)['clusters']
+        assert retitled == [dict(clusters[0], title='Hub')] + clusters[1:]
+
+    def neighbourhood_pages(self):
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]] [[page-c|C{is-a}]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: two\n\n[[page-d]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: two\n\nC\n")
+        self.create_file('page-d.md', u"title: D\ntags: two\n\n[[page-e]] [[missing]]\n")
+        self.create_file('page-e.md', u"title: E\ntags: two\n\nE\n")
+        self.create_file('page-f.md', u"title: F\ntags: two\n\n[[page-b]]\n")
+
+    def test_neighbourhood(self):
+        """
+            Assert the pages within a number of links of a page (in
+            either direction) are found, following only the wanted
+            link types.
+        """
+        self.neighbourhood_pages()
+        self.wiki.rebuildPagesCache()
+        ids = lambda graph: [n['id'] for n in graph['nodes']]
+        graph = self.wiki.get_neighbourhood('page-b')
+        assert ids(graph) == ['/page-a', '/page-b', '/page-d', '/page-f']
+        assert [(l['source'], l['target']) for l in graph['links']] == [
+            ('/page-a', '/page-b'), ('/page-b', '/page-d'), ('/page-f', '/page-b')]
+        assert graph['nodes'][0]['title'] == 'A'
+        graph = self.wiki.get_neighbourhood('page-b', hops=2)
+        assert ids(graph) == ['/page-a', '/page-b', '/page-c', '/page-d', '/page-e', '/page-f']
+        graph = self.wiki.get_neighbourhood('page-c', hops=3, modifiers=['is-a'])
+        assert ids(graph) == ['/page-a', '/page-c']
+        assert [l['linkType'] for l in graph['links']] == ['is-a']
+        assert len(self.wiki.get_neighbourhood('page-b', hops=5, limit=3)['nodes']) == 3
+        assert self.wiki.get_neighbourhood('missing')['nodes'] == []
+
+        self.create_file('page-e.md', u"title: E\ntags: two\n\n[[page-a]]\n")
+        self.wiki.syncPagesCache()
+        assert ids(self.wiki.get_neighbourhood('page-a')) == [
+            '/page-a', '/page-b', '/page-c', '/page-e']
+
+    def test_paths(self):
+        """
+            Assert the shortest paths between two pages are found,
+            following only the wanted link types (forwards, if asked)
+            through only the wanted pages.
+        """
+        self.neighbourhood_pages()
+        self.create_file('page-g.md', u"title: G\ntags: three\n\n[[page-a]] [[page-d]]\n")
+        self.wiki.rebuildPagesCache()
+        graph = self.wiki.get_paths('page-a', 'page-e', count=3)
+        assert graph['paths'] == [
+            ['/page-a', '/page-b', '/page-d', '/page-e'],
+            ['/page-a', '/page-g', '/page-d', '/page-e'],
+        ]
+        assert [(l['source'], l['target']) for l in graph['links']] == [
+            ('/page-a', '/page-b'), ('/page-b', '/page-d'), ('/page-d', '/page-e'),
+            ('/page-g', '/page-a'), ('/page-g', '/page-d')]
+        assert [n['title'] for n in graph['nodes']] == ['A', 'B', 'D', 'E', 'G']
+        assert self.wiki.get_paths('page-e', 'page-a')['paths'] == [
+            ['/page-e', '/page-d', '/page-b', '/page-a']]
+
+        for options in ({'directed': True}, {'tag': 'two'}):
+            assert self.wiki.get_paths('page-a', 'page-e', count=3, **options)['paths'] == [
+                ['/page-a', '/page-b', '/page-d', '/page-e']]
+        assert self.wiki.get_paths('page-e', 'page-a', directed=True)['paths'] == []
+        assert self.wiki.get_paths('page-a', 'page-f', modifiers=['is-a'])['paths'] == []
+        assert self.wiki.get_paths('page-c', 'page-a', modifiers=['is-a'])['paths'] == [
+            ['/page-c', '/page-a']]
+        assert self.wiki.get_paths('page-a', 'missing')['nodes'] == []
+
+    def test_tag_index(self):
+        """
+            Assert pages are indexed by their exact tags and the tag
+            index follows incremental updates.
+        """
+        self.create_file('page-a.md', u"title: Zebra\ntags: map, one\n\nA\n")
+        self.create_file('page-b.md', u"title: Bee\ntags: mindmap, map\n\nB\n")
+        self.create_file('page-c.md', u"title: Cat\ntags: mindmap\n\nC\n")
+        self.wiki.rebuildPagesCache()
+        assert [p.url for p in self.wiki.index_by_tag('map')] == ['page-b', 'page-a']
+        assert self.wiki.index_by_tag('ma') == []
+        assert self.wiki.get_tag_counts() == {'map': 2, 'mindmap': 2, 'one': 1}
+
+        self.create_file('page-a.md', u"title: Ant\ntags: map\n\nA\n")
+        os.remove(os.path.join(self.rootdir, 'page-c.md'))
+        self.wiki.updatePages(['page-a'], ['page-c'])
+        assert [p.url for p in self.wiki.index_by_tag('map')] == ['page-a', 'page-b']
+        assert self.wiki.get_tag_counts() == {'map': 2, 'mindmap': 1}
+
+    def test_backlinks(self):
+        """
+            Assert the backlinks index lists the links to every page
+            and follows incremental updates.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-c]] [[page-x]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\n[[page-c]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        self.wiki.rebuildPagesCache()
+        backlinks = lambda url: [(p.url, m) for p, m in self.wiki.get_backlinks(url)]
+        assert backlinks('page-c') == [('page-a', 'link'), ('page-b', 'link')]
+        # links to missing pages are indexed too
+        assert backlinks('page-x') == [('page-a', 'link')]
+
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.wiki.updatePages(['page-a'])
+        assert backlinks('page-c') == [('page-b', 'link')]
+        assert backlinks('page-b') == [('page-a', 'link')]
+        assert backlinks('page-x') == []
+
+    def test_sync_pages_cache(self):
+        """
+            Assert that syncing the pages cache only re-processes the
+            pages whose files have changed on disk.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\nA\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\nB\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        self.wiki.syncPagesCache()
+        assert len(self.wiki.index()) == 3
+
+        self.create_file('page-b.md', u"title: New B\ntags: one\n\nB\n")
+        os.remove(os.path.join(self.rootdir, 'page-c.md'))
+        # touch, but do not change, page A
+        pageA = os.path.join(self.rootdir, 'page-a.md')
+        os.utime(pageA, ns=(1, 1))
+        with patch.object(self.wiki, 'loadPage', wraps=self.wiki.loadPage) as loadPage:
+            self.wiki.syncPagesCache()
+            assert [c.args[0] for c in loadPage.call_args_list] == ['page-b']
+            loadPage.reset_mock()
+            self.wiki.syncPagesCache()
+            assert loadPage.call_count == 0
+
+        titles = [page.title for page in self.wiki.index()]
+        assert titles == ['A', 'New B']
+
+    def test_shared_index(self):
+        """
+            Assert the pages index is loaded once, shared between wikis
+            and replaced after a rebuild.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\nA\n")
+        self.wiki.rebuildPagesCache()
+        other = mindMapper.wiki.Wiki(
+            self.rootdir, self.configPath, self.cachePath, self.wiki.sharedIndex
+        )
+        with patch.object(other, 'loadCache') as loadCache:
+            assert [page.title for page in other.index()] == ['A']
+            assert list(other.get_tags()) == ['one']
+            assert loadCache.call_count == 0
+
+        self.create_file('page-b.md', u"title: B\ntags: two\n\nB\n")
+        self.wiki.updatePages(['page-b'])
+        assert [page.title for page in other.index()] == ['A', 'B']
+
+        # a cache rebuilt by another process is picked up
+        fresh = mindMapper.wiki.Wiki(self.rootdir, self.configPath, self.cachePath)
+        self.create_file('page-c.md', u"title: C\ntags: two\n\nC\n")
+        fresh.updatePages(['page-c'])
+        assert len(other.get_tags()['two']) == 2
+
+    def test_parallel_rebuild(self):
+        """
+            Assert that loading the pages in (spawned, never forked)
+            worker processes gives the same cache as loading them
+            serially.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: two\n\nB\n")
+        self.create_file('invalid.md', PAGE_CONTENT_INVALID)
+        self.wiki.rebuildPagesCache()
+        serial = [(p.url, p.title, p.body, p.links) for p in self.wiki.index()]
+
+        parallel = mindMapper.wiki.Wiki(
+            self.rootdir, self.configPath, self.cachePath, jobs=2
+        )
+        with patch(
+            'mindMapper.wiki.ProcessPoolExecutor',
+            wraps=mindMapper.wiki.ProcessPoolExecutor
+        ) as executor:
+            parallel.rebuildPagesCache()
+        assert executor.call_args.kwargs['mp_context'].get_start_method() == 'spawn'
+        assert serial == [
+            (p.url, p.title, p.body, p.links) for p in parallel.index()
+        ]
+
+
+class MapLayoutTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the laying out of the maps.
+    """
+
+    config_content = CONFIGURATION + "LAYOUT_MAPS = true\n"
+
+    def positions(self, aTag='one'):
+        with open(os.path.join(self.rootdir, 'maps', aTag + '.json')) as fhd:
+            return {n['id']: (n['x'], n['y']) for n in json.load(fhd)['nodes'] if 'x' in n}
+
+    def test_map_layout(self):
+        """
+            Assert the maps are laid out once they have been written,
+            that graphs whose links have not changed keep their layout
+            and that changed graphs are laid out starting from their
+            previous layout.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\n[[page-c]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        report = self.wiki.rebuildPagesCache()
+        assert self.positions() == {}
+        assert self.wiki.unfinishedMaps(report) == ['one', 'theVortex']
+        self.wiki.finishMaps(report)
+        before = self.positions()
+        assert len(set(before.values())) == 3
+
+        self.create_file('page-c.md', u"title: New C\ntags: one\n\nC\n")
+        report = self.wiki.syncPagesCache()
+        assert self.wiki.unfinishedMaps(report) == []
+        assert self.positions() == before
+
+        self.create_file('page-d.md', u"title: D\ntags: one\n\n[[page-a]]\n")
+        report = self.wiki.syncPagesCache()
+        assert self.positions() == before
+        with patch('mindMapper.wiki.layoutGraph', wraps=mindMapper.wiki.layoutGraph) as layout:
+            self.wiki.finishMaps(report)
+        assert layout.call_args.args[2] == before
+        after = self.positions()
+        assert set(after) == {'/page-a', '/page-b', '/page-c', '/page-d'}
+        assert all(abs(after[n][0] - before[n][0]) < 30 for n in before)
+
+    def test_laid_out_maps_place_their_clusters(self):
+        """
+            Assert the clusters of laid out maps are placed amongst their
+            nodes rather than laid out on their own.
+        """
+        self.wiki.clusterMinNodes = 0
+        for group in 'ab':
+            for i in range(3):
+                links = ' '.join(f"[[{group}-{j}]]" for j in range(3) if j != i)
+                self.create_file(f'{group}-{i}.md', f"title: {group}{i}\ntags: one\n\n{links}\n")
+        self.create_file('a-0.md', u"title: a0\ntags: one\n\n[[a-1]] [[a-2]] [[b-0]]\n")
+        self.wiki.finishMaps(self.wiki.rebuildPagesCache())
+        with open(os.path.join(self.rootdir, 'maps', 'one.json')) as fhd:
+            graph = json.load(fhd)
+        assert not any('x' in c for c in graph['clusters'])
+        tree = ClusterTree(graph)
+        xs = [tree.nodes[f'/a-{i}']['x'] for i in range(3)]
+        assert tree.view(ROOT)['nodes'][0]['x'] == round(sum(xs) / 3, 1)
+
+    def test_large_maps_are_not_laid_out(self):
+        """
+            Assert maps with more than LAYOUT_MAX_NODES nodes are left
+            for the browser to lay out.
+        """
+        self.wiki.layoutMaxNodes = 2
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\n[[page-c]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        self.create_file('page-d.md', u"title: D\ntags: two\n\nD\n")
+        with patch('mindMapper.wiki.layoutGraph', wraps=mindMapper.wiki.layoutGraph) as layout:
+            self.wiki.finishMaps(self.wiki.rebuildPagesCache())
+        assert layout.call_count == 1
+        assert self.positions() == {}
+        assert set(self.positions('two')) == {'/page-d'}
+
+
+class SqliteStorageTestCase(WikiBaseTestCase):
+    """
+        Contains various tests for the SQLite pages store.
+    """
+    config_content = CONFIGURATION + "STORAGE = 'sqlite'\n"
+
+    def read_map(self, tag):
+        with open(os.path.join(self.rootdir, 'maps', tag + '.json')) as fhd:
+            return json.load(fhd)
+
+    def test_index_and_tags(self):
+        """
+            Assert the index and tag views are answered by the store.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('one/two/three.md', WIKILINK_PAGE_CONTENT)
+        self.create_file('invalid.md', PAGE_CONTENT_INVALID)
+        self.create_file('page-a.md', u"title: A\ntags: alpha\n\n[[test]]\n")
+        self.wiki.rebuildPagesCache()
+        assert os.path.exists(self.cachePath + '.sqlite')
+        assert not os.path.exists(self.cachePath)
+
+        assert [p.url for p in self.wiki.index()] == ['page-a', 'one/two/three', 'test']
+        assert sorted(self.wiki.get_tags()) == ['3', 'alpha', 'jö', 'one', 'two']
+        assert [p.url for p in self.wiki.index_by_tag('alpha')] == ['page-a']
+        assert self.wiki.index_by_tag('alph') == []
+        assert self.wiki.get_tag_counts()['alpha'] == 1
+        pageA = self.wiki.index()[0]
+        assert pageA.links == [{
+            'source': 'page-a', 'target': 'test', 'title': 'test', 'modifier': 'link'
+        }]
+        assert pageA.meta['title'] == 'A'
+        assert [(p.url, m) for p, m in self.wiki.get_backlinks('test')] == [('page-a', 'link')]
+
+        alphaMap = self.read_map('alpha')
+        assert ['/page-a', '/test'] == [n['id'] for n in alphaMap['nodes']]
+        assert [('/page-a', '/test')] == [
+            (l['source'], l['target']) for l in alphaMap['links']
+        ]
+
+    def test_incremental_update(self):
+        """
+            Assert updates are applied incrementally and only the
+            changed maps are rewritten.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\nB\n")
+        self.create_file('page-c.md', u"title: C\ntags: two\n\nC\n")
+        self.create_file('page-e.md', u"title: E\ntags: four\n\nE\n")
+        self.wiki.syncPagesCache()
+        fourMap = os.path.join(self.rootdir, 'maps', 'four.json')
+        os.remove(fourMap)
+
+        self.create_file('page-b.md', u"title: New B\ntags: one, three\n\nB\n")
+        self.create_file('page-d.md', u"title: D\ntags: three\n\n[[page-a]]\n")
+        os.remove(os.path.join(self.rootdir, 'page-c.md'))
+        with patch.object(self.wiki, 'loadPage', wraps=self.wiki.loadPage) as loadPage:
+            self.wiki.syncPagesCache()
+            assert sorted(c.args[0] for c in loadPage.call_args_list) == ['page-b', 'page-d']
+
+        assert [p.title for p in self.wiki.index()] == ['A', 'D', 'E', 'New B']
+        assert not os.path.exists(os.path.join(self.rootdir, 'maps', 'two.json'))
+        assert not os.path.exists(fourMap)
+        oneMap = self.read_map('one')
+        assert {'/page-a', '/page-b', '/page-d'} == set(n['id'] for n in oneMap['nodes'])
+        assert 'New B' in [n['title'] for n in oneMap['nodes']]
+        assert ['page-d', 'page-b'] == [p.url for p in self.wiki.get_tags()['three']]
+
+    def test_schema_is_set_up_once(self):
+        """
+            Assert the schema is only set up when the database has not
+            got one of the current version.
+        """
+        self.wiki.rebuildPagesCache()
+        path = self.wiki.databasePath
+        with patch.object(SqliteStore, 'prepare', autospec=True) as prepare:
+            SqliteStore(path, mindMapper.wiki.CACHE_VERSION).close()
+            assert prepare.call_count == 0
+            SqliteStore(path, 'another version').close()
+            assert prepare.call_count == 1
+
+    test_neighbourhood = WikiTestCase.test_neighbourhood
+    test_paths = WikiTestCase.test_paths
+    neighbourhood_pages = WikiTestCase.neighbourhood_pages
+
+    def test_failed_update_is_rolled_back(self):
+        """
+            Assert a failing update leaves the store unchanged.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\nA\n")
+        self.wiki.rebuildPagesCache()
+        self.create_file('page-b.md', u"title: B\ntags: one\n\nB\n")
+        with patch.object(self.wiki, 'loadPage', side_effect=RuntimeError):
+            with pytest.raises(RuntimeError):
+                self.wiki.updatePages(['page-b'])
+        assert [p.url for p in self.wiki.index()] == ['page-a']
+        assert 'page-b' not in self.wiki.database().manifest()
@@ -1,3 +1,11 @@
+import gzip
+import threading
+
+from mock import patch
+
+from mindMapper.sqliteStore import SqliteStore
+
+from utils import CONFIGURATION
 from utils import WikiBaseTestCase
 
 
@@ -25,6 +33,231 @@ class WebContentTestCase(WikiBaseTestCase):
         assert rsp.status_code == 200
 
 
+class SearchTestCase(WikiBaseTestCase):
+    """
+        Test cases around searching.
+    """
+
+    config_content = CONFIGURATION + u"SECRET_KEY = 'test'\n"
+
+    def test_search(self):
+        """
+            Assert searching lists the matching pages, and that regex
+            searches are only used when asked for.
+        """
+        self.create_file('page-a.md', u"title: Apples\ntags: fruit\n\nred apples\n")
+        self.wiki.rebuildPagesCache()
+        rsp = self.app.get('/search/?q=apples')
+        assert rsp.status_code == 200
+        assert b"1 matching page" in rsp.data
+        assert b"/page-a/" in rsp.data
+        rsp = self.app.get('/search/?q=app.es')
+        assert b"No results for your search." in rsp.data
+        rsp = self.app.get('/search/?q=app.es&regex=y')
+        assert b"/page-a/" in rsp.data
+
+
+class BacklinksTestCase(WikiBaseTestCase):
+    """
+        Test cases around the backlinks of a page.
+    """
+
+    def test_backlinks(self):
+        """
+            Assert the pages linking to a page are listed, both as
+            html and as JSON.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-c]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\n[[page-c]] [[page-a]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        self.wiki.rebuildPagesCache()
+        rsp = self.app.get('/backlinks/page-c/')
+        assert rsp.status_code == 200
+        assert b"/page-a/" in rsp.data and b"/page-b/" in rsp.data
+        rsp = self.app.get('/backlinks/page-c/?format=json')
+        assert [link['source'] for link in rsp.json['backlinks']] == ['page-a', 'page-b']
+        rsp = self.app.get('/backlinks/page-b/?format=json')
+        assert rsp.json['backlinks'] == []
+
+
+class MapTestCase(WikiBaseTestCase):
+    """
+        Test cases around serving the concept maps.
+    """
+
+    def test_map_conditional_get(self):
+        """
+            Assert maps are served with validators, that unchanged maps
+            are not sent again and that they are gzipped when asked for.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\nB\n")
+        self.create_file('maps/one.md', u"title: one\ntags: maps\n\nmap\n")
+        self.wiki.finishMaps(self.wiki.rebuildPagesCache())
+        rsp = self.app.get('/maps/one/')
+        assert b"/map/maps/one.json" in rsp.data
+
+        rsp = self.app.get('/map/maps/one.json')
+        assert rsp.status_code == 200
+        assert rsp.headers['Last-Modified']
+        etag = rsp.headers['ETag']
+        assert len(rsp.json['nodes']) == 2
+
+        rsp = self.app.get('/map/maps/one.json', headers={'If-None-Match': etag})
+        assert rsp.status_code == 304
+        assert rsp.data == b""
+
+        rsp = self.app.get('/map/maps/one.json', headers={'Accept-Encoding': 'gzip'})
+        assert rsp.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(rsp.data) == self.app.get('/map/maps/one.json').data
+
+        self.create_file('page-c.md', u"title: C\ntags: one\n\n[[page-a]]\n")
+        self.wiki.rebuildPagesCache()
+        rsp = self.app.get('/map/maps/one.json', headers={'If-None-Match': etag})
+        assert rsp.status_code == 200
+        assert len(rsp.json['nodes']) == 3
+
+        assert self.app.get('/map/maps/missing.json').status_code == 404
+        assert self.app.get('/map/../secret.json').status_code == 404
+
+    def test_only_maps_are_served(self):
+        """
+            Assert only concept maps are served, never the users file
+            nor any other JSON in the wiki directory.
+        """
+        self.create_file('users.json', u'{"bob": {"password": "hunter2"}}')
+        self.create_file('data.json', u'{"nodes": [], "links": []}')
+        self.create_file('page-a.md', u"title: A\ntags: one\n\nA\n")
+        self.create_file('page-a.json', u'{"nodes": [], "links": []}')
+        assert self.app.get('/map/users.json').status_code == 404
+        assert self.app.get('/map/data.json').status_code == 404
+        assert self.app.get('/map/page-a.json').status_code == 200
+
+        self.create_file('users.md', u"title: Users\ntags: one\n\nUsers\n")
+        assert self.app.get('/map/users.json').status_code == 404
+
+    def test_cluster_views_of_other_json(self):
+        """
+            Assert asking for the clusters of a JSON file which is not a
+            map of nodes and links is not found, rather than an error.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\nA\n")
+        self.create_file('page-a.json', u'{"bob": {"password": "hunter2"}}')
+        self.create_file('page-b.md', u"title: B\ntags: one\n\nB\n")
+        self.create_file('page-b.json', u'not json')
+        assert self.app.get('/map/page-a.json?cluster=root').status_code == 404
+        assert self.app.get('/map/page-b.json?cluster=root').status_code == 404
+        assert self.app.get('/map/page-a.json').status_code == 200
+
+
+class ClusteredMapTestCase(WikiBaseTestCase):
+    """
+        Test cases around serving the clusters of large maps.
+    """
+
+    config_content = CONFIGURATION + u"CLUSTER_MIN_NODES = 0\nLAYOUT_MAPS = true\n"
+
+    def test_cluster_views(self):
+        """
+            Assert the top level of a map's clusters, and the contents
+            of a cluster, can be fetched on their own.
+        """
+        for group in 'ab':
+            for i in range(4):
+                links = ' '.join(f"[[{group}-{j}]]" for j in range(4) if j != i)
+                self.create_file(f'{group}-{i}.md', f"title: {group}{i}\ntags: one\n\n{links}\n")
+        self.create_file('a-0.md', u"title: a0\ntags: one\n\n[[a-1]] [[a-2]] [[a-3]] [[b-0]]\n")
+        self.create_file('maps/one.md', u"title: one\ntags: maps\n\nmap\n")
+        self.wiki.finishMaps(self.wiki.rebuildPagesCache())
+
+        rsp = self.app.get('/map/maps/one.json?cluster=root')
+        assert rsp.status_code == 200
+        clusters = rsp.json['nodes']
+        assert [c['size'] for c in clusters] == [4, 4]
+        etag = rsp.headers['ETag']
+        rsp = self.app.get('/map/maps/one.json?cluster=root', headers={'If-None-Match': etag})
+        assert rsp.status_code == 304
+
+        rsp = self.app.get('/map/maps/one.json?cluster=' + clusters[0]['cluster'])
+        assert rsp.headers['ETag'] != etag
+        assert len(rsp.json['nodes']) == 4
+        assert 'x' in rsp.json['nodes'][0]
+        assert len(rsp.json['external']) == 1
+        assert self.app.get('/map/maps/one.json?cluster=nope').status_code == 404
+
+
+class GraphTestCase(WikiBaseTestCase):
+    """
+        Test cases around the neighbourhood of a page.
+    """
+
+    def test_graph(self):
+        """
+            Assert the neighbourhood of a page is served as JSON, and
+            shown around the page.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]] [[page-c|C{is-a}]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\n[[page-d]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        self.create_file('page-d.md', u"title: D\ntags: one\n\nD\n")
+        self.wiki.rebuildPagesCache()
+        rsp = self.app.get('/graph/page-a/?format=json')
+        assert [n['id'] for n in rsp.json['nodes']] == ['/page-a', '/page-b', '/page-c']
+        rsp = self.app.get('/graph/page-a/?format=json&hops=2&modifiers=link')
+        assert [n['id'] for n in rsp.json['nodes']] == ['/page-a', '/page-b', '/page-d']
+        assert self.app.get('/graph/missing/?format=json').status_code == 404
+        rsp = self.app.get('/graph/page-a/?hops=2&modifiers=link')
+        assert rsp.status_code == 200
+        assert b"/graph/page-a/?hops=2&amp;modifiers=link&amp;format=json" in rsp.data
+
+
+class PathTestCase(WikiBaseTestCase):
+    """
+        Test cases around the paths between pages.
+    """
+
+    def test_path(self):
+        """
+            Assert the paths between two pages are served as JSON, and
+            shown with a form to find others.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\n[[page-c]]\n")
+        self.create_file('page-c.md', u"title: C\ntags: one\n\nC\n")
+        self.wiki.rebuildPagesCache()
+        rsp = self.app.get('/path/?from=page-c&to=page-a&format=json')
+        assert rsp.json['paths'] == [['/page-c', '/page-b', '/page-a']]
+        assert len(rsp.json['links']) == 2
+        rsp = self.app.get('/path/?from=page-c&to=page-a&directed=1&format=json')
+        assert rsp.json['paths'] == []
+        assert self.app.get('/path/?from=page-c&to=missing&format=json').status_code == 404
+        rsp = self.app.get('/path/?from=page-a&to=page-c&count=2')
+        assert rsp.status_code == 200
+        assert b"/path/?to=page-c&amp;count=2&amp;format=json&amp;from=page-a" in rsp.data
+        assert self.app.get('/path/').status_code == 200
+
+
+class SqliteStorageTestCase(WikiBaseTestCase):
+    """
+        Test cases around serving pages from the SQLite store.
+    """
+
+    config_content = CONFIGURATION + "STORAGE = 'sqlite'\n"
+
+    def test_store_is_closed_after_requests(self):
+        """
+            Assert every request closes the store it opened.
+        """
+        self.create_file('page-a.md', u"title: A\ntags: one\n\nA\n")
+        self.wiki.rebuildPagesCache()
+        with patch.object(SqliteStore, 'close', autospec=True) as close:
+            rsp = self.app.get('/index/')
+            assert b"page-a" in rsp.data
+            assert close.call_count == 1
+            self.app.get('/tag/one/')
+            assert close.call_count == 2
+
+
 class AuthenticationTestCase(WikiBaseTestCase):
     """
         Test cases around authentication.
@@ -40,3 +273,74 @@ class AuthenticationTestCase(WikiBaseTestCase):
         rsp = self.app.get('/')
         assert rsp.status_code == 302
         assert rsp.headers['Location'] == "/user/login/?next=%2F"
+
+
+class RebuildTestCase(WikiBaseTestCase):
+    """
+        Test cases around the background rebuild scheduler.
+    """
+
+    def test_rebuilds_are_coalesced(self):
+        """
+            Assert requests made while a rebuild is running are
+            coalesced into a single pending job.
+        """
+        app = self.app.application
+        rebuilder = app.extensions['mindMapper.rebuilder']
+        started = threading.Event()
+        release = threading.Event()
+        runs = []
+
+        def run(urls, rescan, full):
+            runs.append((urls, rescan, full))
+            started.set()
+            release.wait(5)
+
+        rebuilder.run = run
+        first = rebuilder.submit(['page-a'])
+        assert started.wait(5)
+        second = rebuilder.submit(['page-b'])
+        third = rebuilder.submit(['page-c'], full=True)
+        assert first == 1 and second == third == 2
+        assert rebuilder.status()['state'] == 'running'
+
+        release.set()
+        assert rebuilder.wait(third, timeout=5)
+        assert runs == [({'page-a'}, False, False), ({'page-b', 'page-c'}, False, True)]
+        rsp = self.app.get('/rebuild/status')
+        assert rsp.json['state'] == 'idle'
+        assert rsp.json['completed'] == 2
+
+    def test_rebuild_updates_index(self):
+        """
+            Assert a submitted rebuild brings the pages index up to date.
+        """
+        app = self.app.application
+        rebuilder = app.extensions['mindMapper.rebuilder']
+        self.create_file('page-a.md', u"title: A\ntags: one\n\nA\n")
+        assert rebuilder.wait(rebuilder.submit(['page-a']), timeout=5)
+        rsp = self.app.get('/index/')
+        assert b"page-a" in rsp.data
+
+    def test_maps_are_finished_after_rebuilds(self):
+        """
+            Assert the maps written by a rebuild are finished once it
+            has completed.
+        """
+        app = self.app.application
+        rebuilder = app.extensions['mindMapper.rebuilder']
+        finished = threading.Event()
+        tags = []
+
+        def finish(tag):
+            tags.append(tag)
+            if len(tags) == 2:
+                finished.set()
+
+        rebuilder.finish = finish
+        self.create_file('page-a.md', u"title: A\ntags: one\n\n[[page-b]]\n")
+        self.create_file('page-b.md', u"title: B\ntags: one\n\nB\n")
+        assert rebuilder.wait(rebuilder.submit(['page-a', 'page-b']), timeout=5)
+        assert finished.wait(5)
+        assert tags == ['one', 'theVortex']
+        assert rebuilder.status()['unfinishedMaps'] == 0